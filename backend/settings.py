@@ -27,6 +27,9 @@ DEBUG = True
 
 ALLOWED_HOSTS = ['*']
 import os
+import tempfile
+
+import django
 
 # Application definition
 
@@ -54,6 +57,8 @@ REST_FRAMEWORK = {
     ),
 }
 MIDDLEWARE = [
+    'main.metrics.MetricsMiddleware',
+    'main.compression.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -87,12 +92,50 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# SQLite by default. Set DB_ENGINE=postgresql (plus DB_NAME, DB_USER,
+# DB_PASSWORD, DB_HOST, DB_PORT) in production; DB_POOL=1 switches from
+# persistent connections to a psycopg 3 pool (Django 5.1+).
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+SQLITE_BUSY_TIMEOUT_SECONDS = 20
+SQLITE_SYNCHRONOUS = 'NORMAL'  # durable with WAL except for the last commits on power loss
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'backend'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {'connect_timeout': 10},
+        }
     }
-}
+    if os.environ.get('DB_POOL'):
+        DATABASES['default']['CONN_MAX_AGE'] = 0  # the pool replaces persistent connections
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+            'timeout': 10,
+        }
+else:
+    # WAL, busy_timeout and synchronous are set on every new connection
+    # (main/signals.py) so concurrent writers queue instead of failing with
+    # "database is locked". Tests use a file too: an in-memory database
+    # locks differently and would hide contention.
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {'timeout': SQLITE_BUSY_TIMEOUT_SECONDS},
+            'TEST': {'NAME': os.path.join(tempfile.gettempdir(), 'backend-test.sqlite3')},
+        }
+    }
+    if django.VERSION >= (5, 1):
+        # Take the write lock at BEGIN so a transaction never has to upgrade a read lock
+        DATABASES['default']['OPTIONS']['transaction_mode'] = 'IMMEDIATE'
 
 
 # Password validation
@@ -135,3 +178,84 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Grading model: a Hugging Face name or a local directory, loaded on first use
+GRADING_MODEL_NAME = os.environ.get('GRADING_MODEL_NAME', 'sentence-transformers/stsb-roberta-large')
+# 'torch' (fp32), 'int8' (dynamic quantization) or 'onnx'; compare them with `manage.py compare_backends`
+GRADING_INFERENCE_BACKEND = os.environ.get('GRADING_INFERENCE_BACKEND', 'torch')
+
+# Optional shared embedding server (`manage.py embedding_server`). When set,
+# workers send encode requests to this Unix socket instead of loading the
+# model themselves, and fall back to in-process encoding if it is down.
+EMBEDDING_SERVER_SOCKET = os.environ.get('EMBEDDING_SERVER_SOCKET', '')
+EMBEDDING_SERVER_TIMEOUT = 120
+EMBEDDING_SERVER_RETRY_SECONDS = 30
+
+# Grading queue (see main/grading_queue.py and `manage.py grade_worker`)
+GRADING_MAX_ATTEMPTS = 5
+GRADING_RETRY_BASE_SECONDS = 30
+GRADING_RETRY_MAX_SECONDS = 3600
+GRADING_JOB_TIMEOUT_SECONDS = 600
+
+# Encode requests are batched for up to GRADING_BATCH_WINDOW_MS or until
+# GRADING_BATCH_MAX_SIZE texts are waiting (see main/batching.py)
+GRADING_BATCH_MAX_SIZE = 16
+GRADING_BATCH_WINDOW_MS = 20
+
+# Cross-assignment similarity index (see main/similarity_index.py)
+SIMILARITY_INDEX_DIR = BASE_DIR / 'similarity_index'
+SIMILARITY_INDEX_IVF_MIN_SIZE = 1024
+SIMILARITY_INDEX_EXACT_SCAN_SIZE = 5000
+SIMILARITY_INDEX_NPROBE = 8
+
+# Long documents are encoded as overlapping token windows pooled into one vector
+GRADING_CHUNK_OVERLAP_TOKENS = 16
+GRADING_CHUNK_BATCH_SIZE = 16
+GRADING_CHUNK_POOLING = 'mean'  # or 'max'
+
+# Extraction caps: uploads beyond them are graded on the first part and the
+# feedback says so. The timeout is checked between pages/paragraphs. PDF and
+# DOCX files over GRADING_EXTRACT_MAX_BYTES are not parsed at all.
+GRADING_EXTRACT_SAMPLE_BYTES = 64 * 1024  # used for TXT encoding detection
+GRADING_EXTRACT_MAX_BYTES = 20 * 1024 * 1024
+GRADING_EXTRACT_MAX_PAGES = 300
+GRADING_EXTRACT_MAX_CHARS = 2_000_000
+GRADING_EXTRACT_TIMEOUT_SECONDS = 60
+
+# Extracted text cache (see main/text_cache.py)
+TEXT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+TEXT_CACHE_TOUCH_SECONDS = 300
+TEXT_CACHE_EVICT_CHECK_PUTS = 100
+
+# `manage.py regrade` progress, so an interrupted run can resume
+REGRADE_CHECKPOINT_DIR = BASE_DIR / 'regrade_checkpoints'
+
+# Keyword matching also accepts plurals ("decisions" for "decision")
+GRADING_KEYWORD_STEMMING = False
+
+# Prometheus scrape endpoint /api/metrics (see main/metrics.py). Scrapers
+# authenticate with "Authorization: Bearer <METRICS_TOKEN>"; grade_worker
+# processes publish their counters to METRICS_DIR every
+# METRICS_PUBLISH_SECONDS and snapshots older than METRICS_STALE_SECONDS are
+# left out.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_DIR = BASE_DIR / 'metrics'
+METRICS_PUBLISH_SECONDS = 15
+METRICS_STALE_SECONDS = 300
+
+# Lexical copy detection (see main/fingerprint.py). Above the size limit the
+# semantic plagiarism check only compares submissions sharing an LSH bucket.
+PLAGIARISM_COPY_THRESHOLD = 0.90
+PLAGIARISM_LSH_MIN_SUBMISSIONS = 500
+
+# Classroom roles cache (see main/permissions.py). Only used with a shared
+# CACHES backend; without one roles are looked up once per request.
+CLASSROOM_ROLES_CACHE_SECONDS = 60
+
+# Faculty course sync (see main/course_sync.py)
+COURSE_SYNC_URL = os.environ.get('COURSE_SYNC_URL', 'https://bgnuerp.online/api/get_faculty_courses')
+COURSE_SYNC_CONNECT_TIMEOUT = 5
+COURSE_SYNC_READ_TIMEOUT = 60
+COURSE_SYNC_RETRIES = 3
+COURSE_SYNC_BATCH_SIZE = 500
@@ -0,0 +1,191 @@
+"""End-to-end grading benchmark on a synthetic corpus.
+
+Generates one assignment's worth of PDF/DOCX/TXT submissions of a given
+length and similarity to the teacher's reference, then drives them through
+the real grading path, one upload at a time as ``grade_submission`` does:
+
+    extract_text -> embed_document -> evaluate_submission -> check_plagiarism
+
+and prints p50/p95 latency per stage, throughput and peak RSS as JSON. The
+extracted-text cache lives in a throwaway test database, so every run
+measures cold extraction. Run from the repository root:
+
+    python benchmarks/bench_grading.py
+    python benchmarks/bench_grading.py --sizes 30 300 --words 1500 --output grading.json
+
+GRADING_MODEL_NAME selects the model as usual.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+from main.grading import embed_document, evaluate_submission, extract_text  # noqa: E402
+from main.plagiarism import check_plagiarism  # noqa: E402
+
+FORMATS = ('pdf', 'docx', 'txt')
+STAGES = ('extract', 'embed', 'evaluate', 'plagiarism', 'total')
+KEYWORDS = ["AI", "making decisions", "recognizing patterns"]
+VOCABULARY = (
+    "model data learning system network pattern decision student method result analysis training "
+    "example feature value process problem approach information structure function algorithm "
+    "computer knowledge human task performance machine question answer research theory practice"
+).split()
+
+
+def make_sentence(rng):
+    words = rng.choices(VOCABULARY, k=rng.randint(8, 16))
+    return " ".join(words).capitalize() + "."
+
+
+def make_reference(rng, words):
+    sentences = []
+    while sum(len(s.split()) for s in sentences) < words:
+        sentences.append(make_sentence(rng))
+    sentences[0] = "AI is about making decisions and recognizing patterns in data."
+    return sentences
+
+
+def make_submission(rng, reference, similarity, source=None):
+    """Each reference sentence is kept with probability ``similarity`` and
+    otherwise replaced; ``source`` makes the submission a near-copy of
+    another student's sentences instead."""
+    base = source or reference
+    return [s if rng.random() < similarity else make_sentence(rng) for s in base]
+
+
+def write_document(path, fmt, sentences):
+    text = " ".join(sentences)
+    if fmt == 'txt':
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+    elif fmt == 'docx':
+        import docx
+
+        document = docx.Document()
+        for start in range(0, len(sentences), 5):
+            document.add_paragraph(" ".join(sentences[start:start + 5]))
+        document.save(path)
+    else:
+        import fitz
+
+        document = fitz.open()
+        words = text.split()
+        for start in range(0, len(words), 350):
+            page = document.new_page()
+            page.insert_textbox(fitz.Rect(50, 50, 545, 792), " ".join(words[start:start + 350]), fontsize=10)
+        document.save(path)
+        document.close()
+
+
+def generate_corpus(directory, n, words, similarity, copy_rate, rng):
+    reference = make_reference(rng, words)
+    submissions = []
+    for i in range(n):
+        fmt = FORMATS[i % len(FORMATS)]
+        source = submissions[-1][1] if submissions and rng.random() < copy_rate else None
+        sentences = make_submission(rng, reference, 0.95 if source else similarity, source)
+        path = os.path.join(directory, f"submission{i}.{fmt}")
+        write_document(path, fmt, sentences)
+        submissions.append((path, sentences))
+    return " ".join(reference), [path for path, _ in submissions]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run(n, args, rng):
+    with tempfile.TemporaryDirectory() as directory:
+        reference_text, paths = generate_corpus(directory, n, args.words, args.similarity, args.copy_rate, rng)
+        reference = embed_document(reference_text)
+
+        timings = {stage: [] for stage in STAGES}
+        embeddings, names = {}, {}
+        flagged = set()
+        started = time.perf_counter()
+        for i, path in enumerate(paths):
+            t0 = time.perf_counter()
+            text = extract_text(path)
+            t1 = time.perf_counter()
+            embedding = embed_document(text)
+            t2 = time.perf_counter()
+            evaluate_submission(text, reference, 10, KEYWORDS, 100, student_embedding=embedding)
+            t3 = time.perf_counter()
+            embeddings[i], names[i] = embedding, f"student{i}"
+            flagged.update((a, b) for a, b, _ in check_plagiarism(embeddings, names, target_id=i))
+            t4 = time.perf_counter()
+            for stage, seconds in zip(STAGES, (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t4 - t0)):
+                timings[stage].append(seconds * 1000)
+        elapsed = time.perf_counter() - started
+
+    return {
+        'submissions': n,
+        'stages': {
+            stage: {'p50_ms': round(statistics.median(v), 2), 'p95_ms': round(percentile(v, 0.95), 2)}
+            for stage, v in timings.items()
+        },
+        'seconds': round(elapsed, 2),
+        'submissions_per_second': round(n / elapsed, 2),
+        'flagged_pairs': len(flagged),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[30, 300], help='Submissions per assignment')
+    parser.add_argument('--words', type=int, default=800, help='Approximate words per submission')
+    parser.add_argument('--similarity', type=float, default=0.5,
+                        help='Share of reference sentences each submission keeps')
+    parser.add_argument('--copy-rate', type=float, default=0.05,
+                        help='Share of submissions that near-copy the previous one')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    # Keep the extracted-text cache out of the real database
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        embed_document("warm up")  # model load is not part of any stage
+        rng = random.Random(args.seed)
+        report = {
+            'model': django.conf.settings.GRADING_MODEL_NAME,
+            'backend': django.conf.settings.GRADING_INFERENCE_BACKEND,
+            'words': args.words,
+            'similarity': args.similarity,
+            'runs': [run(n, args, rng) for n in args.sizes],
+        }
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+
+
+if __name__ == '__main__':
+    main()
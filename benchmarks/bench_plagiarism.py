@@ -0,0 +1,76 @@
+"""Benchmark the plagiarism check at 50/500/5000 submissions.
+
+Compares the original pairwise ``util.cos_sim`` loop (only where it finishes
+in reasonable time) with the vectorized check for a single new upload and a
+full-matrix audit. Run from the repository root:
+
+    python benchmarks/bench_plagiarism.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main.plagiarism import check_plagiarism  # noqa: E402
+
+try:
+    from sentence_transformers import util
+except ImportError:
+    util = None
+
+DIMENSIONS = 1024  # stsb-roberta-large
+SIZES = (50, 500, 5000)
+LEGACY_MAX = 500
+
+
+def make_embeddings(n, rng):
+    base = rng.standard_normal((n, DIMENSIONS)).astype(np.float32)
+    # A few near-copies so the threshold path is exercised
+    for i in range(0, n - 1, 25):
+        base[i + 1] = base[i] + 0.1 * rng.standard_normal(DIMENSIONS).astype(np.float32)
+    return {i: base[i] for i in range(n)}
+
+
+def legacy_check(student_embeddings, names):
+    results = []
+    keys = list(student_embeddings.keys())
+    for i, a in enumerate(keys):
+        for b in keys[i + 1:]:
+            sim = util.cos_sim(student_embeddings[a], student_embeddings[b]).item()
+            if sim > 0.80:
+                results.append((names.get(a, "Unknown"), names.get(b, "Unknown"), round(sim * 100, 2)))
+    return results
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{'N':>6} {'legacy loop ms':>15} {'new upload ms':>14} {'full audit ms':>14} {'pairs':>6}")
+    for n in SIZES:
+        embeddings = make_embeddings(n, rng)
+        names = {i: f"student{i}" for i in embeddings}
+        target = n - 1
+
+        _, upload_ms = timed(check_plagiarism, embeddings, names, target_id=target)
+        audit, audit_ms = timed(check_plagiarism, embeddings, names)
+
+        legacy_ms = "skipped"
+        if util is None:
+            legacy_ms = "no torch"
+        elif n <= LEGACY_MAX:
+            legacy, ms = timed(legacy_check, embeddings, names)
+            legacy_ms = f"{ms:.1f}"
+            assert [r[:2] for r in legacy] == [r[:2] for r in audit], "results differ from the legacy loop"
+        print(f"{n:>6} {legacy_ms:>15} {upload_ms:>14.2f} {audit_ms:>14.1f} {len(audit):>6}")
+
+
+if __name__ == '__main__':
+    main()
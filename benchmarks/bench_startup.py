@@ -0,0 +1,59 @@
+"""Measure how long ``manage.py check`` takes to start and which heavy
+grading dependencies it imports.
+
+``--eager`` imports sentence_transformers, fitz and docx up front, which is
+what every process paid before the grading model was loaded lazily (the
+~1.3 GB model load itself comes on top of that). Run from the repository root:
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --eager
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ('torch', 'sentence_transformers', 'transformers', 'fitz', 'docx')
+
+SCRIPT = """
+import os, sys
+sys.argv = ['manage.py', 'check']
+if {eager}:
+    import sentence_transformers, fitz, docx
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+from django.core.management import execute_from_command_line
+execute_from_command_line(sys.argv)
+print('HEAVY=' + ','.join(m for m in {heavy} if m in sys.modules))
+"""
+
+
+def run_once(eager):
+    code = SCRIPT.format(eager=eager, heavy=HEAVY)
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    elapsed = time.perf_counter() - started
+    heavy = [line for line in result.stdout.splitlines() if line.startswith('HEAVY=')][0][6:]
+    return elapsed, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--eager', action='store_true', help='Import the grading stack up front')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    run_once(args.eager)  # warm the filesystem cache
+    timings = []
+    for _ in range(args.runs):
+        elapsed, heavy = run_once(args.eager)
+        timings.append(elapsed)
+    print(f"manage.py check ({'eager' if args.eager else 'lazy'}): "
+          f"median {statistics.median(timings) * 1000:.0f} ms over {args.runs} runs, "
+          f"heavy modules imported: {heavy or 'none'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@ from django.contrib import admin, messages
 from django.urls import path
 from django.shortcuts import redirect
 import requests
+from .course_sync import describe, sync_courses
 from .models import FacultyCourse
 
 class FacultyCourseAdmin(admin.ModelAdmin):
@@ -25,27 +26,9 @@ class FacultyCourseAdmin(admin.ModelAdmin):
 
     def fetch_courses_view(self, request):
         try:
-            response = requests.get("https://bgnuerp.online/api/get_faculty_courses")
-            if response.status_code == 200:
-                data = response.json()
-                count = 0
-                for item in data:
-                   obj, created = FacultyCourse.objects.update_or_create(
-                    offer_id=item['offer_id'],  # use this to prevent duplicates
-                        defaults={
-                                'course_code': item['course_code'],
-                                'course_title': item['course_title'],
-                                'program_name': item['program_name'],
-                                'shift_name': item['shift_name'],
-                                'enc_offer_id': item['enc_offer_id'],
-                            }
-                        )
-                if created:
-                        count += 1
-                self.message_user(request, f"✅ {count} new courses fetched and stored.")
-            else:
-                self.message_user(request, "❌ API response error.", level=messages.ERROR)
-        except Exception as e:
+            report = sync_courses()
+            self.message_user(request, f"✅ {describe(report)}")
+        except (requests.RequestException, OSError, ValueError) as e:
             self.message_user(request, f"❌ Error: {e}", level=messages.ERROR)
 
         return redirect('admin:main_facultycourse_changelist')
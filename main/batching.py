@@ -0,0 +1,112 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class _Request:
+    __slots__ = ('text', 'enqueued_at', 'done', 'result', 'error')
+
+    def __init__(self, text):
+        self.text = text
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BatchingEncoder:
+    """Collects single-text encode calls from many threads into one batched
+    forward pass.
+
+    A batch is flushed when it reaches ``max_batch_size`` texts or when the
+    oldest request has waited ``window_ms``. ``encode_batch`` receives a list
+    of texts and must return one vector per text, in order."""
+
+    def __init__(self, encode_batch, max_batch_size=16, window_ms=20):
+        self.encode_batch = encode_batch
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def encode(self, text):
+        return self.encode_many([text])[0]
+
+    def encode_many(self, texts):
+        """Queue several texts at once (e.g. the chunks of one document); they
+        may be split across batches or share them with other callers."""
+        self._ensure_started()
+        requests = [_Request(text) for text in texts]
+        for request in requests:
+            self._queue.put(request)
+        for request in requests:
+            request.done.wait()
+            if request.error is not None:
+                raise request.error
+        return np.stack([request.result for request in requests])
+
+    def stats(self):
+        with self._stats_lock:
+            batches, items = self._batches, self._items
+            return {
+                'batches': batches,
+                'items': items,
+                'max_batch_size': self.max_batch_size,
+                'window_ms': self.window * 1000,
+                'batch_fill_ratio': items / (batches * self.max_batch_size) if batches else 0.0,
+                'avg_queue_wait_ms': self._wait_total / items * 1000 if items else 0.0,
+                'max_queue_wait_ms': self._wait_max * 1000,
+            }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='batching-encoder', daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = batch[0].enqueued_at + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            try:
+                vectors = np.asarray(self.encode_batch([r.text for r in batch]), dtype=np.float32)
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+                    request.done.set()
+                continue
+
+            with self._stats_lock:
+                self._batches += 1
+                self._items += len(batch)
+                for request in batch:
+                    waited = started - request.enqueued_at
+                    self._wait_total += waited
+                    self._wait_max = max(self._wait_max, waited)
+
+            for request, vector in zip(batch, vectors):
+                request.result = vector
+                request.done.set()
@@ -0,0 +1,187 @@
+import codecs
+import json
+import time
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .metrics import observe
+from .models import CourseFeedState, FacultyCourse
+
+# Faculty course sync, shared by `manage.py fetch_courses` and the admin
+# "Fetch Courses from API" button. The feed (a JSON array of courses) is read
+# as a stream and decoded one course at a time, diffed against all existing
+# rows loaded in one query, and applied with bulk_create/bulk_update in one
+# transaction. Requests go through one pooled session with timeouts and
+# retries, and are conditional on the ETag/Last-Modified of the last sync, so
+# an unchanged feed costs a 304 and one query. Those validators are stored in
+# CourseFeedState in the same transaction as the courses, so they can never
+# claim a sync the database does not hold. Courses missing from the feed are
+# kept: classrooms may still point at them.
+
+FIELDS = ('course_code', 'course_title', 'program_name', 'shift_name', 'enc_offer_id')
+
+_session = None
+
+
+def get_session():
+    """Process-wide requests session: keeps connections alive between syncs
+    and retries idempotent requests on connection errors and 429/5xx."""
+    global _session
+    if _session is None:
+        retry = Retry(
+            total=settings.COURSE_SYNC_RETRIES, backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504), allowed_methods=('GET', 'HEAD'),
+        )
+        session = requests.Session()
+        adapter = HTTPAdapter(max_retries=retry, pool_maxsize=4)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _session = session
+    return _session
+
+
+def iter_json_array(chunks):
+    """Yield the items of a top-level JSON array from byte chunks, without
+    holding the whole document in memory."""
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer, started = '', False
+    for chunk in chunks:
+        buffer += text.decode(chunk)
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos == len(buffer):
+                break
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError("Course feed is not a JSON array.")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                break  # item continues in the next chunk
+            if end == len(buffer) and not isinstance(item, (dict, list, str)):
+                break  # a number may continue in the next chunk
+            yield item
+            pos = end
+        buffer = buffer[pos:]
+    raise ValueError("Course feed ended before the closing ']'.")
+
+
+def _course_values(item):
+    # Feed ids may be numbers and values null; the columns are text
+    if item['offer_id'] in (None, ''):
+        raise KeyError('offer_id')
+    return str(item['offer_id']), {field: '' if item[field] is None else str(item[field]) for field in FIELDS}
+
+
+def diff_courses(items):
+    """Compare feed items with the stored courses (loaded in one query).
+    Returns ``(new courses, changed courses, counts)``; a course listed twice
+    in the feed takes its last values and is counted once."""
+    existing = {course.offer_id: course for course in FacultyCourse.objects.all()}
+    created, updated, seen = {}, {}, set()
+    skipped = 0
+    for item in items:
+        try:
+            offer_id, values = _course_values(item)
+        except (KeyError, TypeError):
+            skipped += 1
+            continue
+        seen.add(offer_id)
+        course = created.get(offer_id) or existing.get(offer_id)
+        if course is None:
+            created[offer_id] = FacultyCourse(offer_id=offer_id, **values)
+        elif any(getattr(course, field) != value for field, value in values.items()):
+            for field, value in values.items():
+                setattr(course, field, value)
+            if offer_id not in created:
+                updated[offer_id] = course
+    counts = {
+        'created': len(created),
+        'updated': len(updated),
+        'unchanged': len(seen) - len(created) - len(updated),
+        'skipped': skipped,
+    }
+    return list(created.values()), list(updated.values()), counts
+
+
+def save_courses(created, updated, feed_state=None):
+    """Apply a diff; ``feed_state`` (a CourseFeedState) is upserted in the
+    same transaction."""
+    batch_size = settings.COURSE_SYNC_BATCH_SIZE
+    with transaction.atomic():
+        FacultyCourse.objects.bulk_create(created, batch_size=batch_size)
+        FacultyCourse.objects.bulk_update(updated, FIELDS, batch_size=batch_size)
+        if feed_state is not None:
+            CourseFeedState.objects.bulk_create(
+                [feed_state], update_conflicts=True, unique_fields=['url'],
+                update_fields=['etag', 'last_modified', 'synced_at'],
+            )
+
+
+def sync_courses(url=None, force=False, session=None):
+    """Fetch the course feed and bring FacultyCourse up to date.
+
+    Returns ``{'created', 'updated', 'unchanged', 'skipped', 'not_modified',
+    'fetch_seconds', 'save_seconds', 'seconds'}``. Raises requests
+    exceptions and ValueError on network, HTTP and feed errors."""
+    url = url or settings.COURSE_SYNC_URL
+    session = session or get_session()
+    state = None if force else CourseFeedState.objects.filter(url=url).first()
+    headers = {}
+    if state is not None and state.etag:
+        headers['If-None-Match'] = state.etag
+    if state is not None and state.last_modified:
+        headers['If-Modified-Since'] = state.last_modified
+
+    started = time.perf_counter()
+    timeout = (settings.COURSE_SYNC_CONNECT_TIMEOUT, settings.COURSE_SYNC_READ_TIMEOUT)
+    report = {'created': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0, 'not_modified': False}
+    with session.get(url, headers=headers, timeout=timeout, stream=True) as response:
+        if response.status_code == 304:
+            report['not_modified'] = True
+            fetched = time.perf_counter()
+        else:
+            response.raise_for_status()
+            # Courses are decoded and diffed as they arrive
+            items = iter_json_array(response.iter_content(chunk_size=64 * 1024))
+            created, updated, counts = diff_courses(items)
+            fetched = time.perf_counter()
+            save_courses(created, updated, CourseFeedState(
+                url=url,
+                etag=response.headers.get('ETag', ''),
+                last_modified=response.headers.get('Last-Modified', ''),
+            ))
+            report.update(counts)
+    finished = time.perf_counter()
+
+    report['fetch_seconds'] = round(fetched - started, 3)
+    report['save_seconds'] = round(finished - fetched, 3)
+    report['seconds'] = round(finished - started, 3)
+    observe('course_sync_seconds', fetched - started, stage='fetch')
+    observe('course_sync_seconds', finished - fetched, stage='save')
+    return report
+
+
+def describe(report):
+    """One-line summary for the command output and the admin message."""
+    if report['not_modified']:
+        return f"Courses unchanged since the last sync ({report['seconds']}s)."
+    text = (
+        f"{report['created']} new, {report['updated']} updated, {report['unchanged']} unchanged courses "
+        f"(fetch {report['fetch_seconds']}s, save {report['save_seconds']}s)."
+    )
+    if report['skipped']:
+        text += f" {report['skipped']} malformed rows skipped."
+    return text
@@ -0,0 +1,148 @@
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+
+# Optional shared inference server. One process holds the model and serves
+# every gunicorn/grade_worker process over a Unix domain socket, so RAM holds
+# a single model copy and requests from all workers share batched forward
+# passes. Messages are length-prefixed frames: a JSON request, answered by a
+# JSON header frame followed by a frame with the raw float32 vector.
+
+_LENGTH = struct.Struct('!I')
+
+
+class ServerUnavailable(Exception):
+    pass
+
+
+def _send_frame(sock, payload):
+    sock.sendall(_LENGTH.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        data.extend(chunk)
+    return bytes(data)
+
+
+def _recv_frame(sock):
+    (size,) = _LENGTH.unpack(_recv_exact(sock, _LENGTH.size))
+    return _recv_exact(sock, size)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        from .grading import embed_document_locally
+
+        while True:
+            try:
+                request = json.loads(_recv_frame(self.request))
+            except (ConnectionError, OSError):
+                return
+            try:
+                if request.get('op') != 'embed':
+                    raise ValueError(f"unknown op {request.get('op')!r}")
+                vector = embed_document_locally(request['text'], pooling=request.get('pooling'))
+            except Exception as e:
+                _send_frame(self.request, json.dumps({'ok': False, 'error': str(e)}).encode())
+                continue
+            if vector is None:
+                _send_frame(self.request, json.dumps({'ok': True, 'dimensions': None}).encode())
+            else:
+                vector = np.asarray(vector, dtype=np.float32)
+                _send_frame(self.request, json.dumps({'ok': True, 'dimensions': vector.shape[0]}).encode())
+                _send_frame(self.request, vector.tobytes())
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, path):
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, _Handler)
+
+
+class EmbeddingClient:
+    """Per-thread persistent connections to the embedding server. After a
+    failed connect the server is treated as down for ``retry_seconds`` so
+    callers fall back to in-process encoding without paying a connect each
+    time."""
+
+    def __init__(self, path, timeout=120, retry_seconds=30):
+        self.path = path
+        self.timeout = timeout
+        self.retry_seconds = retry_seconds
+        self._local = threading.local()
+        self._down_until = 0.0
+
+    def _connection(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            if time.monotonic() < self._down_until or not hasattr(socket, 'AF_UNIX'):
+                raise ServerUnavailable(self.path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.path)
+            except OSError as e:
+                sock.close()
+                self._mark_down(e)
+                raise ServerUnavailable(f"{self.path}: {e}")
+            self._local.sock = sock
+        return sock
+
+    def _mark_down(self, error):
+        print(f"Embedding server {self.path} unavailable, encoding in-process for {self.retry_seconds}s: {error}")
+        self._down_until = time.monotonic() + self.retry_seconds
+
+    def _drop(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            sock.close()
+        self._local.sock = None
+
+    def embed(self, text, pooling=None):
+        sock = self._connection()
+        try:
+            _send_frame(sock, json.dumps({'op': 'embed', 'text': text, 'pooling': pooling}).encode())
+            header = json.loads(_recv_frame(sock))
+            if not header['ok']:
+                raise RuntimeError(f"embedding server error: {header['error']}")
+            if header['dimensions'] is None:
+                return None
+            return np.frombuffer(_recv_frame(sock), dtype=np.float32)
+        except (ConnectionError, OSError) as e:
+            self._drop()
+            self._mark_down(e)
+            raise ServerUnavailable(f"{self.path}: {e}")
+
+
+_client = None
+
+
+def get_embedding_client():
+    """The shared client, or None when EMBEDDING_SERVER_SOCKET is not set."""
+    global _client
+    if not settings.EMBEDDING_SERVER_SOCKET:
+        return None
+    if _client is None or _client.path != settings.EMBEDDING_SERVER_SOCKET:
+        _client = EmbeddingClient(
+            settings.EMBEDDING_SERVER_SOCKET,
+            timeout=settings.EMBEDDING_SERVER_TIMEOUT,
+            retry_seconds=settings.EMBEDDING_SERVER_RETRY_SECONDS,
+        )
+    return _client
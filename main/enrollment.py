@@ -0,0 +1,122 @@
+import csv
+import io
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from . import versioning
+from .models import ClassRoom
+from .permissions import invalidate_roles
+
+User = get_user_model()
+
+# Bulk enrollment for `classrooms/{id}/enroll` and `manage.py import_roster`.
+# Rosters list students by roll number or email. Users are resolved with a
+# few batched IN queries and the roster rows are inserted with one
+# bulk_create into the m2m table, so a 2,000-student program is a handful of
+# queries instead of thousands of students.add() calls. bulk_create bypasses
+# m2m_changed, so the role cache and classroom version are updated here.
+
+BATCH_SIZE = 500  # stays under SQLite's bound-parameter limit
+
+ENROLLED = 'enrolled'
+ALREADY_ENROLLED = 'already_enrolled'
+NOT_FOUND = 'not_found'
+DUPLICATE = 'duplicate'
+TEACHER = 'teacher'
+
+_HEADERS = {'roll_number', 'roll number', 'roll_no', 'email', 'e-mail'}
+
+
+def parse_roster(text):
+    """``[(row number, identifier)]`` from CSV text. With a header row the
+    roll number/email columns are used, otherwise the first column."""
+    rows = [row for row in csv.reader(io.StringIO(text.lstrip('﻿')))]
+    columns = [0]
+    start = 0
+    if rows and any(cell.strip().lower() in _HEADERS for cell in rows[0]):
+        columns = [i for i, cell in enumerate(rows[0]) if cell.strip().lower() in _HEADERS]
+        start = 1
+    identifiers = []
+    for number, row in enumerate(rows[start:], start=start + 1):
+        values = [row[i].strip() for i in columns if i < len(row) and row[i].strip()]
+        if values:
+            identifiers.append((number, values[0]))
+    return identifiers
+
+
+def _batches(values):
+    values = list(values)
+    for start in range(0, len(values), BATCH_SIZE):
+        yield values[start:start + BATCH_SIZE]
+
+
+def resolve_users(identifiers):
+    """``{identifier: user id}`` for the identifiers that match a user: emails
+    case-insensitively (the user_email_lower index), anything else as a roll
+    number."""
+    emails = {i.lower() for i in identifiers if '@' in i}
+    roll_numbers = {i for i in identifiers if '@' not in i}
+    by_email, by_roll = {}, {}
+    for batch in _batches(emails):
+        rows = User.objects.annotate(email_lower=Lower('email')).filter(email_lower__in=batch)
+        by_email.update(rows.values_list('email_lower', 'id'))
+    for batch in _batches(roll_numbers):
+        by_roll.update(User.objects.filter(roll_number__in=batch).values_list('roll_number', 'id'))
+    found = {}
+    for identifier in identifiers:
+        user_id = by_email.get(identifier.lower()) if '@' in identifier else by_roll.get(identifier)
+        if user_id is not None:
+            found[identifier] = user_id
+    return found
+
+
+def enroll(classroom, roster):
+    """Enroll the ``[(row, identifier)]`` roster into ``classroom`` and return
+    ``{'enrolled': n, 'already_enrolled': n, 'not_found': n, 'rows': [...]}``
+    with one report entry per roster row."""
+    through = ClassRoom.students.through
+    classroom_field = ClassRoom.students.field.m2m_field_name()
+    user_field = ClassRoom.students.field.m2m_reverse_field_name()
+
+    user_ids = resolve_users({identifier for _, identifier in roster})
+    enrolled = set()
+    for batch in _batches(set(user_ids.values())):
+        enrolled.update(
+            through.objects.filter(**{classroom_field: classroom, f'{user_field}__in': batch})
+            .values_list(f'{user_field}_id', flat=True)
+        )
+
+    rows, new_ids, seen = [], [], set()
+    for number, identifier in roster:
+        user_id = user_ids.get(identifier)
+        if user_id is None:
+            result = NOT_FOUND
+        elif user_id in seen:
+            result = DUPLICATE
+        elif user_id == classroom.created_by_id:
+            result = TEACHER
+        elif user_id in enrolled:
+            result = ALREADY_ENROLLED
+        else:
+            result = ENROLLED
+            new_ids.append(user_id)
+        if user_id is not None:
+            seen.add(user_id)
+        rows.append({'row': number, 'identifier': identifier, 'status': result, 'user_id': user_id})
+
+    with transaction.atomic():
+        through.objects.bulk_create(
+            [through(**{f'{classroom_field}_id': classroom.id, f'{user_field}_id': i}) for i in new_ids],
+            ignore_conflicts=True, batch_size=BATCH_SIZE,
+        )
+        if new_ids:
+            versioning.bump(versioning.CLASSROOM, [classroom.id])
+    invalidate_roles(new_ids)
+
+    report = {status: 0 for status in (ENROLLED, ALREADY_ENROLLED, NOT_FOUND, DUPLICATE, TEACHER)}
+    for row in rows:
+        report[row['status']] += 1
+    report['rows'] = rows
+    return report
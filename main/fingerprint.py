@@ -0,0 +1,119 @@
+import hashlib
+import re
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .models import FingerprintBucket, Submission, SubmissionFingerprint
+
+
+# Lexical fingerprints for copy detection without the embedding model. A
+# submission's word 3-shingles are summarised by a 128-value MinHash
+# signature; the share of equal values between two signatures estimates the
+# Jaccard similarity of their shingle sets. The signature is cut into 32 bands
+# of 4 values and each band is hashed into a FingerprintBucket row, so
+# submissions sharing any band (likely Jaccard >~ 0.4) are found with one
+# indexed query.
+
+SHINGLE_WORDS = 3
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+_BLOCK = 4096  # shingles hashed per numpy step, bounds memory for long documents
+
+_WORD = re.compile(r"\w+")
+_PRIME = np.uint64(4294967291)  # largest prime below 2**32
+_rng = np.random.RandomState(20240501)  # fixed: signatures must stay comparable across processes
+_A = _rng.randint(1, 2 ** 32 - 5, NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, 2 ** 32 - 5, NUM_PERM).astype(np.uint64)
+
+
+def shingles(text):
+    tokens = [t.lower() for t in _WORD.findall(text)]
+    if len(tokens) < SHINGLE_WORDS:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + SHINGLE_WORDS]) for i in range(len(tokens) - SHINGLE_WORDS + 1)}
+
+
+def signature(text):
+    """MinHash signature (uint32 array of NUM_PERM) of ``text``, or None
+    when it has no words."""
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), 'little') for s in shingles(text)),
+        dtype=np.uint64,
+    )
+    if not hashes.size:
+        return None
+    result = np.full(NUM_PERM, _PRIME, dtype=np.uint64)
+    for start in range(0, hashes.size, _BLOCK):
+        block = hashes[start:start + _BLOCK, None]
+        np.minimum(result, ((block * _A + _B) % _PRIME).min(axis=0), out=result)
+    return result.astype(np.uint32)
+
+
+def band_keys(sig):
+    keys = []
+    for band in range(BANDS):
+        digest = hashlib.blake2b(bytes([band]) + sig[band * ROWS:(band + 1) * ROWS].tobytes(), digest_size=8)
+        keys.append(int.from_bytes(digest.digest(), 'little', signed=True))
+    return keys
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+def fingerprint_submission(submission, text, content_hash):
+    """Store the signature and LSH buckets of ``submission``; returns the
+    signature (None when the text has no words)."""
+    stored = SubmissionFingerprint.objects.filter(submission=submission).first()
+    if stored is not None and stored.content_hash == content_hash:
+        return np.frombuffer(stored.signature, dtype=np.uint32)
+
+    sig = signature(text)
+    with transaction.atomic():
+        FingerprintBucket.objects.filter(submission=submission).delete()
+        if sig is None:
+            SubmissionFingerprint.objects.filter(submission=submission).delete()
+            return None
+        SubmissionFingerprint.objects.update_or_create(
+            submission=submission, defaults={'content_hash': content_hash, 'signature': sig.tobytes()},
+        )
+        FingerprintBucket.objects.bulk_create(
+            FingerprintBucket(submission=submission, assignment_id=submission.assignment_id, key=key)
+            for key in band_keys(sig)
+        )
+    return sig
+
+
+def find_candidates(submission, sig):
+    """``{submission id: estimated Jaccard}`` for the other submissions of the
+    same assignment sharing at least one LSH bucket with ``sig``."""
+    ids = set(
+        FingerprintBucket.objects.filter(assignment_id=submission.assignment_id, key__in=band_keys(sig))
+        .exclude(submission_id=submission.id)
+        .values_list('submission_id', flat=True)
+    )
+    rows = SubmissionFingerprint.objects.filter(submission_id__in=ids).values_list('submission_id', 'signature')
+    return {sid: similarity(sig, np.frombuffer(other, dtype=np.uint32)) for sid, other in rows}
+
+
+def find_copies(submission, sig, threshold=None):
+    """``(student name, similarity %)`` for submissions whose text is a
+    near-verbatim copy of ``sig``'s, highest first."""
+    threshold = settings.PLAGIARISM_COPY_THRESHOLD if threshold is None else threshold
+    matches = {sid: sim for sid, sim in find_candidates(submission, sig).items() if sim >= threshold}
+    names = dict(Submission.objects.filter(id__in=matches).values_list('id', 'student__name'))
+    return sorted(
+        ((names.get(sid, "Unknown"), round(sim * 100, 2)) for sid, sim in matches.items()),
+        key=lambda match: -match[1],
+    )
+
+
+def copy_feedback(copies):
+    """Feedback suffix listing near-verbatim copies."""
+    if not copies:
+        return ""
+    return " | Copied text: " + ", ".join(f"{name} {sim}% identical" for name, sim in copies)
@@ -1,7 +1,7 @@
 # forms.py
 
 from django import forms
-from .models import ClassRoom, FacultyCourse
+from .models import ClassRoom, FacultyCourse, generate_join_code
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -32,7 +32,9 @@ class ClassRoomAdminForm(forms.ModelForm):
         # Set name and code from the selected course
         course = self.cleaned_data['selected_course']
         classroom.name = course.course_title
-        classroom.code = course.course_code
+        # Join codes are unique: sections of one course get suffixed codes
+        if not classroom.pk or classroom.course_id != course.id:
+            classroom.code = generate_join_code(course.course_code)
         classroom.course = course
 
         # Set the teacher
@@ -0,0 +1,605 @@
+import codecs
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from . import text_cache
+from .batching import BatchingEncoder
+from .embedding_server import ServerUnavailable, get_embedding_client
+from .fingerprint import copy_feedback, find_candidates, find_copies, fingerprint_submission
+from .keywords import get_keyword_matcher
+from .metrics import timed
+from .models import Assignment, Submission, SubmissionEmbedding
+from .plagiarism import check_plagiarism
+from .similarity_index import index_submission
+
+
+# The model and the document parsers are imported on first use so that
+# migrate, shell, admin-only processes and tests start without torch.
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                print(f"Loading grading model {settings.GRADING_MODEL_NAME} ({settings.GRADING_INFERENCE_BACKEND})")
+                _model = load_model(settings.GRADING_MODEL_NAME, settings.GRADING_INFERENCE_BACKEND)
+    return _model
+
+
+INFERENCE_BACKENDS = ('torch', 'int8', 'onnx')
+
+
+def load_model(name, backend='torch'):
+    """Load a SentenceTransformer for CPU inference.
+
+    ``torch`` is plain fp32, ``int8`` applies dynamic int8 quantization to the
+    Linear layers, ``onnx`` runs the exported graph on ONNX Runtime (needs
+    ``optimum[onnxruntime]``). A smaller distilled checkpoint is selected with
+    the model name instead."""
+    from sentence_transformers import SentenceTransformer
+
+    if backend == 'onnx':
+        return SentenceTransformer(name, device='cpu', backend='onnx')
+    if backend == 'int8':
+        import torch
+
+        model = SentenceTransformer(name, device='cpu')
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend == 'torch':
+        return SentenceTransformer(name)
+    raise ValueError(f"Unknown inference backend {backend!r}, expected one of {INFERENCE_BACKENDS}")
+
+
+# Concurrent grading threads share forward passes through the batching encoder
+encoder = BatchingEncoder(
+    lambda texts: get_model().encode(texts, batch_size=len(texts)),
+    max_batch_size=settings.GRADING_BATCH_MAX_SIZE,
+    window_ms=settings.GRADING_BATCH_WINDOW_MS,
+)
+
+
+TIMED_OUT = "extraction timed out"
+
+
+class ExtractionLimits:
+    """Caps for one extraction. Hitting a cap stops extraction early and
+    records why in ``truncated`` instead of failing the submission. The
+    timeout is checked between pages/paragraphs/blocks."""
+
+    def __init__(self, max_bytes=None, max_pages=None, max_chars=None, timeout=None):
+        self.max_bytes = max_bytes or settings.GRADING_EXTRACT_MAX_BYTES
+        self.max_pages = max_pages or settings.GRADING_EXTRACT_MAX_PAGES
+        self.max_chars = max_chars or settings.GRADING_EXTRACT_MAX_CHARS
+        self.deadline = time.monotonic() + (timeout or settings.GRADING_EXTRACT_TIMEOUT_SECONDS)
+        self.chars = 0
+        self.truncated = ''
+
+    def stop(self, reason):
+        self.truncated = self.truncated or reason
+        return None
+
+    def take(self, text):
+        """``text`` clipped to the remaining character budget, or None once
+        the budget or the time is used up."""
+        if time.monotonic() > self.deadline:
+            return self.stop(TIMED_OUT)
+        remaining = self.max_chars - self.chars
+        if remaining <= 0:
+            return self.stop(f"longer than {self.max_chars} characters")
+        if len(text) > remaining:
+            text = text[:remaining]
+            self.stop(f"longer than {self.max_chars} characters")
+        self.chars += len(text)
+        return text
+
+
+def iter_text(file_path, limits=None):
+    """Yield the text of a document piece by piece (PDF pages, DOCX
+    paragraphs, TXT lines) so long uploads are never held as one string."""
+    limits = limits or ExtractionLimits()
+    if file_path.endswith((".pdf", ".docx")) and os.path.getsize(file_path) > limits.max_bytes:
+        # PDF and DOCX cannot be parsed from a prefix, so oversized ones are refused
+        limits.stop(f"larger than {limits.max_bytes} bytes")
+        return
+    if file_path.endswith(".pdf"):
+        import fitz
+
+        with fitz.open(file_path) as doc:
+            for number, page in enumerate(doc):
+                if number >= limits.max_pages:
+                    limits.stop(f"more than {limits.max_pages} pages")
+                    break
+                text = limits.take(page.get_text("text"))
+                if text is None:
+                    break
+                yield text
+    elif file_path.endswith(".docx"):
+        import docx
+
+        doc = docx.Document(file_path)
+        for para in doc.paragraphs:
+            text = limits.take(para.text)
+            if text is None:
+                break
+            yield text
+    elif file_path.endswith(".txt"):
+        yield from _iter_txt(file_path, limits)
+
+
+def _iter_txt(file_path, limits):
+    # Encoding is detected on a bounded sample, then the file is decoded
+    # incrementally block by block.
+    import chardet
+
+    block_size = 64 * 1024
+    with open(file_path, "rb") as f:
+        block = f.read(min(settings.GRADING_EXTRACT_SAMPLE_BYTES, limits.max_bytes))
+        encoding = chardet.detect(block)['encoding'] or 'utf-8'
+        try:
+            decoder = codecs.getincrementaldecoder(encoding)(errors='ignore')
+        except LookupError:
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+
+        read = len(block)
+        pending = ''
+        while block:
+            lines = (pending + decoder.decode(block)).split('\n')
+            pending = lines.pop()
+            if len(pending) > block_size:  # no newline in sight; don't buffer forever
+                lines.append(pending)
+                pending = ''
+            for line in lines:
+                text = limits.take(line.rstrip('\r'))
+                if text is None:
+                    return
+                yield text
+            if read >= limits.max_bytes:
+                if f.read(1):
+                    limits.stop(f"larger than {limits.max_bytes} bytes")
+                break
+            block = f.read(min(block_size, limits.max_bytes - read))
+            read += len(block)
+
+        tail = pending + decoder.decode(b'', final=True)
+        if tail:
+            text = limits.take(tail.rstrip('\r'))
+            if text is not None:
+                yield text
+
+# Bump when iter_text changes so cached extractions are not reused
+EXTRACTOR_VERSION = 3
+
+def extract_document(file_path):
+    """``(text, truncated)`` for a file, parsed once per unique content (see
+    text_cache). ``truncated`` is empty or the reason extraction stopped early."""
+    try:
+        with timed('extract'):
+            content_hash = file_sha256(file_path)
+            cached = text_cache.get(content_hash, EXTRACTOR_VERSION)
+            if cached is not None:
+                return cached
+            limits = ExtractionLimits()
+            text = "\n".join(iter_text(file_path, limits))
+            if limits.truncated != TIMED_OUT:  # a timeout depends on load; retry next time
+                text_cache.put(content_hash, EXTRACTOR_VERSION, text, limits.truncated)
+            return text, limits.truncated
+    except Exception as e:
+        print(f"Error extracting text from {file_path}: {e}")
+        return "", ""
+
+def extract_text(file_path):
+    return extract_document(file_path)[0]
+
+
+def truncation_feedback(truncated):
+    return f" | ⚠️ Truncated ({truncated}): only the first part was graded" if truncated else ""
+
+
+# Long documents: the model truncates its input at max_seq_length tokens, so
+# text is split into token-bounded windows, encoded in bounded batches and the
+# chunk vectors pooled into one document embedding.
+
+def _split_long(piece, max_chars=2000):
+    while len(piece) > max_chars:
+        cut = piece.rfind(" ", 0, max_chars)
+        cut = cut if cut > 0 else max_chars
+        yield piece[:cut]
+        piece = piece[cut:]
+    yield piece
+
+
+def iter_chunks(pieces, max_tokens=None, overlap=None, model=None):
+    """Group streamed text pieces (lines, paragraphs, pages) into windows of
+    at most ``max_tokens`` model tokens, consecutive windows sharing
+    ``overlap`` tokens."""
+    model = model or get_model()
+    tokenizer = model.tokenizer
+    max_tokens = max_tokens or model.max_seq_length - 2
+    overlap = settings.GRADING_CHUNK_OVERLAP_TOKENS if overlap is None else overlap
+    if not 0 <= overlap < max_tokens:
+        raise ValueError(f"Chunk overlap ({overlap}) must be at least 0 and below max_tokens ({max_tokens})")
+    buffer = []
+    emitted = False
+    started = False
+    for piece in pieces:
+        if not piece.strip():
+            continue
+        # Pieces are tokenized separately, so the line break between them
+        # has to be put back or byte-level BPE glues the words together
+        if started:
+            piece = "\n" + piece
+        started = True
+        for part in _split_long(piece):
+            buffer.extend(tokenizer(part, add_special_tokens=False, verbose=False)['input_ids'])
+            while len(buffer) >= max_tokens:
+                yield tokenizer.decode(buffer[:max_tokens]), max_tokens
+                buffer = buffer[max_tokens - overlap:]
+                emitted = True
+    # The tail is only worth encoding if it is more than the shared overlap
+    if buffer and (not emitted or len(buffer) > overlap):
+        yield tokenizer.decode(buffer), len(buffer)
+
+
+def embed_document(pieces, pooling=None):
+    """Pool the embeddings of every chunk of ``pieces`` (a string or an
+    iterable of strings) into one vector; None when there is no text.
+
+    Uses the shared embedding server when one is configured and reachable,
+    otherwise the in-process model."""
+    with timed('encode'):
+        client = get_embedding_client()
+        if client is not None:
+            text = pieces if isinstance(pieces, str) else "\n".join(pieces)
+            try:
+                return client.embed(text, pooling=pooling)
+            except ServerUnavailable:
+                pieces = text
+        return embed_document_locally(pieces, pooling=pooling)
+
+
+def embed_document_locally(pieces, pooling=None, model=None):
+    """In-process embed_document. An explicit ``model`` is called directly
+    instead of through the shared batching encoder (backend comparisons)."""
+    return embed_documents_locally([pieces], pooling=pooling, model=model)[0]
+
+
+def embed_documents_locally(documents, pooling=None, model=None, batch_size=None):
+    """Embed several documents at once; chunks from consecutive documents
+    share forward passes of up to ``batch_size`` texts (bulk regrades)."""
+    pooling = pooling or settings.GRADING_CHUNK_POOLING
+    batch_size = batch_size or settings.GRADING_CHUNK_BATCH_SIZE
+
+    totals = [None] * len(documents)
+    weights = [0] * len(documents)
+    batch, owners, lengths = [], [], []
+
+    def flush():
+        if model is None:
+            vectors = encoder.encode_many(batch)
+        else:
+            vectors = np.asarray(model.encode(list(batch), batch_size=len(batch)), dtype=np.float32)
+        for vector, doc, length in zip(vectors, owners, lengths):
+            if pooling == 'max':
+                totals[doc] = vector if totals[doc] is None else np.maximum(totals[doc], vector)
+            else:
+                totals[doc] = vector * length if totals[doc] is None else totals[doc] + vector * length
+            weights[doc] += length
+        batch.clear()
+        owners.clear()
+        lengths.clear()
+
+    for doc, pieces in enumerate(documents):
+        if isinstance(pieces, str):
+            pieces = pieces.splitlines()
+        for chunk, length in iter_chunks(pieces, model=model):
+            batch.append(chunk)
+            owners.append(doc)
+            lengths.append(length)
+            if len(batch) >= batch_size:
+                flush()
+    if batch:
+        flush()
+
+    return [
+        None if total is None else total if pooling == 'max' else total / weight
+        for total, weight in zip(totals, weights)
+    ]
+
+
+def cosine_similarity(a, b):
+    a = np.asarray(a, dtype=np.float32).reshape(-1)
+    b = np.asarray(b, dtype=np.float32).reshape(-1)
+    norms = np.linalg.norm(a) * np.linalg.norm(b)
+    return float(a @ b / norms) if norms else 0.0
+
+def evaluate_submission(student_text, correct_embedding, min_words, required_keywords, max_marks, student_embedding=None):
+    try:
+        word_count = len(student_text.split())
+        if word_count < min_words:
+            return 0, f"0% semantically similar (Too short: {word_count} words < {min_words})"
+
+
+        if student_embedding is None:
+            student_embedding = embed_document(student_text)
+        similarity = cosine_similarity(correct_embedding, student_embedding)
+
+
+        kw_score, matched_keywords = get_keyword_matcher(required_keywords).score(student_text)
+
+
+        marks = round((similarity * 0.9 + kw_score * 0.1) * max_marks, 2)
+        if similarity < 0.30:
+            # Reduce marks more aggressively, e.g., scale down to make marks "more low"
+            marks = marks * 0.4  # Scale down by 70% when similarity > 30%
+
+        marks = round(marks, 2)
+        # Generate similarity text
+        sim_text = f"{round(similarity * 100, 2)}% semantically similar"
+        if similarity > 0.80:
+            sim_text += " ⚠️ Possible copy"
+        if word_count < min_words:
+            sim_text += " (Too short)"
+        sim_text += f" | Keywords: {len(matched_keywords)}/{len(required_keywords)}"
+        if matched_keywords:
+            sim_text += f" ({', '.join(matched_keywords)})"
+
+        return marks, sim_text
+    except Exception as e:
+        print(f"Error evaluating submission: {e}")
+        return 0, f"Error: {e}"
+
+
+
+# Embedding store: each submission is encoded once and the vector is kept in
+# SubmissionEmbedding, keyed by the sha256 of the uploaded file so a replaced
+# file is picked up even if the row was not invalidated by the signal.
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def vector_to_bytes(vector):
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def bytes_to_vector(data):
+    return np.frombuffer(bytes(data), dtype=np.float32)
+
+
+def submission_file_path(submission):
+    if not submission.submitted_file:
+        return None
+    file_path = os.path.join(settings.MEDIA_ROOT, submission.submitted_file.name)
+    if not os.path.exists(file_path):
+        return None
+    return file_path
+
+
+def get_submission_embedding(submission, text=None):
+    """Return the stored embedding for ``submission``, encoding it only when
+    there is no row yet or the file content changed. Returns None when the
+    file is missing or has no extractable text."""
+    file_path = submission_file_path(submission)
+    if file_path is None:
+        return None
+    content_hash = file_sha256(file_path)
+
+    stored = SubmissionEmbedding.objects.filter(submission=submission).first()
+    if stored is not None and stored.content_hash == content_hash:
+        return bytes_to_vector(stored.vector)
+
+    try:
+        vector = embed_document(text if text is not None else iter_text(file_path))
+    except Exception as e:
+        print(f"Error extracting text from {file_path}: {e}")
+        return None
+    if vector is None:
+        return None
+    SubmissionEmbedding.objects.update_or_create(
+        submission=submission,
+        defaults={
+            'content_hash': content_hash,
+            'vector': vector_to_bytes(vector),
+            'dimensions': vector.shape[0],
+        },
+    )
+    return vector
+
+
+def get_assignment_embeddings(assignment, exclude_id=None, only_ids=None):
+    """Stored embeddings for every submission of ``assignment`` (or just
+    ``only_ids``) in one query. Submissions without a stored vector yet are
+    encoded and saved."""
+    submissions = Submission.objects.filter(assignment=assignment).select_related('student', 'embedding')
+    if exclude_id is not None:
+        submissions = submissions.exclude(id=exclude_id)
+    if only_ids is not None:
+        submissions = submissions.filter(id__in=only_ids)
+
+    embeddings = {}
+    names = {}
+    for other in submissions:
+        stored = getattr(other, 'embedding', None)
+        if stored is not None:
+            vector = bytes_to_vector(stored.vector)
+        else:
+            vector = get_submission_embedding(other)
+        if vector is not None:
+            embeddings[other.id] = vector
+            names[other.id] = other.student.name
+    return embeddings, names
+
+
+# Reference answers: the teacher file is extracted and encoded once, persisted
+# on the Assignment row and kept in memory per (assignment, file hash).
+_reference_cache = {}
+
+
+def _teacher_file_path(assignment):
+    if not assignment.file:
+        return None
+    file_path = os.path.join(settings.MEDIA_ROOT, assignment.file.name)
+    if not os.path.exists(file_path):
+        print(f"Error: Teacher file {file_path} not found")
+        return None
+    return file_path
+
+
+def refresh_reference_embedding(assignment):
+    """Extract and encode the teacher file and persist it on ``assignment``.
+    Returns the embedding, or None when there is no usable file. Raises
+    RuntimeError (retried by the grading queue) when the file is replaced
+    while it is being encoded."""
+    file_path = _teacher_file_path(assignment)
+    if file_path is None:
+        return None
+
+    content_hash = file_sha256(file_path)
+    text = extract_text(file_path)
+    if not text:
+        print(f"Error: Could not extract text from teacher file {file_path}")
+        return None
+    vector = embed_document(text)
+
+    # Never store this vector under a file the teacher uploaded meanwhile
+    if file_sha256(file_path) != content_hash:
+        raise RuntimeError(f"Teacher file {file_path} changed while it was encoded")
+    updated = Assignment.objects.filter(pk=assignment.pk, file=assignment.file.name).update(
+        reference_text=text,
+        reference_hash=content_hash,
+        reference_embedding=vector_to_bytes(vector),
+    )
+    if not updated:
+        raise RuntimeError(f"Teacher file of assignment {assignment.pk} was replaced while it was encoded")
+    assignment.reference_text = text
+    assignment.reference_hash = content_hash
+    assignment.reference_embedding = vector_to_bytes(vector)
+    _reference_cache[assignment.pk] = (content_hash, vector)
+    return vector
+
+
+def get_reference_embedding(assignment, verify=False):
+    """The stored reference embedding, encoded first when missing. With
+    ``verify`` the teacher file is hashed again and a stored embedding of
+    different content is replaced."""
+    if assignment.reference_embedding and assignment.reference_hash:
+        if verify:
+            file_path = _teacher_file_path(assignment)
+            if file_path is None:
+                return None
+            if file_sha256(file_path) != assignment.reference_hash:
+                return refresh_reference_embedding(assignment)
+        cached = _reference_cache.get(assignment.pk)
+        if cached is not None and cached[0] == assignment.reference_hash:
+            return cached[1]
+        vector = bytes_to_vector(assignment.reference_embedding)
+        _reference_cache[assignment.pk] = (assignment.reference_hash, vector)
+        return vector
+    return refresh_reference_embedding(assignment)
+
+
+def plagiarism_feedback(student_name, plagiarism_results):
+    """Feedback suffix naming the students ``student_name`` overlaps with."""
+    matches = []
+    for student1, student2, sim in plagiarism_results:
+        if student_name in (student1, student2):
+            other_student = student2 if student1 == student_name else student1
+            matches.append(f"{other_student} same {sim}%")
+    return " | Plagiarism: " + ", ".join(matches) if matches else ""
+
+
+class GradingError(Exception):
+    """Grading cannot succeed for this submission; retrying will not help."""
+
+
+def grade_submission(submission):
+    """Grade ``submission`` against its assignment's reference answer, add the
+    plagiarism summary to the feedback and save marks/feedback.
+
+    Raises GradingError for problems with the inputs (missing files, no text);
+    any other exception is treated as transient by the grading queue."""
+    assignment = submission.assignment
+    max_marks = assignment.max_marks
+    min_words = assignment.min_words
+    required_keywords = assignment.required_keywords or ["AI", "making decisions", "recognizing patterns"]
+
+    # Get the student's submitted file path
+    if not submission.submitted_file:
+        raise GradingError(f"No file for submission {submission.id}")
+    student_file_path = os.path.join(settings.MEDIA_ROOT, submission.submitted_file.name)
+    if not os.path.exists(student_file_path):
+        raise GradingError(f"Submission file {student_file_path} not found")
+
+    # Extract text from student's submission
+    student_text, truncated = extract_document(student_file_path)
+    if not student_text:
+        reason = f" ({truncated})" if truncated else ""
+        raise GradingError(f"Could not extract text from {student_file_path}{reason}")
+
+    # Lexical fingerprint: near-verbatim copies, and the candidate set for
+    # the semantic check in large assignments
+    with timed('fingerprint'):
+        signature = fingerprint_submission(submission, student_text, file_sha256(student_file_path))
+        copies = find_copies(submission, signature) if signature is not None else []
+        candidate_ids = None
+        if signature is not None and (
+            Submission.objects.filter(assignment=assignment).count() >= settings.PLAGIARISM_LSH_MIN_SUBMISSIONS
+        ):
+            candidate_ids = list(find_candidates(submission, signature))
+    if copies:
+        # Copy flags are visible before any model work below
+        submission.feedback = "Grading pending" + copy_feedback(copies)
+        submission.save(update_fields=['feedback'])
+
+    # Reference embedding is computed once per teacher file and cached
+    correct_embedding = get_reference_embedding(assignment)
+    if correct_embedding is None:
+        raise GradingError(f"No usable teacher file for assignment {assignment.id}")
+
+    # Encode the submission once and keep it in the embedding store
+    student_embedding = get_submission_embedding(submission, text=student_text)
+    if student_embedding is not None:
+        index_submission(submission, student_embedding)
+
+    # Evaluate the submission
+    with timed('evaluate'):
+        marks, feedback = evaluate_submission(student_text, correct_embedding, min_words, required_keywords, max_marks, student_embedding=student_embedding)
+
+    # Check for plagiarism with other submissions for this assignment,
+    # reusing their stored embeddings instead of re-encoding every file
+    with timed('plagiarism'):
+        student_embeddings, submission_id_to_student = get_assignment_embeddings(
+            assignment, exclude_id=submission.id, only_ids=candidate_ids,
+        )
+        if student_embedding is not None:
+            student_embeddings[submission.id] = student_embedding
+            submission_id_to_student[submission.id] = submission.student.name
+
+        plagiarism_results = check_plagiarism(student_embeddings, submission_id_to_student, target_id=submission.id)
+    if plagiarism_results:
+        print("\n🔍 Plagiarism Check Between Students (Similarity > 80%):\n" + "-" * 50)
+        for student1, student2, sim in plagiarism_results:
+            print(f"{student1} <-> {student2}: {sim}% similar")
+    feedback += plagiarism_feedback(submission.student.name, plagiarism_results)
+    feedback += copy_feedback(copies)
+    feedback += truncation_feedback(truncated)
+
+    # Update the submission with marks and feedback
+    submission.marks = marks
+    submission.feedback = feedback
+    with timed('save'):
+        submission.save(update_fields=['marks', 'feedback'])
+    print(f"Updated submission {submission.id} - Marks: {marks}, Feedback: {feedback}")
+    return marks, feedback
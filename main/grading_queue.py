@@ -0,0 +1,121 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from . import versioning
+from .grading import GradingError, get_reference_embedding, grade_submission
+from .models import Assignment, GradingJob
+
+
+# Database-backed grading queue. The API only enqueues a job; `manage.py
+# grade_worker` claims jobs with a conditional UPDATE (works on SQLite and
+# PostgreSQL alike) and retries transient failures with exponential backoff.
+# Besides submissions, jobs encode an assignment's reference answer so the
+# teacher's request never loads the model.
+
+def _reset_job(**target):
+    job, _ = GradingJob.objects.update_or_create(
+        **target,
+        defaults={
+            'state': GradingJob.PENDING,
+            'attempts': 0,
+            'run_after': timezone.now(),
+            'locked_at': None,
+            'last_error': '',
+        },
+    )
+    return job
+
+
+def enqueue_grading(submission):
+    """Create or reset the grading job of ``submission`` so it is picked up again."""
+    return _reset_job(submission=submission)
+
+
+def enqueue_reference(assignment):
+    """Queue encoding the reference answer of ``assignment`` (after it is
+    created or its file changes). Does nothing without a teacher file."""
+    if not assignment.file:
+        return None
+    return _reset_job(assignment=assignment)
+
+
+def retry_delay(attempts):
+    base = settings.GRADING_RETRY_BASE_SECONDS
+    cap = settings.GRADING_RETRY_MAX_SECONDS
+    return min(cap, base * 2 ** max(attempts - 1, 0))
+
+
+def release_stale_jobs():
+    """Put jobs whose worker died while running back in the queue."""
+    timeout = settings.GRADING_JOB_TIMEOUT_SECONDS
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    stale = GradingJob.objects.filter(state=GradingJob.RUNNING, locked_at__lt=cutoff)
+    assignment_ids = set(stale.filter(submission__isnull=False).values_list('submission__assignment_id', flat=True))
+    released = stale.update(state=GradingJob.PENDING, locked_at=None, run_after=timezone.now())
+    if released:
+        versioning.bump(versioning.ASSIGNMENT, assignment_ids)
+    return released
+
+
+def claim_next_job():
+    """Atomically mark the oldest due job as running and return it, or None."""
+    now = timezone.now()
+    candidates = GradingJob.objects.filter(state=GradingJob.PENDING, run_after__lte=now).values_list('id', flat=True)
+    for job_id in candidates[:10]:
+        claimed = GradingJob.objects.filter(id=job_id, state=GradingJob.PENDING).update(
+            state=GradingJob.RUNNING, locked_at=now, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            job = GradingJob.objects.select_related('submission__assignment', 'submission__student').get(id=job_id)
+            if job.submission_id is not None:
+                versioning.bump(versioning.ASSIGNMENT, [job.submission.assignment_id])
+            return job
+    return None
+
+
+def run_job(job):
+    try:
+        if job.submission_id is None:
+            encode_reference(job.assignment_id)
+        else:
+            grade_submission(job.submission)
+    except GradingError as e:
+        print(f"Grading failed for {job_label(job)}: {e}")
+        _finish(job, GradingJob.FAILED, str(e))
+    except Exception as e:
+        print(f"Error processing {job_label(job)}: {e}")
+        if job.attempts >= settings.GRADING_MAX_ATTEMPTS:
+            _finish(job, GradingJob.FAILED, str(e))
+        else:
+            job.state = GradingJob.PENDING
+            job.locked_at = None
+            job.last_error = str(e)
+            job.run_after = timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+            job.save(update_fields=['state', 'locked_at', 'last_error', 'run_after', 'updated_at'])
+    else:
+        _finish(job, GradingJob.DONE, '')
+    return job
+
+
+def encode_reference(assignment_id):
+    # Fresh row and a fresh hash of the file: it may have changed since the
+    # job was queued. A reference already encoded for this content is reused.
+    assignment = Assignment.objects.get(id=assignment_id)
+    if get_reference_embedding(assignment, verify=True) is None:
+        raise GradingError(f"No usable teacher file for assignment {assignment_id}")
+
+
+def job_label(job):
+    if job.submission_id is None:
+        return f"reference answer of assignment {job.assignment_id}"
+    return f"submission {job.submission_id}"
+
+
+def _finish(job, state, error):
+    job.state = state
+    job.locked_at = None
+    job.last_error = error
+    job.save(update_fields=['state', 'locked_at', 'last_error', 'updated_at'])
@@ -0,0 +1,108 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+
+
+# Keyword scoring for evaluate_submission. Keywords and text are both split
+# into word tokens, so matches respect word boundaries ("AI" does not match
+# "said") and multi-word keywords match as phrases. An Aho-Corasick automaton
+# over token sequences finds every keyword in one pass over the text.
+
+_WORD = re.compile(r"\w+")
+
+
+def stem(token):
+    """Plural folding so "decisions"/"decision", "studies"/"study" and
+    "analyses"/"analysis" meet; applied identically to keywords and text.
+    Words already ending in "ss", "us" or "is" ("class", "status",
+    "analysis") are left alone rather than clipped."""
+    if len(token) <= 3 or token.endswith(('ss', 'us', 'is')):
+        return token
+    if token.endswith('yses'):
+        return token[:-2] + 'is'
+    if token.endswith('sses'):
+        return token[:-2]
+    if token.endswith('ies') and len(token) > 4:
+        return token[:-3] + 'y'
+    if token.endswith(('xes', 'ches', 'shes')):
+        return token[:-2]
+    if token.endswith('s'):
+        return token[:-1]
+    return token
+
+
+class KeywordMatcher:
+    def __init__(self, keywords, stemming=False):
+        self.keywords = list(keywords)
+        self.stemming = stemming
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [set()]
+        for index, keyword in enumerate(self.keywords):
+            tokens = self._tokens(keyword)
+            if tokens:
+                self._add(tokens, index)
+        self._build_failure_links()
+
+    def _tokens(self, text):
+        tokens = (m.group().lower() for m in _WORD.finditer(text))
+        return [stem(t) for t in tokens] if self.stemming else list(tokens)
+
+    def _add(self, tokens, index):
+        state = 0
+        for token in tokens:
+            if token not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(set())
+                self._goto[state][token] = len(self._goto) - 1
+            state = self._goto[state][token]
+        self._out[state].add(index)
+
+    def _build_failure_links(self):
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for token, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(token, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] |= self._out[self._fail[child]]
+
+    def matches(self, text):
+        """Keywords found in ``text``, in the order they were configured."""
+        found = set()
+        state = 0
+        for m in _WORD.finditer(text):
+            token = m.group().lower()
+            if self.stemming:
+                token = stem(token)
+            while state and token not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(token, 0)
+            if self._out[state]:
+                found |= self._out[state]
+                if len(found) == len(self.keywords):
+                    break
+        return [keyword for index, keyword in enumerate(self.keywords) if index in found]
+
+    def score(self, text):
+        """``(fraction of keywords matched, matched keywords)``."""
+        if not self.keywords:
+            return 0.0, []
+        matched = self.matches(text)
+        return len(matched) / len(self.keywords), matched
+
+
+@lru_cache(maxsize=256)
+def _build(keywords, stemming):
+    return KeywordMatcher(keywords, stemming=stemming)
+
+
+def get_keyword_matcher(keywords):
+    """Matcher for an assignment's ``required_keywords``, built once per
+    distinct keyword list and reused across gradings."""
+    return _build(tuple(keywords), settings.GRADING_KEYWORD_STEMMING)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from main.grading import get_submission_embedding
+from main.models import Submission
+
+
+class Command(BaseCommand):
+    help = 'Compute and store embeddings for submissions that do not have an up-to-date one'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--assignment', type=int, help='Only backfill submissions of this assignment')
+
+    def handle(self, *args, **options):
+        submissions = Submission.objects.exclude(submitted_file='').order_by('id')
+        if options['assignment']:
+            submissions = submissions.filter(assignment_id=options['assignment'])
+
+        stored = skipped = 0
+        for submission in submissions.iterator():
+            if get_submission_embedding(submission) is None:
+                skipped += 1
+                self.stderr.write(f"⚠️ No text for submission {submission.id}, skipped.")
+            else:
+                stored += 1
+        self.stdout.write(self.style.SUCCESS(f"✅ {stored} submission embeddings up to date, {skipped} skipped."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from main.grading import bytes_to_vector
+from main.models import SubmissionEmbedding
+from main.similarity_index import NO_COURSE, get_similarity_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the cross-assignment similarity index from stored submission embeddings'
+
+    def handle(self, *args, **options):
+        rows = SubmissionEmbedding.objects.select_related('submission__assignment__classroom').order_by('submission_id')
+
+        metas, vectors = [], []
+        for row in rows.iterator():
+            assignment = row.submission.assignment
+            course_id = assignment.classroom.course_id
+            metas.append([row.submission_id, assignment.id, assignment.classroom_id, NO_COURSE if course_id is None else course_id])
+            vectors.append(bytes_to_vector(row.vector))
+
+        get_similarity_index().rebuild(metas, vectors)
+        self.stdout.write(self.style.SUCCESS(f"✅ Indexed {len(vectors)} submissions."))
@@ -0,0 +1,158 @@
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main.grading import (
+    INFERENCE_BACKENDS, embed_document_locally, evaluate_submission, extract_text, load_model, submission_file_path,
+)
+from main.models import Submission
+
+
+def current_rss_mb():
+    # Resident set size right now (Linux); peak RSS elsewhere
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def _measure(name, backend, payload):
+    """Load one model/backend and score ``payload`` with it; runs in its own
+    process so the RSS delta is this model's alone."""
+    # Import torch before the first reading so only the model is counted
+    import sentence_transformers  # noqa: F401
+
+    rss_before = current_rss_mb()
+    started = time.perf_counter()
+    model = load_model(name, backend)
+    load_seconds = time.perf_counter() - started
+
+    references = {}
+    latencies = []
+    marks = {}
+    for submission_id, text, reference_text, min_words, keywords, max_marks in payload:
+        if reference_text not in references:
+            references[reference_text] = embed_document_locally(reference_text, model=model)
+        began = time.perf_counter()
+        vector = embed_document_locally(text, model=model)
+        latencies.append((time.perf_counter() - began) * 1000)
+        marks[submission_id], _ = evaluate_submission(
+            text, references[reference_text], min_words, keywords, max_marks, student_embedding=vector,
+        )
+
+    row = {
+        'model': name,
+        'backend': backend,
+        'load_seconds': round(load_seconds, 2),
+        'rss_mb': round(current_rss_mb() - rss_before, 1),
+        'p50_ms': round(statistics.median(latencies), 1),
+        'p95_ms': round(percentile(latencies, 0.95), 1),
+        'docs_per_second': round(len(latencies) / (sum(latencies) / 1000), 2),
+    }
+    return row, marks
+
+
+class Command(BaseCommand):
+    help = ('Score a labelled set of submissions with each inference backend and report latency, '
+            'memory and the marks delta against fp32 torch')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--assignment', type=int, action='append', default=[],
+                            help='Assignment whose submissions form the set (repeatable)')
+        parser.add_argument('--backend', action='append', choices=INFERENCE_BACKENDS, default=[],
+                            help='Backend to compare (repeatable, default: all)')
+        parser.add_argument('--model', action='append', default=[],
+                            help='Extra checkpoint (e.g. a distilled model) to run with the torch backend')
+        parser.add_argument('--limit', type=int, default=200)
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        if not options['assignment']:
+            raise CommandError("Pass at least one --assignment")
+
+        submissions = list(
+            Submission.objects.filter(assignment_id__in=options['assignment'])
+            .select_related('assignment').order_by('id')[:options['limit']]
+        )
+        docs = []
+        reference_texts = {}
+        for submission in submissions:
+            assignment = submission.assignment
+            if assignment.id not in reference_texts:
+                reference_texts[assignment.id] = assignment.reference_text or (
+                    extract_text(os.path.join(settings.MEDIA_ROOT, assignment.file.name)) if assignment.file else ''
+                )
+            path = submission_file_path(submission)
+            text = extract_text(path) if path else ''
+            if text and reference_texts[assignment.id]:
+                docs.append((submission, text))
+        if not docs:
+            raise CommandError("No submissions with extractable text")
+
+        runs = [(settings.GRADING_MODEL_NAME, 'torch')]
+        runs += [(settings.GRADING_MODEL_NAME, b) for b in (options['backend'] or INFERENCE_BACKENDS) if b != 'torch']
+        runs += [(name, 'torch') for name in options['model']]
+
+        # Each backend is measured in a fresh interpreter: memory freed by a
+        # previous model is not returned to the OS, so in-process RSS deltas
+        # after the first run would be meaningless
+        payload = [
+            (s.id, text, reference_texts[s.assignment_id], s.assignment.min_words,
+             s.assignment.required_keywords or ["AI", "making decisions", "recognizing patterns"],
+             s.assignment.max_marks)
+            for s, text in docs
+        ]
+        stored = {s.id: s.marks for s, _ in docs}
+        report = []
+        baseline = None
+        spawn = multiprocessing.get_context('spawn')
+        for name, backend in runs:
+            try:
+                with ProcessPoolExecutor(max_workers=1, mp_context=spawn, initializer=django.setup) as pool:
+                    row, marks = pool.submit(_measure, name, backend, payload).result()
+            except Exception as e:
+                if baseline is None:
+                    raise CommandError(f"Could not run the fp32 baseline {name}: {e}")
+                self.stderr.write(f"❌ {name} ({backend}): {e}")
+                continue
+
+            if baseline is None:
+                baseline = marks
+            deltas = [abs(marks[sid] - baseline[sid]) for sid in marks]
+            row['marks_mae_vs_fp32'] = round(statistics.mean(deltas), 3)
+            row['marks_max_delta_vs_fp32'] = round(max(deltas), 3)
+            labelled = [(marks[sid], stored[sid]) for sid in marks if stored[sid] is not None]
+            row['marks_mae_vs_stored'] = round(statistics.mean(abs(a - b) for a, b in labelled), 3) if labelled else None
+            report.append(row)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'documents': len(docs), 'results': report}, indent=2))
+            return
+        self.stdout.write(f"{len(docs)} submissions scored")
+        header = f"{'model':<40} {'backend':<8} {'load s':>7} {'RSS MB':>8} {'p50 ms':>8} {'p95 ms':>8} {'docs/s':>7} {'MAE':>6} {'max Δ':>6} {'MAE stored':>10}"
+        self.stdout.write(header)
+        for r in report:
+            self.stdout.write(
+                f"{r['model'][-40:]:<40} {r['backend']:<8} {r['load_seconds']:>7} {r['rss_mb']:>8} {r['p50_ms']:>8} "
+                f"{r['p95_ms']:>8} {r['docs_per_second']:>7} {r['marks_mae_vs_fp32']:>6} {r['marks_max_delta_vs_fp32']:>6} "
+                f"{str(r['marks_mae_vs_stored']):>10}"
+            )
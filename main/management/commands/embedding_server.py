@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main.embedding_server import EmbeddingServer
+from main.grading import get_model
+
+
+class Command(BaseCommand):
+    help = 'Serve grading embeddings to all worker processes over a Unix domain socket'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=settings.EMBEDDING_SERVER_SOCKET,
+                            help='Socket path (defaults to EMBEDDING_SERVER_SOCKET)')
+
+    def handle(self, *args, **options):
+        path = options['socket']
+        if not path:
+            raise CommandError("Set EMBEDDING_SERVER_SOCKET or pass --socket")
+
+        get_model()
+        server = EmbeddingServer(path)
+        self.stdout.write(self.style.SUCCESS(f"✅ Embedding server listening on {path}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,19 @@
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from main.course_sync import describe, sync_courses
+
+
+class Command(BaseCommand):
+    help = 'Fetch faculty courses from external API and store in DB'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Course feed URL (default: COURSE_SYNC_URL)')
+        parser.add_argument('--force', action='store_true', help='Download the feed even if it has not changed')
+
+    def handle(self, *args, **options):
+        try:
+            report = sync_courses(url=options['url'], force=options['force'])
+        except (requests.RequestException, OSError, ValueError) as e:
+            raise CommandError(f"❌ Course sync failed: {e}")
+        self.stdout.write(self.style.SUCCESS(f"✅ {describe(report)}"))
@@ -0,0 +1,85 @@
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from main import metrics, text_cache
+from main.grading import encoder
+from main.grading_queue import claim_next_job, job_label, release_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = 'Process queued submission grading jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty instead of polling')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Seconds to wait between polls of an empty queue')
+        parser.add_argument(
+            '--threads', type=int, default=1,
+            help='Jobs graded concurrently; their encodes are batched into shared forward passes',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Grading worker started with {options['threads']} thread(s).")
+        self.processed = 0
+        self.lock = threading.Lock()
+        self.published_at = 0.0
+
+        threads = [
+            threading.Thread(target=self.work, args=(options,), name=f'grade-worker-{i}')
+            for i in range(options['threads'])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.publish(force=True)
+
+        stats = encoder.stats()
+        self.stdout.write(
+            f"Encoder: {stats['batches']} batches, fill ratio {stats['batch_fill_ratio']:.2f}, "
+            f"avg queue wait {stats['avg_queue_wait_ms']:.1f} ms, max {stats['max_queue_wait_ms']:.1f} ms"
+        )
+        cache = text_cache.stats()
+        self.stdout.write(
+            f"Text cache: {cache['hits']} hits, {cache['misses']} misses, hit ratio {cache['hit_ratio']:.2f}, "
+            f"{cache['evictions']} evictions"
+        )
+        for stage, (count, seconds) in sorted(metrics.stage_summary().items()):
+            self.stdout.write(f"Stage {stage}: {count} calls, avg {seconds / count * 1000:.1f} ms")
+        self.stdout.write(self.style.SUCCESS(f"✅ {self.processed} grading jobs processed."))
+
+    def work(self, options):
+        try:
+            while True:
+                release_stale_jobs()
+                job = claim_next_job()
+                if job is None:
+                    if options['once']:
+                        break
+                    self.publish()
+                    time.sleep(options['sleep'])
+                    continue
+
+                job = run_job(job)
+                with self.lock:
+                    self.processed += 1
+                    self.stdout.write(f"{job_label(job).capitalize()}: {job.state} (attempt {job.attempts})")
+                self.publish()
+        finally:
+            connection.close()
+
+    def publish(self, force=False):
+        """Share this worker's counters with /api/metrics (see main/metrics.py)."""
+        with self.lock:
+            now = time.monotonic()
+            if not force and now - self.published_at < settings.METRICS_PUBLISH_SECONDS:
+                return
+            self.published_at = now
+            try:
+                metrics.publish(f'grade_worker-{os.getpid()}')
+            except OSError as e:
+                self.stderr.write(f"Could not publish metrics: {e}")
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main import enrollment
+from main.models import ClassRoom
+
+
+class Command(BaseCommand):
+    help = 'Enroll the students listed in a CSV of roll numbers/emails into a classroom'
+
+    def add_arguments(self, parser):
+        parser.add_argument('roster', help='CSV file with a roll_number or email column (or one identifier per line)')
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--classroom', type=int, help='Classroom id')
+        target.add_argument('--code', help='Classroom join code')
+
+    def handle(self, *args, **options):
+        lookup = {'id': options['classroom']} if options['classroom'] else {'code': options['code']}
+        try:
+            classroom = ClassRoom.objects.get(**lookup)
+        except ClassRoom.DoesNotExist:
+            raise CommandError(f"Classroom {lookup} not found.")
+
+        try:
+            with open(options['roster'], encoding='utf-8-sig') as f:
+                roster = enrollment.parse_roster(f.read())
+        except (OSError, UnicodeDecodeError) as e:
+            raise CommandError(f"Cannot read roster: {e}")
+
+        report = enrollment.enroll(classroom, roster)
+        for row in report['rows']:
+            if row['status'] != enrollment.ENROLLED:
+                self.stderr.write(f"⚠️ Row {row['row']} ({row['identifier']}): {row['status'].replace('_', ' ')}")
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {classroom.name}: {report[enrollment.ENROLLED]} enrolled, "
+            f"{report[enrollment.ALREADY_ENROLLED]} already enrolled, {report[enrollment.NOT_FOUND]} not found, "
+            f"{report[enrollment.DUPLICATE]} duplicates, {report[enrollment.TEACHER]} teacher rows skipped."
+        ))
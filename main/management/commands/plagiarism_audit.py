@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.grading import get_assignment_embeddings
+from main.models import Assignment
+from main.plagiarism import check_plagiarism
+
+
+class Command(BaseCommand):
+    help = 'List every pair of submissions of an assignment above the plagiarism threshold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--assignment', type=int, required=True)
+
+    def handle(self, *args, **options):
+        try:
+            assignment = Assignment.objects.get(id=options['assignment'])
+        except Assignment.DoesNotExist:
+            raise CommandError(f"Assignment {options['assignment']} not found")
+
+        embeddings, names = get_assignment_embeddings(assignment)
+        results = check_plagiarism(embeddings, names)
+        for student1, student2, sim in results:
+            self.stdout.write(f"{student1} <-> {student2}: {sim}% similar")
+        self.stdout.write(self.style.SUCCESS(f"✅ {len(embeddings)} submissions checked, {len(results)} pairs flagged."))
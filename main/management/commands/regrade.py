@@ -0,0 +1,185 @@
+import json
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from main import versioning
+from main.grading import (
+    bytes_to_vector, embed_documents_locally, evaluate_submission, extract_document, file_sha256, get_model,
+    get_reference_embedding, plagiarism_feedback, submission_file_path, truncation_feedback, vector_to_bytes,
+)
+from main.fingerprint import copy_feedback, find_copies, fingerprint_submission
+from main.models import GradingJob, Submission, SubmissionEmbedding
+from main.plagiarism import check_plagiarism
+from main.similarity_index import index_submission
+
+
+def _init_worker():
+    # Spawned workers (Windows/macOS) need Django set up; forked ones already have it
+    import django
+
+    django.setup()
+
+
+def _extract(item):
+    submission_id, path = item
+    if path is None:
+        return submission_id, None, "", ""
+    return (submission_id, file_sha256(path)) + extract_document(path)
+
+
+class Command(BaseCommand):
+    help = ('Regrade every submission of an assignment or classroom: text extraction runs on a process pool, '
+            'missing embeddings are encoded in large batches and marks/feedback are written with bulk_update. '
+            'Interrupted runs resume from a checkpoint.')
+
+    def add_arguments(self, parser):
+        scope = parser.add_mutually_exclusive_group(required=True)
+        scope.add_argument('--assignment', type=int)
+        scope.add_argument('--classroom', type=int)
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help='Extraction worker processes')
+        parser.add_argument('--torch-threads', type=int, default=os.cpu_count() or 1,
+                            help='Torch intra-op threads for encoding in this process')
+        parser.add_argument('--batch-size', type=int, default=64, help='Chunks per forward pass')
+        parser.add_argument('--chunk-size', type=int, default=100, help='Submissions written per bulk_update')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+
+    def handle(self, *args, **options):
+        if options['assignment']:
+            scope = f"assignment-{options['assignment']}"
+            submissions = Submission.objects.filter(assignment_id=options['assignment'])
+        else:
+            scope = f"classroom-{options['classroom']}"
+            submissions = Submission.objects.filter(assignment__classroom_id=options['classroom'])
+        submissions = list(
+            submissions.select_related('assignment__classroom', 'student', 'embedding').order_by('id')
+        )
+        if not submissions:
+            raise CommandError("No submissions to regrade")
+
+        checkpoint_path = os.path.join(settings.REGRADE_CHECKPOINT_DIR, f"{scope}.json")
+        done = set()
+        if os.path.exists(checkpoint_path) and not options['restart']:
+            with open(checkpoint_path) as f:
+                done = set(json.load(f)['done'])
+            self.stdout.write(f"Resuming {scope}: {len(done)} submissions already regraded.")
+
+        started = time.perf_counter()
+        connections.close_all()  # never share DB connections with forked workers
+        with ProcessPoolExecutor(max_workers=options['processes'], initializer=_init_worker) as pool:
+            # Phase 1: make sure every submission has an up-to-date stored embedding
+            embeddings, texts = self.embed(submissions, pool, options)
+            # Phase 2: marks, feedback and plagiarism, written in resumable chunks
+            todo = [s for s in submissions if s.id not in done and s.id in embeddings]
+            regraded = self.grade(todo, embeddings, texts, done, checkpoint_path, scope, options)
+
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        elapsed = time.perf_counter() - started
+        rate = regraded / elapsed if elapsed else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Regraded {regraded} submissions in {elapsed:.1f}s ({rate:.2f} submissions/sec)."
+        ))
+
+    def embed(self, submissions, pool, options):
+        items = [(s.id, submission_file_path(s)) for s in submissions]
+        by_id = {s.id: s for s in submissions}
+        embeddings, texts, stale = {}, {}, []
+        for submission_id, content_hash, text, truncated in pool.map(_extract, items, chunksize=8):
+            if not text:
+                self.stderr.write(f"⚠️ No text for submission {submission_id}, skipped.")
+                continue
+            stored = getattr(by_id[submission_id], 'embedding', None)
+            if stored is not None and stored.content_hash == content_hash:
+                embeddings[submission_id] = bytes_to_vector(stored.vector)
+            else:
+                stale.append((submission_id, content_hash, text))
+            texts[submission_id] = (text, truncated, content_hash)
+
+        if stale:
+            import torch
+
+            torch.set_num_threads(options['torch_threads'])
+            self.stdout.write(f"Encoding {len(stale)} submissions...")
+            # Call the model directly: the shared batching encoder would cap
+            # each forward pass at GRADING_BATCH_MAX_SIZE
+            vectors = embed_documents_locally(
+                [text for _, _, text in stale], model=get_model(), batch_size=options['batch_size'],
+            )
+            rows = []
+            for (submission_id, content_hash, _), vector in zip(stale, vectors):
+                embeddings[submission_id] = vector
+                rows.append(SubmissionEmbedding(
+                    submission_id=submission_id, content_hash=content_hash,
+                    vector=vector_to_bytes(vector), dimensions=vector.shape[0],
+                ))
+            SubmissionEmbedding.objects.bulk_create(
+                rows, update_conflicts=True, unique_fields=['submission'],
+                update_fields=['content_hash', 'vector', 'dimensions', 'updated_at'],
+            )
+        return embeddings, texts
+
+    def grade(self, todo, embeddings, texts, done, checkpoint_path, scope, options):
+        by_assignment = defaultdict(list)
+        for submission in todo:
+            by_assignment[submission.assignment_id].append(submission)
+
+        regraded = 0
+        for submissions in by_assignment.values():
+            assignment = submissions[0].assignment
+            reference = get_reference_embedding(assignment)
+            if reference is None:
+                self.stderr.write(f"❌ No usable teacher file for assignment {assignment.id}, skipped.")
+                continue
+            keywords = assignment.required_keywords or ["AI", "making decisions", "recognizing patterns"]
+
+            # Plagiarism pairs over the whole assignment, computed once
+            peers = Submission.objects.filter(assignment=assignment).select_related('student')
+            names = {p.id: p.student.name for p in peers if p.id in embeddings}
+            results = check_plagiarism({sid: embeddings[sid] for sid in names}, names)
+
+            # Lexical fingerprints of every submission first, so copies are found in both directions
+            signatures = {}
+            for submission in submissions:
+                text, _, content_hash = texts[submission.id]
+                signature = fingerprint_submission(submission, text, content_hash)
+                if signature is not None:
+                    signatures[submission.id] = signature
+
+            for start in range(0, len(submissions), options['chunk_size']):
+                chunk = submissions[start:start + options['chunk_size']]
+                for submission in chunk:
+                    text, truncated, _ = texts[submission.id]
+                    copies = find_copies(submission, signatures[submission.id]) if submission.id in signatures else []
+                    marks, feedback = evaluate_submission(
+                        text, reference, assignment.min_words, keywords, assignment.max_marks,
+                        student_embedding=embeddings[submission.id],
+                    )
+                    submission.marks = marks
+                    submission.feedback = (
+                        feedback + plagiarism_feedback(submission.student.name, results) + copy_feedback(copies)
+                        + truncation_feedback(truncated)
+                    )
+                Submission.objects.bulk_update(chunk, ['marks', 'feedback'])
+                # The regrade supersedes queued or failed grading jobs; running ones finish on their own
+                GradingJob.objects.filter(submission__in=chunk).exclude(state=GradingJob.RUNNING).update(
+                    state=GradingJob.DONE, locked_at=None, last_error='', updated_at=timezone.now(),
+                )
+                versioning.bump(versioning.ASSIGNMENT, [assignment.id])
+                for submission in chunk:
+                    index_submission(submission, embeddings[submission.id])
+
+                done.update(s.id for s in chunk)
+                regraded += len(chunk)
+                os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+                with open(checkpoint_path, 'w') as f:
+                    json.dump({'scope': scope, 'done': sorted(done)}, f)
+                self.stdout.write(f"Assignment {assignment.id}: {regraded}/{len(todo)} regraded")
+        return regraded
@@ -0,0 +1,216 @@
+import hmac
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+
+
+# In-process timing metrics. Grading stages are wrapped in ``timed(stage)``;
+# MetricsMiddleware adds per-view duration and SQL count/time. Totals are kept
+# as Prometheus summaries (count + sum per label set) and served by
+# ``metrics_view``; the stages run during a request are also reported in its
+# Server-Timing header. Each observation is a dict update under a lock.
+#
+# Grading runs in grade_worker processes, not in the web process that serves
+# the scrape, so each worker publishes a JSON snapshot of its counters to
+# METRICS_DIR and ``metrics_view`` adds up every recent snapshot with its own.
+
+_lock = threading.Lock()
+_summaries = {}  # (metric, labels) -> [count, sum]
+_local = threading.local()
+
+HELP = {
+    'course_sync_seconds': 'Time spent fetching and saving the faculty course feed',
+    'encoder_batches_total': 'Forward passes run by the batching encoder',
+    'encoder_items_total': 'Texts encoded by the batching encoder',
+    'encoder_queue_wait_seconds_total': 'Time texts waited for a batching encoder forward pass',
+    'grading_stage_seconds': 'Time spent in each grading stage',
+    'http_request_seconds': 'Time spent handling a request, per view',
+    'http_request_sql_queries': 'SQL queries run while handling a request, per view',
+    'http_request_sql_seconds': 'Time spent in SQL while handling a request, per view',
+    'text_cache_evictions_total': 'Extracted text cache rows evicted',
+    'text_cache_hits_total': 'Extracted text cache hits',
+    'text_cache_misses_total': 'Extracted text cache misses',
+    'text_cache_stores_total': 'Extracted texts stored in the cache',
+}
+
+
+def observe(metric, value, **labels):
+    key = (metric, tuple(sorted(labels.items())))
+    with _lock:
+        summary = _summaries.get(key)
+        if summary is None:
+            _summaries[key] = [1, value]
+        else:
+            summary[0] += 1
+            summary[1] += value
+
+
+@contextmanager
+def timed(stage):
+    """Record the duration of a grading stage, both globally and in the
+    Server-Timing header of the current request (if any)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        observe('grading_stage_seconds', seconds, stage=stage)
+        timings = getattr(_local, 'timings', None)
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def stage_summary():
+    """``{stage: (count, total seconds)}`` for this process."""
+    with _lock:
+        return {
+            dict(labels)['stage']: tuple(summary)
+            for (metric, labels), summary in _summaries.items() if metric == 'grading_stage_seconds'
+        }
+
+
+def snapshot():
+    """This process's summaries and encoder/text-cache counters, as JSON data."""
+    from . import text_cache
+    from .grading import encoder
+
+    with _lock:
+        summaries = [
+            [metric, [list(label) for label in labels], count, total]
+            for (metric, labels), (count, total) in _summaries.items()
+        ]
+    stats = encoder.stats()
+    cache = text_cache.stats()
+    return {
+        'summaries': summaries,
+        'counters': {
+            'encoder_batches_total': stats['batches'],
+            'encoder_items_total': stats['items'],
+            'encoder_queue_wait_seconds_total': stats['avg_queue_wait_ms'] * stats['items'] / 1000,
+            'text_cache_evictions_total': cache['evictions'],
+            'text_cache_hits_total': cache['hits'],
+            'text_cache_misses_total': cache['misses'],
+            'text_cache_stores_total': cache['stores'],
+        },
+    }
+
+
+def publish(name):
+    """Write this process's snapshot to METRICS_DIR/<name>.json for the web
+    processes to include in their scrapes."""
+    directory = Path(settings.METRICS_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'{name}-', suffix='.json.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(snapshot(), f)
+        os.replace(tmp_path, directory / f'{name}.json')
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def published_snapshots():
+    """Snapshots published by other processes within METRICS_STALE_SECONDS."""
+    directory = Path(settings.METRICS_DIR)
+    cutoff = time.time() - settings.METRICS_STALE_SECONDS
+    snapshots = []
+    for path in sorted(directory.glob('*.json')):
+        try:
+            if path.stat().st_mtime < cutoff:
+                continue
+            snapshots.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            continue  # replaced or removed while reading
+    return snapshots
+
+
+def render(snapshots=()):
+    """All metrics in the Prometheus text exposition format: this process's
+    plus the sum of ``snapshots`` from other processes."""
+    summaries = {}
+    counters = {}
+    for snap in [snapshot(), *snapshots]:
+        for metric, labels, count, total in snap['summaries']:
+            summary = summaries.setdefault((metric, tuple(tuple(label) for label in labels)), [0, 0.0])
+            summary[0] += count
+            summary[1] += total
+        for metric, value in snap['counters'].items():
+            counters[metric] = counters.get(metric, 0) + value
+
+    lines = []
+    current = None
+    for (metric, labels), (count, total) in sorted(summaries.items()):
+        if metric != current:
+            current = metric
+            lines.append(f"# HELP {metric} {HELP.get(metric, metric)}")
+            lines.append(f"# TYPE {metric} summary")
+        label_text = ",".join(f'{name}="{value}"' for name, value in labels)
+        label_text = "{" + label_text + "}" if label_text else ""
+        lines.append(f"{metric}_count{label_text} {count}")
+        lines.append(f"{metric}_sum{label_text} {total:.6f}")
+    for metric, value in sorted(counters.items()):
+        lines.append(f"# HELP {metric} {HELP.get(metric, metric)}")
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {value}" if isinstance(value, int) else f"{metric} {value:.6f}")
+    return "\n".join(lines) + "\n"
+
+
+class _QueryTimer:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = _QueryTimer()
+        _local.timings = {}
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(queries):
+                response = self.get_response(request)
+        finally:
+            timings, _local.timings = _local.timings, None
+        seconds = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        observe('http_request_seconds', seconds, view=view, method=request.method)
+        observe('http_request_sql_queries', queries.count, view=view, method=request.method)
+        observe('http_request_sql_seconds', queries.seconds, view=view, method=request.method)
+
+        entries = [f'db;dur={queries.seconds * 1000:.1f};desc="{queries.count} queries"']
+        entries += [f"{stage};dur={value * 1000:.1f}" for stage, value in timings.items()]
+        entries.append(f"total;dur={seconds * 1000:.1f}")
+        response['Server-Timing'] = ", ".join(entries)
+        return response
+
+
+def metrics_view(request):
+    # Scrapers send "Authorization: Bearer <METRICS_TOKEN>"; without a
+    # configured token the endpoint stays closed.
+    expected = f"Bearer {settings.METRICS_TOKEN}"
+    supplied = request.META.get('HTTP_AUTHORIZATION', '')
+    if not settings.METRICS_TOKEN or not hmac.compare_digest(supplied.encode(), expected.encode()):
+        return HttpResponseForbidden()
+    return HttpResponse(render(published_snapshots()), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_submissionembedding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignment',
+            name='reference_embedding',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='assignment',
+            name='reference_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='assignment',
+            name='reference_text',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
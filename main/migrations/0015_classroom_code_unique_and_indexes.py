@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:11
+
+import secrets
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def deduplicate_codes(apps, schema_editor):
+    # The oldest classroom keeps a shared code; later ones get a random suffix
+    ClassRoom = apps.get_model('main', 'ClassRoom')
+    alphabet = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'
+    taken = set(ClassRoom.objects.values_list('code', flat=True))
+    duplicated = ClassRoom.objects.values('code').annotate(n=Count('id')).filter(n__gt=1).values_list('code', flat=True)
+    for code in list(duplicated):
+        for classroom in ClassRoom.objects.filter(code=code).order_by('id')[1:]:
+            new_code = code
+            while new_code in taken:
+                new_code = f"{code[:6]}-{''.join(secrets.choice(alphabet) for _ in range(3))}"
+            taken.add(new_code)
+            print(f"Classroom {classroom.id}: join code {code!r} -> {new_code!r}")
+            classroom.code = new_code
+            classroom.save(update_fields=['code'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_contentversion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_codes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='classroom',
+            name='code',
+            field=models.CharField(max_length=10, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(fields=['classroom', '-created_at'], name='assignment_classroom_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['assignment', '-submitted_at'], name='submission_assignment_recent'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def clear_embeddings(apps, schema_editor):
+    # Embeddings encoded before line breaks were kept between chunk pieces
+    # are re-encoded on demand (or with `manage.py backfill_embeddings`)
+    apps.get_model('main', 'SubmissionEmbedding').objects.all().delete()
+    apps.get_model('main', 'Assignment').objects.update(reference_hash='', reference_embedding=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_gradingjob_reference'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_embeddings, migrations.RunPython.noop),
+    ]
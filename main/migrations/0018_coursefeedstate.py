@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_clear_chunked_embeddings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseFeedState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(max_length=500, unique=True)),
+                ('etag', models.CharField(blank=True, max_length=255)),
+                ('last_modified', models.CharField(blank=True, max_length=64)),
+                ('synced_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
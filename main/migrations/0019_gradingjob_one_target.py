@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0018_coursefeedstate'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='gradingjob',
+            constraint=models.CheckConstraint(condition=models.Q(models.Q(('assignment__isnull', True), ('submission__isnull', False)), models.Q(('assignment__isnull', False), ('submission__isnull', True)), _connector='OR'), name='gradingjob_one_target'),
+        ),
+    ]
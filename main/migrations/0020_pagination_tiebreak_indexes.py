@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0019_gradingjob_one_target'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='assignment',
+            name='assignment_classroom_recent',
+        ),
+        migrations.RemoveIndex(
+            model_name='submission',
+            name='submission_assignment_recent',
+        ),
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(fields=['classroom', '-created_at', '-id'], name='assignment_classroom_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['assignment', '-submitted_at', '-id'], name='submission_assignment_recent'),
+        ),
+    ]
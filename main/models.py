@@ -1,11 +1,14 @@
+import secrets
+
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 User = settings.AUTH_USER_MODEL 
 
 class ClassRoom(models.Model):
     name = models.CharField(max_length=100)
-    code = models.CharField(max_length=10)
+    code = models.CharField(max_length=10, unique=True)  # join code, see generate_join_code()
     created_by = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='created_classes'
     )
@@ -20,6 +23,28 @@ class ClassRoom(models.Model):
         ordering = ['name']
 
 
+JOIN_CODE_ALPHABET = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'  # no 0/O or 1/I
+
+
+def generate_join_code(base=''):
+    """A classroom code no classroom uses yet: ``base`` (e.g. the course code)
+    when it is free, else ``base`` with a random suffix, else fully random."""
+    max_length = ClassRoom._meta.get_field('code').max_length
+    base = base.strip()[:max_length]
+    candidates = [base] if base else []
+    candidates += [f"{base[:max_length - 4]}-{_random_code(3)}" for _ in range(5)] if base else []
+    candidates += [_random_code(8) for _ in range(5)]
+    taken = set(ClassRoom.objects.filter(code__in=candidates).values_list('code', flat=True))
+    for code in candidates:
+        if code not in taken:
+            return code
+    return generate_join_code()
+
+
+def _random_code(length):
+    return ''.join(secrets.choice(JOIN_CODE_ALPHABET) for _ in range(length))
+
+
 class Assignment(models.Model):
     classroom = models.ForeignKey(ClassRoom, on_delete=models.CASCADE, related_name='assignments')
     title = models.CharField(max_length=255)
@@ -32,11 +57,17 @@ class Assignment(models.Model):
     min_words = models.PositiveIntegerField(default=30)
     required_keywords = models.JSONField(default=list, blank=True, help_text="List of keywords required in the submission.")
 
+    # Cached reference answer, filled from `file` once and cleared when it is replaced
+    reference_text = models.TextField(blank=True, editable=False)
+    reference_hash = models.CharField(max_length=64, blank=True, editable=False)
+    reference_embedding = models.BinaryField(null=True, blank=True, editable=False)
+
     def __str__(self):
         return f"{self.title} - {self.classroom.name}"
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['classroom', '-created_at', '-id'], name='assignment_classroom_recent')]
 
 
 class Submission(models.Model):
@@ -48,8 +79,9 @@ class Submission(models.Model):
     feedback = models.TextField(blank=True)
 
     class Meta:
-        unique_together = ('assignment', 'student')
+        unique_together = ('assignment', 'student')  # also the (assignment, student) lookup index
         ordering = ['-submitted_at']
+        indexes = [models.Index(fields=['assignment', '-submitted_at', '-id'], name='submission_assignment_recent')]
 
     def __str__(self):
         return f"Submission by {self.student.username} for {self.assignment.title}"
@@ -66,4 +98,127 @@ class FacultyCourse(models.Model):
     enc_offer_id = models.TextField() 
 
     def __str__(self):
-        return f"{self.course_code} - {self.course_title}"
\ No newline at end of file
+        return f"{self.course_code} - {self.course_title}"
+
+class CourseFeedState(models.Model):
+    # Validators of the last synced course feed, saved in the same
+    # transaction as the courses (see main/course_sync.py)
+    url = models.CharField(max_length=500, unique=True)
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True)
+    synced_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.url
+
+class SubmissionEmbedding(models.Model):
+    # One encoded vector per submission, reused by the plagiarism check.
+    submission = models.OneToOneField(Submission, on_delete=models.CASCADE, related_name='embedding')
+    content_hash = models.CharField(max_length=64)
+    vector = models.BinaryField()
+    dimensions = models.PositiveIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Embedding for submission {self.submission_id}"
+
+
+class GradingJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATE_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    # A job grades a submission, or (with assignment set instead) encodes an
+    # assignment's reference answer
+    submission = models.OneToOneField(
+        Submission, on_delete=models.CASCADE, related_name='grading_job', null=True, blank=True,
+    )
+    assignment = models.OneToOneField(
+        Assignment, on_delete=models.CASCADE, related_name='reference_job', null=True, blank=True,
+    )
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['run_after']
+        indexes = [models.Index(fields=['state', 'run_after'])]
+        constraints = [
+            models.CheckConstraint(
+                condition=(
+                    models.Q(submission__isnull=False, assignment__isnull=True)
+                    | models.Q(submission__isnull=True, assignment__isnull=False)
+                ),
+                name='gradingjob_one_target',
+            ),
+        ]
+
+    def __str__(self):
+        if self.submission_id is None:
+            return f"Reference job for assignment {self.assignment_id} ({self.state})"
+        return f"Grading job for submission {self.submission_id} ({self.state})"
+
+
+class ExtractedText(models.Model):
+    # zlib-compressed extract_text() output, shared by every file with the same content
+    content_hash = models.CharField(max_length=64)
+    extractor_version = models.PositiveIntegerField()
+    data = models.BinaryField()
+    size = models.PositiveIntegerField(help_text="Compressed size in bytes")
+    truncated = models.CharField(max_length=100, blank=True, help_text="Why extraction stopped early, if it did")
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        unique_together = ('content_hash', 'extractor_version')
+
+    def __str__(self):
+        return f"Extracted text {self.content_hash[:12]} (v{self.extractor_version})"
+
+
+class SubmissionFingerprint(models.Model):
+    # MinHash signature of the submission's word shingles (see main/fingerprint.py)
+    submission = models.OneToOneField(Submission, on_delete=models.CASCADE, related_name='fingerprint')
+    content_hash = models.CharField(max_length=64)
+    signature = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Fingerprint for submission {self.submission_id}"
+
+
+class FingerprintBucket(models.Model):
+    # One LSH band of a fingerprint; submissions sharing a bucket are copy candidates
+    submission = models.ForeignKey(Submission, on_delete=models.CASCADE, related_name='fingerprint_buckets')
+    assignment = models.ForeignKey(Assignment, on_delete=models.CASCADE, related_name='+')
+    key = models.BigIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=['assignment', 'key'])]
+
+    def __str__(self):
+        return f"Bucket {self.key} for submission {self.submission_id}"
+
+
+class ContentVersion(models.Model):
+    # Change counter behind the ETags of polled endpoints (see main/versioning.py)
+    scope = models.CharField(max_length=20)
+    object_id = models.PositiveIntegerField()
+    version = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('scope', 'object_id')
+
+    def __str__(self):
+        return f"{self.scope} {self.object_id} v{self.version}"
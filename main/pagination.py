@@ -0,0 +1,40 @@
+from rest_framework.pagination import CursorPagination
+
+
+class OptionalCursorPagination(CursorPagination):
+    """Cursor pagination that applies once the client asks for it with
+    ``?page_size=`` or ``?cursor=``; requests without either keep getting the
+    plain list existing app versions expect."""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.page_size_query_param not in params and self.cursor_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+# Orderings end in the primary key: rows tying on the first field must keep a
+# stable order, or pages would skip or repeat them
+
+class ClassRoomPagination(OptionalCursorPagination):
+    ordering = ('name', 'id')
+
+
+class AssignmentPagination(OptionalCursorPagination):
+    ordering = ('-created_at', '-id')
+
+
+class SubmissionPagination(OptionalCursorPagination):
+    ordering = ('-submitted_at', '-id')
+
+
+class StudentPagination(CursorPagination):
+    # Rosters can be large, so classrooms/{id}/students always paginates.
+    # Usernames are unique.
+    ordering = 'username'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
@@ -0,0 +1,96 @@
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import Q
+from rest_framework.permissions import SAFE_METHODS, BasePermission
+
+from .models import Assignment, ClassRoom, Submission
+
+
+# A user's classroom roles ({classroom id: TEACHER or STUDENT}) are resolved
+# with one query and kept on the request. With a shared CACHES backend
+# (Redis, memcached, file) they are also cached across requests and dropped
+# by the signals in main/signals.py when a roster or a classroom's teacher
+# changes. A per-process cache (the default LocMemCache) is not used: an
+# invalidation there would not reach the other workers.
+
+TEACHER = 'teacher'
+STUDENT = 'student'
+
+
+def _cache_key(user_id):
+    return f'classroom-roles:{user_id}'
+
+
+def _shared_cache():
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache))
+
+
+def classroom_roles(request):
+    """``{classroom id: role}`` for ``request.user``."""
+    roles = getattr(request, '_classroom_roles', None)
+    if roles is not None:
+        return roles
+    user = request.user
+    if not user.is_authenticated:
+        roles = {}
+    else:
+        shared = _shared_cache()
+        roles = cache.get(_cache_key(user.id)) if shared else None
+        if roles is None:
+            rows = ClassRoom.objects.filter(Q(created_by=user) | Q(students=user)).values_list('id', 'created_by_id')
+            roles = {cid: TEACHER if teacher_id == user.id else STUDENT for cid, teacher_id in rows}
+            if shared:
+                cache.set(_cache_key(user.id), roles, settings.CLASSROOM_ROLES_CACHE_SECONDS)
+    request._classroom_roles = roles
+    return roles
+
+
+def role_in(request, classroom_id):
+    """TEACHER, STUDENT or None for ``request.user`` in the classroom."""
+    return classroom_roles(request).get(classroom_id)
+
+
+def invalidate_roles(user_ids):
+    if not _shared_cache():
+        return
+    keys = [_cache_key(user_id) for user_id in set(user_ids) if user_id is not None]
+    cache.delete_many(keys)
+    # Again after commit, in case a concurrent request cached the old roles
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def assignment_classroom_id(request, assignment_id):
+    """Classroom of an assignment, looked up once per request; None when
+    the assignment does not exist."""
+    memo = getattr(request, '_assignment_classrooms', None)
+    if memo is None:
+        memo = request._assignment_classrooms = {}
+    if assignment_id not in memo:
+        memo[assignment_id] = Assignment.objects.filter(id=assignment_id).values_list('classroom_id', flat=True).first()
+    return memo[assignment_id]
+
+
+def classroom_id_of(request, obj):
+    if isinstance(obj, ClassRoom):
+        return obj.id
+    if isinstance(obj, Assignment):
+        return obj.classroom_id
+    if isinstance(obj, Submission):
+        return assignment_classroom_id(request, obj.assignment_id)
+    raise TypeError(f"{type(obj).__name__} is not classroom-scoped")
+
+
+class ClassroomPermission(BasePermission):
+    """Classroom members may read classroom-scoped objects; only the
+    classroom's teacher may change them."""
+    message = "You are not part of this classroom."
+
+    def has_object_permission(self, request, view, obj):
+        role = role_in(request, classroom_id_of(request, obj))
+        if request.method in SAFE_METHODS:
+            return role is not None
+        return role == TEACHER
+
@@ -0,0 +1,46 @@
+import numpy as np
+
+
+PLAGIARISM_THRESHOLD = 0.80
+
+
+def normalized_matrix(vectors):
+    matrix = np.vstack([np.asarray(v, dtype=np.float32).reshape(-1) for v in vectors])
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def check_plagiarism(student_embeddings, submission_id_to_student, target_id=None, threshold=PLAGIARISM_THRESHOLD):
+    """Return ``(student1, student2, similarity %)`` for every pair of
+    submissions whose cosine similarity is above ``threshold``.
+
+    With ``target_id`` only pairs involving that submission are scored, using
+    one matrix-vector product; without it the whole similarity matrix is
+    computed (batch audits). Pairs keep the ``student_embeddings`` order."""
+    ids = list(student_embeddings.keys())
+    if len(ids) < 2:
+        return []
+    matrix = normalized_matrix(student_embeddings[i] for i in ids)
+
+    if target_id is not None:
+        if target_id not in student_embeddings:
+            return []
+        t = ids.index(target_id)
+        sims = matrix @ matrix[t]
+        sims[t] = -1.0
+        pairs = [((j, t) if j < t else (t, j), sims[j]) for j in np.flatnonzero(sims > threshold)]
+        pairs.sort(key=lambda pair: pair[0])
+    else:
+        sims = matrix @ matrix.T
+        rows, cols = np.nonzero(np.triu(sims > threshold, k=1))
+        pairs = [((i, j), sims[i, j]) for i, j in zip(rows, cols)]
+
+    return [
+        (
+            submission_id_to_student.get(ids[i], "Unknown"),
+            submission_id_to_student.get(ids[j], "Unknown"),
+            round(float(sim) * 100, 2),
+        )
+        for (i, j), sim in pairs
+    ]
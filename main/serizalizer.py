@@ -15,6 +15,17 @@ class ClassRoomSerializer(serializers.ModelSerializer):
     class Meta:
         model = ClassRoom
         fields = ['id', 'name', 'code', 'created_by', 'students']
+        extra_kwargs = {'code': {'required': False}}  # generated when omitted
+
+
+class ClassRoomSummarySerializer(serializers.ModelSerializer):
+    # Compact classroom without the roster; see classrooms/{id}/students
+    created_by = UserSerializer(read_only=True)
+    student_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = ClassRoom
+        fields = ['id', 'name', 'code', 'created_by', 'student_count']
 
 
 
@@ -40,11 +51,12 @@ class SubmissionSerializer(serializers.ModelSerializer):
     assignment_id = serializers.PrimaryKeyRelatedField(
         queryset=Assignment.objects.all(), write_only=True, source='assignment'
     )
+    grading_status = serializers.CharField(source='grading_job.state', read_only=True, default=None)
 
     class Meta:
         model = Submission
         fields = [
             'id', 'assignment', 'assignment_id', 'student', 'submitted_file',
-            'submitted_at', 'marks', 'feedback'
+            'submitted_at', 'marks', 'feedback', 'grading_status'
         ]
         #read_only_fields = ['submitted_at', 'marks', 'feedback']
\ No newline at end of file
@@ -0,0 +1,142 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.backends.signals import connection_created
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import versioning
+from .permissions import invalidate_roles
+from .similarity_index import get_similarity_index
+from .models import (
+    Assignment, ClassRoom, FingerprintBucket, GradingJob, Submission, SubmissionEmbedding, SubmissionFingerprint,
+)
+from .serizalizer import UserSerializer
+
+User = get_user_model()
+
+
+@receiver(pre_save, sender=Submission)
+def invalidate_submission_embedding(sender, instance, **kwargs):
+    # Drop the stored vector and fingerprint when the uploaded file is replaced.
+    if not instance.pk:
+        return
+    old_file = Submission.objects.filter(pk=instance.pk).values_list('submitted_file', flat=True).first()
+    if old_file is not None and old_file != instance.submitted_file.name:
+        SubmissionEmbedding.objects.filter(submission_id=instance.pk).delete()
+        SubmissionFingerprint.objects.filter(submission_id=instance.pk).delete()
+        FingerprintBucket.objects.filter(submission_id=instance.pk).delete()
+
+
+@receiver(post_delete, sender=Submission)
+def remove_from_similarity_index(sender, instance, **kwargs):
+    # Deleted submissions must not be reported as sources by similar searches
+    submission_id = instance.pk
+    transaction.on_commit(lambda: get_similarity_index().remove([submission_id]))
+
+
+@receiver(pre_save, sender=Assignment)
+def invalidate_reference_embedding(sender, instance, **kwargs):
+    # A new teacher file means the cached reference text/embedding is stale.
+    if not instance.pk:
+        return
+    old_file = Assignment.objects.filter(pk=instance.pk).values_list('file', flat=True).first()
+    if old_file is not None and old_file != instance.file.name:
+        instance.reference_text = ''
+        instance.reference_hash = ''
+        instance.reference_embedding = None
+
+
+# Change counters for ETags (see main/versioning.py)
+
+@receiver([post_save, post_delete], sender=ClassRoom)
+def classroom_changed(sender, instance, **kwargs):
+    versioning.bump(versioning.CLASSROOM, [instance.pk])
+
+
+@receiver(m2m_changed, sender=ClassRoom.students.through)
+def roster_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        versioning.bump(versioning.CLASSROOM, [instance.pk])
+    elif pk_set:
+        versioning.bump(versioning.CLASSROOM, pk_set)
+    else:  # user.joined_classes.clear()
+        versioning.bump(versioning.CLASSROOM, ClassRoom.objects.filter(students=instance).values_list('id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Assignment)
+def assignment_changed(sender, instance, **kwargs):
+    versioning.bump(versioning.ASSIGNMENT, [instance.pk])
+    versioning.bump(versioning.CLASSROOM, [instance.classroom_id])
+
+
+@receiver([post_save, post_delete], sender=Submission)
+def submission_changed(sender, instance, **kwargs):
+    versioning.bump(versioning.ASSIGNMENT, [instance.assignment_id])
+
+
+@receiver([post_save, post_delete], sender=GradingJob)
+def grading_job_changed(sender, instance, **kwargs):
+    versioning.bump(
+        versioning.ASSIGNMENT,
+        Submission.objects.filter(id=instance.submission_id).values_list('assignment_id', flat=True),
+    )
+
+
+@receiver(post_save, sender=User)
+def profile_changed(sender, instance, created, update_fields=None, **kwargs):
+    # Profiles are nested in classroom payloads; logins and OTP updates are not
+    if created or (update_fields and not set(update_fields) & set(UserSerializer.Meta.fields)):
+        return
+    versioning.bump(
+        versioning.CLASSROOM,
+        ClassRoom.objects.filter(Q(created_by=instance) | Q(students=instance)).values_list('id', flat=True),
+    )
+
+
+# Cached classroom roles (see main/permissions.py)
+
+@receiver(pre_save, sender=ClassRoom)
+def remember_teacher(sender, instance, **kwargs):
+    instance._old_created_by_id = (
+        ClassRoom.objects.filter(pk=instance.pk).values_list('created_by_id', flat=True).first() if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=ClassRoom)
+def teacher_roles_changed(sender, instance, **kwargs):
+    invalidate_roles([instance.created_by_id, getattr(instance, '_old_created_by_id', None)])
+
+
+@receiver(pre_delete, sender=ClassRoom)
+def classroom_roles_removed(sender, instance, **kwargs):
+    # The roster rows are deleted without m2m_changed
+    invalidate_roles([instance.created_by_id, *instance.students.values_list('id', flat=True)])
+
+
+@receiver(m2m_changed, sender=ClassRoom.students.through)
+def student_roles_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        if action.startswith('post_'):
+            invalidate_roles([instance.pk])
+    elif action == 'pre_clear':
+        instance._cleared_student_ids = list(instance.students.values_list('id', flat=True))
+    elif action == 'post_clear':
+        invalidate_roles(getattr(instance, '_cleared_student_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        invalidate_roles(pk_set or [])
+
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    # WAL lets readers run during a write; busy_timeout makes writers wait
+    # for the lock instead of failing (see DATABASES in settings)
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_SECONDS * 1000)}')
+        cursor.execute(f'PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}')
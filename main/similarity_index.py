@@ -0,0 +1,268 @@
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, run a single writer
+    fcntl = None
+
+
+# On-disk approximate nearest-neighbour index over every submission embedding.
+#
+# The index is a snapshot (``index.npz``: normalized vectors, submission /
+# assignment / classroom / course ids and IVF centroids) plus an append-only
+# ``delta.bin`` of inserts made since the snapshot, so an insert is one small
+# append instead of rewriting the whole file. Searches probe the closest
+# ``nprobe`` IVF lists; scopes small enough to scan are searched exactly.
+# Web workers, grade_worker and regrade all write to the same files, so
+# writers hold an exclusive flock on ``index.lock`` and readers a shared one.
+# Deleted submissions are removed by a post_delete signal (main/signals.py),
+# which rewrites the snapshot.
+
+_META = 4  # submission, assignment, classroom, course ids stored per delta record
+NO_COURSE = -1
+
+
+def _kmeans(vectors, k, iterations=10, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(k):
+            members = vectors[assign == c]
+            if len(members):
+                centroid = members.mean(axis=0)
+                centroids[c] = centroid / (np.linalg.norm(centroid) or 1.0)
+    return centroids
+
+
+class SimilarityIndex:
+    def __init__(self, directory, dimensions=None):
+        self.directory = str(directory)
+        self.snapshot_path = os.path.join(self.directory, 'index.npz')
+        self.delta_path = os.path.join(self.directory, 'delta.bin')
+        self.lock_path = os.path.join(self.directory, 'index.lock')
+        self.dimensions = dimensions
+        self.lock = threading.Lock()
+        self._loaded_state = None
+        self._reset()
+
+    def _reset(self):
+        d = self.dimensions or 0
+        self.vectors = np.zeros((0, d), dtype=np.float32)
+        self.meta = np.zeros((0, _META), dtype=np.int64)
+        self.lists = np.zeros(0, dtype=np.int32)
+        self.centroids = np.zeros((0, d), dtype=np.float32)
+        self.trained_size = 0
+
+    # -- persistence -------------------------------------------------------
+
+    @contextmanager
+    def file_lock(self, shared=False):
+        """Cross-process lock on the index files (exclusive for writers)."""
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _disk_state(self):
+        def stat(path):
+            try:
+                st = os.stat(path)
+                return st.st_mtime_ns, st.st_size
+            except FileNotFoundError:
+                return None
+        return stat(self.snapshot_path), stat(self.delta_path)
+
+    def refresh(self):
+        """Reload from disk when another process changed the index."""
+        state = self._disk_state()
+        if state == self._loaded_state:
+            return
+        self._reset()
+        if state[0] is not None:
+            with np.load(self.snapshot_path) as data:
+                self.vectors = data['vectors']
+                self.meta = data['meta']
+                self.lists = data['lists']
+                self.centroids = data['centroids']
+                self.trained_size = int(data['trained_size'])
+            self.dimensions = self.vectors.shape[1] if len(self.vectors) else self.dimensions
+        if state[1] is not None and self.dimensions:
+            record = np.dtype([('meta', np.int64, _META), ('vector', np.float32, self.dimensions)])
+            delta = np.fromfile(self.delta_path, dtype=record)
+            if len(delta):
+                self._add(delta['meta'], delta['vector'])
+        self._loaded_state = self._disk_state()
+
+    def save(self):
+        """Write a fresh snapshot containing the delta and truncate the delta.
+        Callers hold the exclusive file lock and refreshed under it, so no
+        other process's inserts are dropped with the delta."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='index-', suffix='.npz.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(
+                    f, vectors=self.vectors, meta=self.meta, lists=self.lists,
+                    centroids=self.centroids, trained_size=self.trained_size,
+                )
+            os.replace(tmp_path, self.snapshot_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        if os.path.exists(self.delta_path):
+            os.remove(self.delta_path)
+        self._loaded_state = self._disk_state()
+
+    # -- building ----------------------------------------------------------
+
+    def _add(self, metas, vectors):
+        metas = np.asarray(metas, dtype=np.int64).reshape(-1, _META)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(metas), -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors = vectors / norms
+        if not len(self.vectors):
+            self.dimensions = vectors.shape[1]
+            self.vectors = self.vectors.reshape(0, self.dimensions)
+        if len(self.centroids):
+            lists = np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+        else:
+            lists = np.zeros(len(metas), dtype=np.int32)
+
+        # Later records win; re-inserted submissions replace their old row
+        _, last = np.unique(metas[::-1, 0], return_index=True)
+        keep = np.sort(len(metas) - 1 - last)
+        metas, vectors, lists = metas[keep], vectors[keep], lists[keep]
+        stale = np.isin(self.meta[:, 0], metas[:, 0])
+        self.vectors = np.concatenate([self.vectors[~stale], vectors])
+        self.meta = np.concatenate([self.meta[~stale], metas])
+        self.lists = np.concatenate([self.lists[~stale], lists])
+        return vectors
+
+    def train(self):
+        """(Re)build the IVF lists; below IVF_MIN_SIZE the index stays exact."""
+        n = len(self.vectors)
+        if n < settings.SIMILARITY_INDEX_IVF_MIN_SIZE:
+            self.centroids = np.zeros((0, self.vectors.shape[1]), dtype=np.float32)
+            self.lists = np.zeros(n, dtype=np.int32)
+        else:
+            k = max(1, int(np.sqrt(n)))
+            self.centroids = _kmeans(self.vectors, k)
+            self.lists = np.argmax(self.vectors @ self.centroids.T, axis=1).astype(np.int32)
+        self.trained_size = n
+
+    def rebuild(self, metas, vectors):
+        """Replace the whole index, e.g. from every stored embedding."""
+        with self.lock, self.file_lock():
+            self.dimensions = None
+            self._reset()
+            if os.path.exists(self.delta_path):
+                os.remove(self.delta_path)
+            if len(vectors):
+                self._add(metas, vectors)
+            self.train()
+            self.save()
+
+    def insert(self, submission_id, vector, assignment_id, classroom_id, course_id=None):
+        meta = [submission_id, assignment_id, classroom_id, NO_COURSE if course_id is None else course_id]
+        with self.lock, self.file_lock():
+            self.refresh()
+            normalized = self._add(meta, vector)
+            if self._loaded_state[0] is None or len(self.vectors) >= 2 * max(self.trained_size, 1):
+                # First insert, or the lists drifted as the index doubled: retrain and compact.
+                self.train()
+                self.save()
+                return
+            record = np.zeros(1, dtype=[('meta', np.int64, _META), ('vector', np.float32, self.dimensions)])
+            record['meta'][0] = meta
+            record['vector'][0] = normalized[0]
+            with open(self.delta_path, 'ab') as f:
+                f.write(record.tobytes())
+            self._loaded_state = self._disk_state()
+
+    def remove(self, submission_ids):
+        """Drop ``submission_ids`` from the index (deleted submissions)."""
+        if self._disk_state() == (None, None):
+            return  # no index on disk yet
+        with self.lock, self.file_lock():
+            self.refresh()
+            stale = np.isin(self.meta[:, 0], list(submission_ids))
+            if not stale.any():
+                return
+            self.vectors = self.vectors[~stale]
+            self.meta = self.meta[~stale]
+            self.lists = self.lists[~stale]
+            self.save()
+
+    # -- querying ----------------------------------------------------------
+
+    def search(self, vector, k=5, classroom_id=None, course_id=None, assignment_id=None, exclude_ids=(), nprobe=None,
+               classroom_ids=None, before_id=None):
+        """Top-``k`` ``(submission_id, similarity)`` pairs, most similar first,
+        optionally limited to ``classroom_ids`` and to submissions created
+        before submission ``before_id`` (ids grow with upload order)."""
+        with self.lock:
+            with self.file_lock(shared=True):
+                self.refresh()
+            if not len(self.vectors):
+                return []
+            query = np.asarray(vector, dtype=np.float32).reshape(-1)
+            query = query / (np.linalg.norm(query) or 1.0)
+
+            mask = np.ones(len(self.vectors), dtype=bool)
+            if assignment_id is not None:
+                mask &= self.meta[:, 1] == assignment_id
+            if classroom_id is not None:
+                mask &= self.meta[:, 2] == classroom_id
+            if course_id is not None:
+                mask &= self.meta[:, 3] == course_id
+            if classroom_ids is not None:
+                mask &= np.isin(self.meta[:, 2], list(classroom_ids))
+            if exclude_ids:
+                mask &= ~np.isin(self.meta[:, 0], list(exclude_ids))
+            if before_id is not None:
+                mask &= self.meta[:, 0] < before_id
+
+            # Probe only the closest IVF lists unless the scope is small enough to scan
+            if len(self.centroids) and mask.sum() > settings.SIMILARITY_INDEX_EXACT_SCAN_SIZE:
+                nprobe = nprobe or settings.SIMILARITY_INDEX_NPROBE
+                probe = np.argsort(-(self.centroids @ query))[:nprobe]
+                mask &= np.isin(self.lists, probe)
+
+            rows = np.flatnonzero(mask)
+            if not len(rows):
+                return []
+            sims = self.vectors[rows] @ query
+            top = np.argsort(-sims)[:k] if len(rows) <= k else np.argpartition(-sims, k)[:k]
+            top = top[np.argsort(-sims[top])]
+            return [(int(self.meta[rows[i], 0]), float(sims[i])) for i in top]
+
+
+_index = None
+
+
+def get_similarity_index():
+    global _index
+    if _index is None:
+        _index = SimilarityIndex(settings.SIMILARITY_INDEX_DIR)
+    return _index
+
+
+def index_submission(submission, vector):
+    classroom = submission.assignment.classroom
+    get_similarity_index().insert(
+        submission.id, vector, submission.assignment_id, classroom.id, classroom.course_id,
+    )
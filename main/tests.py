@@ -1,7 +1,1394 @@
-from .models import Submission
+import io
+import json
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
+import time
+import zlib
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
 
-sub = Submission.objects.filter(
-    assignment__classroom__students__id=1,
-    status='submitted'
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models.functions import Lower
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import fingerprint, metrics, text_cache
+from .batching import BatchingEncoder
+from .course_sync import iter_json_array, sync_courses
+from .embedding_server import EmbeddingClient, EmbeddingServer, ServerUnavailable
+from .fingerprint import fingerprint_submission
+from .grading import (
+    GradingError, bytes_to_vector, embed_document, embed_documents_locally, extract_document, file_sha256,
+    get_submission_embedding, grade_submission, iter_chunks, vector_to_bytes,
+)
+from .grading_queue import claim_next_job, enqueue_grading, enqueue_reference, release_stale_jobs, run_job
+from .keywords import KeywordMatcher, stem
+from .models import (
+    Assignment, ClassRoom, CourseFeedState, ExtractedText, FacultyCourse, FingerprintBucket, GradingJob, Submission,
+    SubmissionEmbedding, SubmissionFingerprint,
+    generate_join_code,
 )
-print(sub)
\ No newline at end of file
+from .plagiarism import check_plagiarism
+from .similarity_index import SimilarityIndex
+
+User = get_user_model()
+
+
+class QueryCountTests(TestCase):
+    """List endpoints must not issue a query per classroom, student or
+    submission: the counts below hold whatever the class size. Each includes
+    the one classroom roles query per request (see main/permissions.py)."""
+
+    def setUp(self):
+        cache.clear()  # cached classroom roles outlive the rolled-back rows
+        self.teacher = User.objects.create(username='teacher', email='teacher@example.com', name='Teacher')
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+
+    def add_classroom(self, students):
+        classroom = ClassRoom.objects.create(name=f'Class {students}', code=f'C{students}', created_by=self.teacher)
+        assignment = Assignment.objects.create(classroom=classroom, title='Essay', description='Write')
+        for i in range(students):
+            student = User.objects.create(
+                username=f'c{classroom.id}s{i}', email=f'c{classroom.id}s{i}@example.com', name=f'Student {i}',
+            )
+            classroom.students.add(student)
+            submission = Submission.objects.create(
+                assignment=assignment, student=student, submitted_file=f'submissions/{classroom.id}-{i}.txt',
+            )
+            GradingJob.objects.create(submission=submission)
+        Assignment.objects.create(classroom=classroom, title='Quiz', description='Answer')
+        return classroom, assignment
+
+    def assertConstantQueries(self, count, url_for_size):
+        for size in (2, 12):
+            url = url_for_size(size)
+            self.client.get(url)
+            with self.assertNumQueries(count):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_classroom_list(self):
+        self.add_classroom(2)
+        self.add_classroom(12)
+        self.client.get('/api/classclassrooms/')
+        # roles, classrooms, students
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/classclassrooms/')
+        self.assertEqual(len(response.json()), 2)
+
+    def test_my_classes(self):
+        self.add_classroom(2)
+        self.add_classroom(12)
+        joined = ClassRoom.objects.create(name='Other', code='OTHER', created_by=User.objects.create(
+            username='other', email='other@example.com'))
+        joined.students.add(self.teacher)
+        self.client.get('/api/classclassrooms/my-classes/')
+        # roles, ETag versions, created and joined classrooms, each with their students
+        with self.assertNumQueries(6):
+            response = self.client.get('/api/classclassrooms/my-classes/')
+        self.assertEqual(len(response.json()['created_classes']), 2)
+        self.assertEqual(len(response.json()['joined_classes']), 1)
+
+    def test_classroom_assignments(self):
+        classrooms = {size: self.add_classroom(size)[0] for size in (2, 12)}
+        # roles, ETag version, assignments with their classroom
+        self.assertConstantQueries(3, lambda size: f'/api/classclassrooms/{classrooms[size].id}/assignments/')
+
+    def test_submission_list(self):
+        assignments = {size: self.add_classroom(size)[1] for size in (2, 12)}
+        # roles, assignment's classroom, ETag versions,
+        # submissions with student, assignment and grading job
+        self.assertConstantQueries(4, lambda size: f'/api/classsubmissions/?assignment_id={assignments[size].id}')
+
+    def test_submission_list_for_student(self):
+        classroom, assignment = self.add_classroom(12)
+        self.client.force_authenticate(classroom.students.first())
+        self.client.get(f'/api/classsubmissions/?assignment_id={assignment.id}')
+        # roles, assignment's classroom, ETag versions, own submission
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/classsubmissions/?assignment_id={assignment.id}')
+        self.assertEqual(len(response.json()), 1)
+
+
+class ClassRoomPayloadTests(TestCase):
+    def setUp(self):
+        cache.clear()  # cached classroom roles outlive the rolled-back rows
+        self.teacher = User.objects.create(username='teacher', email='teacher@example.com', name='Teacher')
+        self.classroom = ClassRoom.objects.create(name='Biology', code='BIO1', created_by=self.teacher)
+        for i in range(5):
+            self.classroom.students.add(User.objects.create(username=f's{i}', email=f's{i}@example.com'))
+        other = ClassRoom.objects.create(name='Chemistry', code='CHE1', created_by=User.objects.create(
+            username='other', email='other@example.com'))
+        other.students.add(self.teacher, User.objects.get(username='s0'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+
+    def test_compact_classrooms_count_students(self):
+        response = self.client.get('/api/classclassrooms/my-classes/?compact=1')
+        created, joined = response.json()['created_classes'], response.json()['joined_classes']
+        self.assertEqual([(c['name'], c['student_count']) for c in created], [('Biology', 5)])
+        self.assertEqual([(c['name'], c['student_count']) for c in joined], [('Chemistry', 2)])
+        self.assertNotIn('students', created[0])
+
+    def test_lists_paginate_only_when_asked(self):
+        self.assertIsInstance(self.client.get('/api/classclassrooms/').json(), list)
+        page = self.client.get('/api/classclassrooms/?page_size=1&compact=1').json()
+        self.assertEqual([c['name'] for c in page['results']], ['Biology'])
+        page = self.client.get(page['next']).json()
+        self.assertEqual([c['name'] for c in page['results']], ['Chemistry'])
+        self.assertIsNone(page['next'])
+
+    def test_classrooms_sharing_a_name_are_paged_once(self):
+        expected = {self.classroom.id} | {
+            ClassRoom.objects.create(name='Biology', code=f'BIO{i + 2}', created_by=self.teacher).id
+            for i in range(4)
+        }
+        url, seen = '/api/classclassrooms/?page_size=2&compact=1', []
+        while url:
+            page = self.client.get(url).json()
+            seen += [c['id'] for c in page['results'] if c['name'] == 'Biology']
+            url = page['next']
+        self.assertEqual(sorted(seen), sorted(expected))
+
+    def test_student_roster_is_paginated(self):
+        url = f'/api/classclassrooms/{self.classroom.id}/students/?page_size=2'
+        usernames = []
+        while url:
+            page = self.client.get(url).json()
+            usernames += [s['username'] for s in page['results']]
+            url = page['next']
+        self.assertEqual(usernames, ['s0', 's1', 's2', 's3', 's4'])
+
+        self.client.force_authenticate(User.objects.get(username='other'))
+        response = self.client.get(f'/api/classclassrooms/{self.classroom.id}/students/')
+        self.assertEqual(response.status_code, 403)
+
+
+class ConditionalRequestTests(TestCase):
+    def setUp(self):
+        cache.clear()  # cached classroom roles outlive the rolled-back rows
+        self.teacher = User.objects.create(username='teacher', email='teacher@example.com', name='Teacher')
+        self.student = User.objects.create(username='student', email='student@example.com', name='Student')
+        self.classroom = ClassRoom.objects.create(name='Biology', code='BIO1', created_by=self.teacher)
+        self.classroom.students.add(self.student)
+        self.assignment = Assignment.objects.create(classroom=self.classroom, title='Essay', description='Write')
+        self.submission = Submission.objects.create(
+            assignment=self.assignment, student=self.student, submitted_file='submissions/a.txt',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+        self.url = f'/api/classsubmissions/?assignment_id={self.assignment.id}'
+
+    def revalidate(self, url):
+        etag = self.client.get(url)['ETag']
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code
+
+    def test_unchanged_submissions_are_not_modified(self):
+        response = self.client.get(self.url)
+        with self.assertNumQueries(2):
+            cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+    def test_writes_change_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.submission.marks = 7
+        self.submission.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get('/api/classclassrooms/my-classes/')['ETag']
+        self.classroom.students.add(User.objects.create(username='new', email='new@example.com'))
+        response = self.client.get('/api/classclassrooms/my-classes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        assignments_url = f'/api/classclassrooms/{self.classroom.id}/assignments/'
+        self.assertEqual(self.revalidate(assignments_url), 304)
+        etag = self.client.get(assignments_url)['ETag']
+        Assignment.objects.create(classroom=self.classroom, title='Quiz', description='Answer')
+        self.assertEqual(self.client.get(assignments_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_is_per_user(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.force_authenticate(self.student)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_responses_are_compressed(self):
+        for i in range(20):
+            self.classroom.students.add(User.objects.create(username=f's{i}', email=f's{i}@example.com'))
+        response = self.client.get('/api/classclassrooms/my-classes/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            self.client.get('/api/classclassrooms/my-classes/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304,
+        )
+
+
+class ClassroomPermissionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create(username='teacher', email='teacher@example.com')
+        self.student = User.objects.create(username='student', email='student@example.com')
+        self.classroom = ClassRoom.objects.create(name='Biology', code='BIO1', created_by=self.teacher)
+        self.assignment = Assignment.objects.create(classroom=self.classroom, title='Essay', description='Write')
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+        self.url = f'/api/classclassrooms/{self.classroom.id}/assignments/'
+
+    def test_roles_are_looked_up_per_request_without_a_shared_cache(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        with self.assertNumQueries(2):  # roles, existence check
+            self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.classroom.students.add(self.student)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_roles_are_cached_and_invalidated_by_roster_changes(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory.name,
+        }})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        with self.assertNumQueries(1):  # existence check only; roles come from the cache
+            self.assertEqual(self.client.get(self.url).status_code, 403)
+
+        self.client.post('/api/classclassrooms/join/', {'code': 'BIO1'})
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        self.classroom.students.remove(self.student)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+        self.student.joined_classes.add(self.classroom)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.classroom.students.clear()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_only_the_teacher_changes_classroom_objects(self):
+        self.classroom.students.add(self.student)
+        self.assertEqual(self.client.get(f'/api/classassignments/{self.assignment.id}/').status_code, 200)
+        response = self.client.patch(f'/api/classassignments/{self.assignment.id}/', {'title': 'Mine'})
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post('/api/classassignments/', {
+            'title': 'New', 'description': 'x', 'classroom_id': self.classroom.id,
+        })
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.delete(f'/api/classclassrooms/{self.classroom.id}/').status_code, 403)
+
+        self.client.force_authenticate(self.teacher)
+        response = self.client.patch(f'/api/classassignments/{self.assignment.id}/', {'title': 'Essay 2'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_outsiders_see_no_classroom_objects(self):
+        self.assertEqual(self.client.get('/api/classclassrooms/').json(), [])
+        self.assertEqual(self.client.get('/api/classassignments/').json(), [])
+        self.assertEqual(self.client.get(f'/api/classclassrooms/{self.classroom.id}/students/').status_code, 403)
+        self.assertEqual(self.client.get('/api/classclassrooms/999/students/').status_code, 404)
+
+
+class IndexUsageTests(TestCase):
+    """The hot lookups must be index searches, and the ordered lists must be
+    read in index order instead of sorted (SQLite and PostgreSQL plans)."""
+
+    def assertUsesIndex(self, queryset, name=None, ordered=False):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')  # empty test tables would be scanned
+        plan = queryset.explain()
+        if connection.vendor == 'sqlite':
+            self.assertRegex(plan, r'SEARCH \w+ USING (COVERING )?INDEX', plan)
+            if ordered:
+                self.assertNotIn('TEMP B-TREE', plan)
+        else:
+            self.assertIn('Index', plan)
+            if ordered:
+                self.assertNotIn('Sort', plan)
+        if name:
+            self.assertIn(name, plan)
+
+    def test_join_code_lookup(self):
+        self.assertUsesIndex(ClassRoom.objects.filter(code='BIO1').order_by())
+
+    def test_submissions_by_assignment(self):
+        self.assertUsesIndex(
+            Submission.objects.filter(assignment_id=1).order_by('-submitted_at', '-id'),
+            name='submission_assignment_recent', ordered=True,
+        )
+        self.assertUsesIndex(Submission.objects.filter(assignment_id=1, student_id=1))
+
+    def test_roster_email_lookup(self):
+        self.assertUsesIndex(
+            User.objects.annotate(email_lower=Lower('email')).filter(email_lower__in=['a@example.com', 'b@example.com']),
+            name='user_email_lower',
+        )
+
+    def test_assignments_by_classroom(self):
+        self.assertUsesIndex(
+            Assignment.objects.filter(classroom_id=1).order_by('-created_at', '-id'),
+            name='assignment_classroom_recent', ordered=True,
+        )
+
+
+class JoinCodeTests(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create(username='teacher', email='teacher@example.com')
+
+    def test_generated_codes_are_unique(self):
+        self.assertEqual(generate_join_code('CS-101'), 'CS-101')
+        ClassRoom.objects.create(name='A', code='CS-101', created_by=self.teacher)
+        code = generate_join_code('CS-101')
+        self.assertRegex(code, r'^CS-101-\w{3}$')
+        self.assertLessEqual(len(generate_join_code('A-VERY-LONG-COURSE-CODE')), 10)
+
+    def test_api_generates_a_code_when_omitted(self):
+        client = APIClient()
+        client.force_authenticate(self.teacher)
+        first = client.post('/api/classclassrooms/', {'name': 'Biology', 'code': 'BIO1'}).json()
+        self.assertEqual(first['code'], 'BIO1')
+        self.assertEqual(client.post('/api/classclassrooms/', {'name': 'Again', 'code': 'BIO1'}).status_code, 400)
+        second = client.post('/api/classclassrooms/', {'name': 'Chemistry'}).json()
+        self.assertEqual(len(second['code']), 8)
+
+
+class EnrollmentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create(username='teacher', email='teacher@example.com')
+        self.classroom = ClassRoom.objects.create(name='Biology', code='BIO1', created_by=self.teacher)
+        self.students = [
+            User.objects.create(username=f's{i}', email=f's{i}@example.com', roll_number=f'R{i}') for i in range(50)
+        ]
+        self.classroom.students.add(self.students[0])
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+        self.url = f'/api/classclassrooms/{self.classroom.id}/enroll/'
+
+    def test_bulk_enroll_reports_every_row(self):
+        roster = 'name,roll_number\n' + '\n'.join(f'Student {i},R{i}' for i in range(50)) + '\nGhost,R999\nAgain,R1\n'
+        # A fixed number of queries whatever the roster size: roles, classroom,
+        # user lookup, existing rows, then insert and version bump in a savepoint
+        with self.assertNumQueries(9):
+            report = self.client.post(self.url, {'roster': roster}).json()
+        self.assertEqual(report['enrolled'], 49)
+        self.assertEqual(report['already_enrolled'], 1)
+        self.assertEqual(report['not_found'], 1)
+        self.assertEqual(report['duplicate'], 1)
+        self.assertEqual(report['rows'][50], {'row': 52, 'identifier': 'R999', 'status': 'not_found', 'user_id': None})
+        self.assertEqual(self.classroom.students.count(), 50)
+
+    def test_emails_and_role_cache(self):
+        student = self.students[1]
+        student_client = APIClient()
+        student_client.force_authenticate(student)
+        assignments = f'/api/classclassrooms/{self.classroom.id}/assignments/'
+        self.assertEqual(student_client.get(assignments).status_code, 403)
+
+        report = self.client.post(self.url, {'students': ['S1@Example.com', 'teacher@example.com']}, format='json').json()
+        self.assertEqual([row['status'] for row in report['rows']], ['enrolled', 'teacher'])
+        self.assertEqual(student_client.get(assignments).status_code, 200)
+
+    def test_import_roster_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write('email\ns1@example.com\ns0@example.com\nteacher@example.com\n')
+        self.addCleanup(os.remove, f.name)
+        out = io.StringIO()
+        call_command('import_roster', f.name, code='BIO1', stdout=out, stderr=io.StringIO())
+        self.assertIn(
+            '1 enrolled, 1 already enrolled, 0 not found, 0 duplicates, 1 teacher rows skipped.', out.getvalue(),
+        )
+
+    def test_only_the_teacher_enrolls(self):
+        client = APIClient()
+        client.force_authenticate(self.students[0])
+        self.assertEqual(client.post(self.url, {'students': ['R1']}, format='json').status_code, 403)
+        self.assertEqual(self.client.post(self.url, {}).status_code, 400)
+
+
+class FakeTokenizer:
+    # One token per character, so like byte-level BPE the separators between
+    # words and lines are tokens of their own
+    def __call__(self, text, **kwargs):
+        return {'input_ids': [ord(c) for c in text]}
+
+    def decode(self, ids):
+        return ''.join(map(chr, ids))
+
+
+class FakeModel:
+    """Stands in for the SentenceTransformer: a bag-of-words vector of each text."""
+    max_seq_length = 512
+    tokenizer = FakeTokenizer()
+
+    def __init__(self):
+        self.encoded = []
+        self.batches = []
+
+    def encode(self, texts, batch_size=None):
+        self.encoded += texts
+        self.batches.append(len(texts))
+        vectors = np.zeros((len(texts), 64), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[row, zlib.crc32(word.strip('.,').encode()) % 64] += 1
+        return vectors
+
+
+class BatchingEncoderTests(SimpleTestCase):
+    def make_encoder(self, **kwargs):
+        self.batches = []
+
+        def encode_batch(texts):
+            self.batches.append(list(texts))
+            return [[float(len(text))] for text in texts]
+
+        return BatchingEncoder(encode_batch, **kwargs)
+
+    def encode_concurrently(self, encoder, texts):
+        results, errors = {}, {}
+        barrier = threading.Barrier(len(texts))
+
+        def call(text):
+            barrier.wait()
+            try:
+                results[text] = encoder.encode(text)
+            except Exception as e:
+                errors[text] = e
+
+        threads = [threading.Thread(target=call, args=(text,)) for text in texts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def test_concurrent_callers_share_one_forward_pass(self):
+        encoder = self.make_encoder(max_batch_size=4, window_ms=5000)
+        texts = ['a', 'bb', 'ccc', 'dddd']
+        started = time.perf_counter()
+        results, errors = self.encode_concurrently(encoder, texts)
+        self.assertLess(time.perf_counter() - started, 5)  # flushed on size, not the window
+        self.assertEqual(errors, {})
+        self.assertEqual(len(self.batches), 1)
+        self.assertCountEqual(self.batches[0], texts)
+        for text in texts:
+            self.assertEqual(results[text].tolist(), [len(text)])
+
+    def test_partial_batch_is_flushed_after_the_window(self):
+        encoder = self.make_encoder(max_batch_size=16, window_ms=50)
+        started = time.perf_counter()
+        self.assertEqual(encoder.encode('abc').tolist(), [3])
+        self.assertGreaterEqual(time.perf_counter() - started, 0.05)
+        self.assertEqual(self.batches, [['abc']])
+
+    def test_results_keep_the_callers_order_across_batches(self):
+        encoder = self.make_encoder(max_batch_size=2, window_ms=10)
+        vectors = encoder.encode_many(['a', 'bb', 'ccc'])
+        self.assertEqual(vectors.tolist(), [[1], [2], [3]])
+        self.assertEqual(self.batches, [['a', 'bb'], ['ccc']])
+
+        stats = encoder.stats()
+        self.assertEqual((stats['batches'], stats['items']), (2, 3))
+        self.assertEqual(stats['batch_fill_ratio'], 0.75)
+        self.assertGreater(stats['avg_queue_wait_ms'], 0)
+        self.assertGreaterEqual(stats['max_queue_wait_ms'], stats['avg_queue_wait_ms'])
+
+    def test_errors_reach_every_waiter(self):
+        encoder = BatchingEncoder(mock.Mock(side_effect=RuntimeError("model busy")), max_batch_size=3, window_ms=5000)
+        results, errors = self.encode_concurrently(encoder, ['a', 'b', 'c'])
+        self.assertEqual(results, {})
+        self.assertEqual(sorted(errors), ['a', 'b', 'c'])
+        self.assertTrue(all(str(e) == "model busy" for e in errors.values()))
+        self.assertEqual(encoder.stats()['batches'], 0)
+
+
+class EmbeddingServerTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = str(Path(directory.name) / 'embed.sock')
+
+    def test_missing_socket_falls_back_to_in_process_encoding(self):
+        with (
+            override_settings(EMBEDDING_SERVER_SOCKET=self.path),
+            mock.patch('main.grading.embed_document_locally', return_value=np.ones(3, dtype=np.float32)) as local,
+        ):
+            self.assertEqual(embed_document("Some text").tolist(), [1, 1, 1])
+            with mock.patch('socket.socket', side_effect=AssertionError("reconnected while marked down")):
+                embed_document("More text")
+        self.assertEqual(local.call_count, 2)
+
+    def test_refused_connection_falls_back_to_in_process_encoding(self):
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.path)  # the file of a server that is gone: connects are refused
+        stale.close()
+        client = EmbeddingClient(self.path)
+        with self.assertRaises(ServerUnavailable):
+            client.embed("Some text")
+        with (
+            override_settings(EMBEDDING_SERVER_SOCKET=self.path),
+            mock.patch('main.grading.embed_document_locally', return_value=np.ones(3, dtype=np.float32)),
+        ):
+            self.assertEqual(embed_document("Some text").tolist(), [1, 1, 1])
+
+    def test_round_trip_through_a_server(self):
+        server = EmbeddingServer(self.path)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        def local(text, pooling=None):
+            if text == "fail":
+                raise ValueError("bad input")
+            return None if not text else np.array([len(text), pooling == 'max'], dtype=np.float32)
+
+        client = EmbeddingClient(self.path)
+        with mock.patch('main.grading.embed_document_locally', side_effect=local):
+            self.assertEqual(client.embed("four").tolist(), [4, 0])
+            self.assertEqual(client.embed("sixsix", pooling='max').tolist(), [6, 1])  # same connection
+            self.assertIsNone(client.embed(""))
+            with self.assertRaisesMessage(RuntimeError, "bad input"):
+                client.embed("fail")
+            self.assertEqual(client.embed("ok").tolist(), [2, 0])
+
+
+class EmbeddingStoreTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = Path(media.name)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        teacher = User.objects.create(username='teacher', email='teacher@example.com')
+        classroom = ClassRoom.objects.create(name='Biology', code='BIO1', created_by=teacher)
+        self.assignment = Assignment.objects.create(classroom=classroom, title='Essay', description='Write')
+        self.encoded = []
+        patcher = mock.patch('main.grading.embed_document', side_effect=self.fake_embed)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fake_embed(self, pieces, pooling=None):
+        text = pieces if isinstance(pieces, str) else "\n".join(pieces)
+        if not text:
+            return None  # as the model path does for empty documents
+        self.encoded.append(text)
+        return np.array([len(text), 1], dtype=np.float32)
+
+    def add_submission(self, name, text):
+        path = self.media / f'submissions/{name}.txt'
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(text)
+        student = User.objects.create(username=name, email=f'{name}@example.com')
+        return Submission.objects.create(assignment=self.assignment, student=student, submitted_file=f'submissions/{name}.txt')
+
+    def test_unchanged_file_reuses_the_stored_vector(self):
+        submission = self.add_submission('alice', "First answer")
+        self.assertEqual(get_submission_embedding(submission).tolist(), [12, 1])
+        self.assertEqual(get_submission_embedding(submission).tolist(), [12, 1])
+        self.assertEqual(self.encoded, ["First answer"])
+        self.assertEqual(SubmissionEmbedding.objects.get(submission=submission).dimensions, 2)
+
+    def test_changed_content_is_encoded_again(self):
+        submission = self.add_submission('alice', "First answer")
+        get_submission_embedding(submission)
+        (self.media / 'submissions/alice.txt').write_text("A longer second answer")
+        self.assertEqual(get_submission_embedding(submission).tolist(), [22, 1])
+        self.assertEqual(len(self.encoded), 2)
+        self.assertEqual(SubmissionEmbedding.objects.count(), 1)
+
+    def test_replacing_the_file_drops_the_stored_vector(self):
+        submission = self.add_submission('alice', "First answer")
+        get_submission_embedding(submission)
+        submission.save()  # same file: kept
+        self.assertTrue(SubmissionEmbedding.objects.filter(submission=submission).exists())
+        submission.submitted_file = 'submissions/other.txt'
+        submission.save()
+        self.assertFalse(SubmissionEmbedding.objects.filter(submission=submission).exists())
+
+    def test_backfill_fills_missing_rows(self):
+        done = self.add_submission('alice', "First answer")
+        get_submission_embedding(done)
+        missing = self.add_submission('bob', "Second answer")
+        empty = self.add_submission('carol', "")
+        out, err = io.StringIO(), io.StringIO()
+        call_command('backfill_embeddings', stdout=out, stderr=err)
+        self.assertEqual(
+            set(SubmissionEmbedding.objects.values_list('submission_id', flat=True)), {done.id, missing.id},
+        )
+        self.assertEqual(self.encoded, ["First answer", "Second answer"])
+        self.assertIn("2 submission embeddings up to date, 1 skipped", out.getvalue())
+        self.assertIn(f"submission {empty.id}", err.getvalue())
+
+
+class ChunkingTests(TestCase):
+    def test_line_breaks_between_pieces_are_kept(self):
+        chunks = list(iter_chunks(["The quick brown", "", "fox jumps"], model=FakeModel()))
+        self.assertEqual(chunks, [("The quick brown\nfox jumps", 25)])
+
+    def test_windows_share_the_overlap(self):
+        chunks = list(iter_chunks(["abcdefghij"], max_tokens=4, overlap=1, model=FakeModel()))
+        self.assertEqual(chunks, [("abcd", 4), ("defg", 4), ("ghij", 4)])
+
+    def test_bulk_embedding_uses_the_requested_batch_size(self):
+        # regrade --batch-size: with an explicit model the batches are not
+        # capped by the shared encoder's GRADING_BATCH_MAX_SIZE
+        model = FakeModel()
+        documents = ["word " * 400 for _ in range(20)]
+        with override_settings(GRADING_CHUNK_OVERLAP_TOKENS=0):
+            embed_documents_locally(documents, model=model, batch_size=64)
+        self.assertEqual(model.batches, [64, 16])
+
+    def test_overlap_must_be_below_the_window(self):
+        with self.assertRaises(ValueError):
+            list(iter_chunks(["abcdefghij"], max_tokens=4, overlap=4, model=FakeModel()))
+
+
+class PlagiarismTests(TestCase):
+    ORIGINAL = "The cell membrane controls what enters the cell. Mitochondria release energy from glucose."
+
+    def check(self, *texts, target=None):
+        vectors = embed_documents_locally(list(texts), model=FakeModel())
+        embeddings = {i: vector for i, vector in enumerate(vectors, start=1)}
+        names = {i: f"student{i}" for i in embeddings}
+        return check_plagiarism(embeddings, names, target_id=target)
+
+    def test_identical_submissions(self):
+        self.assertEqual(self.check(self.ORIGINAL, self.ORIGINAL), [('student1', 'student2', 100.0)])
+
+    def test_whitespace_only_differences(self):
+        spaced = "The  cell membrane\ncontrols what enters the cell.\n\n  Mitochondria release\tenergy from glucose."
+        self.assertEqual(self.check(self.ORIGINAL, spaced), [('student1', 'student2', 100.0)])
+
+    def test_reordered_sentences(self):
+        reordered = "Mitochondria release energy from glucose. The cell membrane controls what enters the cell."
+        self.assertEqual(self.check(self.ORIGINAL, reordered), [('student1', 'student2', 100.0)])
+
+    def test_unrelated_submissions(self):
+        unrelated = "Rivers carry sediment downstream and deposit it where the current slows near the sea."
+        self.assertEqual(self.check(self.ORIGINAL, unrelated), [])
+
+    def test_target_pairs_match_the_full_matrix(self):
+        texts = [self.ORIGINAL, "Rivers carry sediment downstream.", self.ORIGINAL.upper(), self.ORIGINAL]
+        full = self.check(*texts)
+        self.assertEqual(
+            full, [('student1', 'student3', 100.0), ('student1', 'student4', 100.0), ('student3', 'student4', 100.0)],
+        )
+        self.assertEqual(self.check(*texts, target=4), [pair for pair in full if 'student4' in pair])
+
+    def test_vector_length_does_not_matter(self):
+        vector = np.array([1.0, 2.0, 3.0])
+        results = check_plagiarism({1: vector, 2: vector * 10, 3: np.zeros(3)}, {1: 'a', 2: 'b', 3: 'c'})
+        self.assertEqual(results, [('a', 'b', 100.0)])
+
+
+ESSAY = " ".join(f"word{(i * 37) % 101} topic{(i * 11) % 13}" for i in range(200))
+OTHER_ESSAY = " ".join(f"term{(i * 29) % 97} idea{(i * 7) % 17}" for i in range(200))
+
+
+class FingerprintTests(TestCase):
+    def setUp(self):
+        teacher = User.objects.create(username='teacher', email='teacher@example.com')
+        classroom = ClassRoom.objects.create(name='Biology', code='BIO1', created_by=teacher)
+        self.assignment = Assignment.objects.create(classroom=classroom, title='Essay', description='Write')
+
+    def submit(self, name, text, assignment=None):
+        student = User.objects.create(username=name, email=f'{name}@example.com', name=name.title())
+        submission = Submission.objects.create(assignment=assignment or self.assignment, student=student)
+        return submission, fingerprint_submission(submission, text, name)
+
+    def test_signature_estimates_jaccard(self):
+        self.assertIsNone(fingerprint.signature("  ...  "))
+        self.assertEqual(fingerprint.similarity(fingerprint.signature(ESSAY), fingerprint.signature(ESSAY.upper())), 1.0)
+        edited = ESSAY.replace("word5 ", "changed ", 1)
+        self.assertGreater(fingerprint.similarity(fingerprint.signature(ESSAY), fingerprint.signature(edited)), 0.9)
+        self.assertLess(fingerprint.similarity(fingerprint.signature(ESSAY), fingerprint.signature(OTHER_ESSAY)), 0.1)
+
+    def test_copies_are_found_through_shared_buckets(self):
+        original, sig = self.submit('alice', ESSAY)
+        copy, _ = self.submit('bob', ESSAY + " Thanks.")
+        self.submit('carol', OTHER_ESSAY)
+        elsewhere = Assignment.objects.create(classroom=self.assignment.classroom, title='Other', description='Write')
+        self.submit('dave', ESSAY, assignment=elsewhere)
+
+        self.assertEqual(set(fingerprint.find_candidates(original, sig)), {copy.id})
+        copies = fingerprint.find_copies(original, sig)
+        self.assertEqual([name for name, _ in copies], ['Bob'])
+        self.assertGreaterEqual(copies[0][1], 90)
+        self.assertIn("Bob", fingerprint.copy_feedback(copies))
+        self.assertEqual(fingerprint.copy_feedback([]), "")
+
+    def test_unchanged_content_reuses_the_stored_signature(self):
+        submission, sig = self.submit('alice', ESSAY)
+        with mock.patch('main.fingerprint.signature', side_effect=AssertionError("recomputed")):
+            self.assertTrue(np.array_equal(fingerprint_submission(submission, ESSAY, 'alice'), sig))
+        fingerprint_submission(submission, OTHER_ESSAY, 'changed')
+        self.assertEqual(FingerprintBucket.objects.filter(submission=submission).count(), fingerprint.BANDS)
+        self.assertFalse(fingerprint.find_candidates(submission, fingerprint.signature(ESSAY)))
+
+
+class KeywordTests(TestCase):
+    def test_stem_folds_plurals_only(self):
+        pairs = [
+            ('decisions', 'decision'), ('studies', 'study'), ('processes', 'process'),
+            ('classes', 'class'), ('analyses', 'analysis'), ('boxes', 'box'), ('matches', 'match'),
+        ]
+        for plural, singular in pairs:
+            with self.subTest(plural=plural):
+                self.assertEqual(stem(plural), stem(singular))
+        for word in ('process', 'class', 'analysis', 'status', 'was'):
+            with self.subTest(word=word):
+                self.assertEqual(stem(word), word)
+
+    def test_matches_respect_word_boundaries_and_phrases(self):
+        matcher = KeywordMatcher(['AI', 'neural network', 'network'])
+        self.assertEqual(matcher.matches("She said the network was slow"), ['network'])
+        self.assertEqual(matcher.matches("A deep neural network. AI!"), ['AI', 'neural network', 'network'])
+        self.assertEqual(matcher.matches("neural nets and a network"), ['network'])
+
+    def test_overlapping_keywords_follow_failure_links(self):
+        matcher = KeywordMatcher(['data structure', 'structure of programs', 'of'])
+        self.assertEqual(
+            matcher.matches("data structure of programs"),
+            ['data structure', 'structure of programs', 'of'],
+        )
+        self.assertEqual(matcher.score("nothing here"), (0.0, []))
+        self.assertEqual(KeywordMatcher([]).score("anything"), (0.0, []))
+
+    def test_stemming_is_opt_in(self):
+        text = "Both analyses compared the processes"
+        self.assertEqual(KeywordMatcher(['analysis', 'process']).matches(text), [])
+        self.assertEqual(KeywordMatcher(['analysis', 'process'], stemming=True).matches(text), ['analysis', 'process'])
+
+
+class TextCacheTests(TestCase):
+    def setUp(self):
+        text_cache._set_tracked(None)  # the tracked total outlives rolled-back rows
+
+    def test_hit_miss_and_version(self):
+        self.assertIsNone(text_cache.get('a' * 64, 1))
+        text_cache.put('a' * 64, 1, "Extracted text", "more than 300 pages")
+        self.assertEqual(text_cache.get('a' * 64, 1), ("Extracted text", "more than 300 pages"))
+        self.assertIsNone(text_cache.get('a' * 64, 2))  # a new extractor version re-extracts
+
+    def test_duplicate_put_keeps_the_transaction_usable(self):
+        with transaction.atomic():
+            text_cache.put('a' * 64, 1, "first")
+            text_cache.put('a' * 64, 1, "second")
+            self.assertEqual(ExtractedText.objects.count(), 1)
+        self.assertEqual(text_cache.get('a' * 64, 1)[0], "first")
+
+    def test_least_recently_used_rows_are_evicted(self):
+        text = "".join(chr(0x4e00 + (i * 7919) % 20000) for i in range(2000))  # barely compressible
+        with override_settings(TEXT_CACHE_MAX_BYTES=10_000):
+            for n in range(3):
+                text_cache.put(f'{n}' * 64, 1, text)
+                ExtractedText.objects.filter(content_hash=f'{n}' * 64).update(
+                    last_used_at=timezone.now() - timedelta(hours=3 - n),
+                )
+            with self.assertNumQueries(3):  # savepoint, insert, release: no size sum under the cap
+                text_cache.put('x' * 64, 1, "small")
+            text_cache.put('3' * 64, 1, text)
+        remaining = set(ExtractedText.objects.values_list('content_hash', flat=True))
+        self.assertNotIn('0' * 64, remaining)
+        self.assertIn('3' * 64, remaining)
+        self.assertLessEqual(sum(ExtractedText.objects.values_list('size', flat=True)), 10_000)
+
+
+class ExtractionTests(TestCase):
+    def setUp(self):
+        text_cache._set_tracked(None)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = Path(self.directory.name) / name
+        path.write_bytes(content)
+        return str(path)
+
+    def test_timed_out_extraction_is_not_cached(self):
+        path = self.write('essay.txt', b"First line\nSecond line\n")
+        with override_settings(GRADING_EXTRACT_TIMEOUT_SECONDS=-1):
+            self.assertEqual(extract_document(path), ("", "extraction timed out"))
+        self.assertFalse(ExtractedText.objects.exists())
+        self.assertEqual(extract_document(path), ("First line\nSecond line", ""))
+
+    def test_deterministic_truncation_is_cached(self):
+        path = self.write('essay.txt', b"First line\nSecond line\n")
+        with override_settings(GRADING_EXTRACT_MAX_CHARS=5):
+            self.assertEqual(extract_document(path), ("First", "longer than 5 characters"))
+        self.assertEqual(ExtractedText.objects.count(), 1)
+
+    def test_oversized_pdf_and_docx_are_not_parsed(self):
+        for name in ('essay.pdf', 'essay.docx'):
+            path = self.write(name, b"x" * 100)  # not a valid document: parsing would fail
+            with override_settings(GRADING_EXTRACT_MAX_BYTES=10):
+                self.assertEqual(extract_document(path), ("", "larger than 10 bytes"))
+
+
+def insert_vectors(directory, first, count):
+    index = SimilarityIndex(directory)
+    for submission_id in range(first, first + count):
+        index.insert(submission_id, np.random.default_rng(submission_id).random(8), 1, 1)
+
+
+class SimilarityIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_inserts_from_several_processes_are_kept(self):
+        # Snapshots are rewritten as the index doubles; no process may drop
+        # the delta records another one appended meanwhile
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=insert_vectors, args=(self.directory, i * 40, 40)) for i in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        index = SimilarityIndex(self.directory)
+        index.refresh()
+        self.assertEqual(sorted(index.meta[:, 0]), list(range(160)))
+
+    def test_similar_submissions_stay_in_the_teachers_classrooms(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        teacher = User.objects.create(username='teacher', email='teacher@example.com')
+        other_teacher = User.objects.create(username='other', email='other@example.com')
+        index = SimilarityIndex(self.directory)
+        submissions = []
+        for n, owner in enumerate([teacher, other_teacher, teacher]):
+            classroom = ClassRoom.objects.create(name=f'Class {n}', code=f'C{n}', created_by=owner)
+            assignment = Assignment.objects.create(classroom=classroom, title='Essay', description='Write')
+            student = User.objects.create(username=f's{n}', email=f's{n}@example.com', name=f'Student {n}')
+            path = Path(media.name) / f'submissions/{n}.txt'
+            path.parent.mkdir(exist_ok=True)
+            path.write_text("Same answer")
+            submission = Submission.objects.create(assignment=assignment, student=student, submitted_file=f'submissions/{n}.txt')
+            vector = np.ones(8, dtype=np.float32)
+            SubmissionEmbedding.objects.create(
+                submission=submission, content_hash=file_sha256(path), vector=vector_to_bytes(vector), dimensions=8,
+            )
+            index.insert(submission.id, vector, assignment.id, classroom.id)
+            submissions.append(submission)
+
+        client = APIClient()
+        client.force_authenticate(teacher)
+        with override_settings(MEDIA_ROOT=media.name), mock.patch('main.views.get_similarity_index', return_value=index):
+            response = client.get(f'/api/classsubmissions/{submissions[2].id}/similar/?scope=all')
+        self.assertEqual([r['submission_id'] for r in response.json()['results']], [submissions[0].id])
+
+    def test_only_prior_submissions_are_reported(self):
+        index = SimilarityIndex(self.directory)
+        for submission_id in (1, 2, 3):
+            index.insert(submission_id, np.ones(8), 1, 1)
+        self.assertEqual([sid for sid, _ in index.search(np.ones(8), before_id=2)], [1])
+        self.assertEqual(index.search(np.ones(8), before_id=1), [])
+
+    def test_deleted_submissions_leave_the_index(self):
+        teacher = User.objects.create(username='teacher', email='teacher@example.com')
+        classroom = ClassRoom.objects.create(name='Biology', code='BIO1', created_by=teacher)
+        assignment = Assignment.objects.create(classroom=classroom, title='Essay', description='Write')
+        index = SimilarityIndex(self.directory)
+        submissions = [
+            Submission.objects.create(
+                assignment=assignment, student=User.objects.create(username=f's{n}', email=f's{n}@example.com'),
+            )
+            for n in range(2)
+        ]
+        for submission in submissions:
+            index.insert(submission.id, np.ones(8), assignment.id, classroom.id)
+
+        with mock.patch('main.signals.get_similarity_index', return_value=index):
+            with self.captureOnCommitCallbacks(execute=True):
+                submissions[0].delete()
+        reloaded = SimilarityIndex(self.directory)
+        reloaded.refresh()
+        self.assertEqual(list(reloaded.meta[:, 0]), [submissions[1].id])
+        SimilarityIndex(Path(self.directory) / 'missing').remove([1])  # no index yet: nothing written
+        self.assertFalse((Path(self.directory) / 'missing').exists())
+
+
+class GradingQueueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.teacher = User.objects.create(username='teacher', email='teacher@example.com')
+        self.classroom = ClassRoom.objects.create(name='Biology', code='BIO1', created_by=self.teacher)
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+
+    def test_upload_only_queues_the_copy_check(self):
+        assignment = Assignment.objects.create(classroom=self.classroom, title='Essay', description='Write')
+        student = User.objects.create(username='student', email='student@example.com')
+        self.classroom.students.add(student)
+        self.client.force_authenticate(student)
+        response = self.client.post('/api/classsubmissions/', {
+            'assignment_id': assignment.id,
+            'submitted_file': SimpleUploadedFile('answer.txt', ESSAY.encode()),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(GradingJob.objects.get(submission_id=response.json()['id']).state, GradingJob.PENDING)
+        self.assertFalse(SubmissionFingerprint.objects.exists())  # fingerprinted by the worker, not the upload
+
+    def test_copies_are_flagged_before_any_model_work(self):
+        assignment = Assignment.objects.create(classroom=self.classroom, title='Essay', description='Write')
+        submissions = []
+        for name in ('alice', 'bob'):
+            path = Path(settings.MEDIA_ROOT) / f'submissions/{name}.txt'
+            path.parent.mkdir(exist_ok=True)
+            path.write_text(ESSAY)
+            student = User.objects.create(username=name, email=f'{name}@example.com', name=name.title())
+            submissions.append(Submission.objects.create(
+                assignment=assignment, student=student, submitted_file=f'submissions/{name}.txt',
+            ))
+        fingerprint_submission(submissions[0], ESSAY, file_sha256(Path(settings.MEDIA_ROOT) / 'submissions/alice.txt'))
+
+        def reference_embedding(assignment):
+            self.assertIn("Copied text: Alice", Submission.objects.get(id=submissions[1].id).feedback)
+            raise GradingError("stop before the model")
+
+        with mock.patch('main.grading.get_reference_embedding', side_effect=reference_embedding):
+            with self.assertRaises(GradingError):
+                grade_submission(submissions[1])
+
+    def test_reference_answer_is_encoded_by_the_worker(self):
+        with mock.patch('main.grading.embed_document', side_effect=AssertionError("encoded in the request")):
+            response = self.client.post('/api/classassignments/', {
+                'title': 'Essay', 'description': 'Write', 'classroom_id': self.classroom.id,
+                'file': SimpleUploadedFile('answer.txt', b'Photosynthesis turns light into chemical energy.'),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        assignment = Assignment.objects.get(id=response.json()['id'])
+        self.assertFalse(assignment.reference_embedding)
+
+        job = claim_next_job()
+        self.assertEqual(job.assignment_id, assignment.id)
+        with mock.patch('main.grading.embed_document', return_value=np.ones(4, dtype=np.float32)):
+            run_job(job)
+        self.assertEqual(job.state, GradingJob.DONE)
+        assignment.refresh_from_db()
+        self.assertEqual(len(assignment.reference_hash), 64)
+        self.assertIsNone(claim_next_job())
+
+    def add_reference(self, text):
+        path = Path(settings.MEDIA_ROOT) / 'assignments/answer.txt'
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(text)
+        assignment = Assignment.objects.create(
+            classroom=self.classroom, title='Essay', description='Write', file='assignments/answer.txt',
+        )
+        return assignment, path
+
+    def test_reference_replaced_while_encoding_is_retried(self):
+        assignment, path = self.add_reference("Old answer")
+
+        def embed(text, pooling=None):
+            path.write_text("New answer")  # the teacher uploads again meanwhile
+            return np.ones(4, dtype=np.float32)
+
+        enqueue_reference(assignment)
+        job = claim_next_job()
+        with mock.patch('main.grading.embed_document', side_effect=embed):
+            run_job(job)
+        self.assertEqual(job.state, GradingJob.PENDING)
+        self.assertIn("changed while it was encoded", job.last_error)
+        assignment.refresh_from_db()
+        self.assertFalse(assignment.reference_embedding)
+
+    def test_worker_rehashes_the_reference_file(self):
+        assignment, path = self.add_reference("Old answer")
+        enqueue_reference(assignment)
+        with mock.patch('main.grading.embed_document', return_value=np.ones(4, dtype=np.float32)):
+            run_job(claim_next_job())
+        path.write_text("New answer")  # replaced on disk without a new upload
+        enqueue_reference(assignment)
+        with mock.patch('main.grading.embed_document', return_value=np.full(4, 2, dtype=np.float32)) as embed:
+            run_job(claim_next_job())
+        embed.assert_called_once_with("New answer")
+        assignment.refresh_from_db()
+        self.assertEqual(assignment.reference_hash, file_sha256(path))
+        self.assertEqual(bytes_to_vector(assignment.reference_embedding).tolist(), [2, 2, 2, 2])
+
+    def add_submission(self):
+        assignment = Assignment.objects.create(classroom=self.classroom, title='Essay', description='Write')
+        student = User.objects.create(username='student', email='student@example.com')
+        return Submission.objects.create(assignment=assignment, student=student, submitted_file='submissions/a.txt')
+
+    def test_unknown_submission_is_not_found(self):
+        for pk in ('999', 'abc'):
+            for action in ('grading-status', 'similar'):
+                response = self.client.get(f'/api/classsubmissions/{pk}/{action}/')
+                self.assertEqual(response.status_code, 404, (pk, action))
+
+    def test_job_targets_exactly_one_object(self):
+        submission = self.add_submission()
+        for target in ({}, {'submission': submission, 'assignment': submission.assignment}):
+            with self.subTest(target=sorted(target)), self.assertRaises(IntegrityError), transaction.atomic():
+                GradingJob.objects.create(**target)
+
+    def test_enqueue_resets_the_job(self):
+        submission = self.add_submission()
+        job = enqueue_grading(submission)
+        GradingJob.objects.filter(id=job.id).update(state=GradingJob.FAILED, attempts=3, last_error='boom')
+        job = enqueue_grading(submission)
+        self.assertEqual((job.state, job.attempts, job.last_error), (GradingJob.PENDING, 0, ''))
+        self.assertEqual(GradingJob.objects.count(), 1)
+
+    @override_settings(GRADING_MAX_ATTEMPTS=2, GRADING_RETRY_BASE_SECONDS=30)
+    def test_transient_errors_back_off_then_fail(self):
+        enqueue_grading(self.add_submission())
+        with mock.patch('main.grading_queue.grade_submission', side_effect=RuntimeError("model busy")):
+            job = run_job(claim_next_job())
+            self.assertEqual((job.state, job.attempts, job.last_error), (GradingJob.PENDING, 1, "model busy"))
+            self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=25))
+            self.assertIsNone(claim_next_job())  # not due yet
+
+            GradingJob.objects.update(run_after=timezone.now())
+            job = run_job(claim_next_job())
+        self.assertEqual((job.state, job.attempts), (GradingJob.FAILED, 2))
+
+    def test_grading_errors_are_not_retried(self):
+        enqueue_grading(self.add_submission())
+        with mock.patch('main.grading_queue.grade_submission', side_effect=GradingError("no text")):
+            job = run_job(claim_next_job())
+        self.assertEqual((job.state, job.attempts, job.last_error), (GradingJob.FAILED, 1, "no text"))
+
+    @override_settings(GRADING_JOB_TIMEOUT_SECONDS=600)
+    def test_stale_jobs_are_reclaimed(self):
+        enqueue_grading(self.add_submission())
+        job = claim_next_job()
+        self.assertIsNone(claim_next_job())
+        self.assertEqual(release_stale_jobs(), 0)  # still within its lease
+
+        GradingJob.objects.update(locked_at=timezone.now() - timedelta(seconds=601))
+        self.assertEqual(release_stale_jobs(), 1)
+        reclaimed = claim_next_job()
+        self.assertEqual((reclaimed.id, reclaimed.attempts), (job.id, 2))
+
+    def test_assignment_without_file_queues_nothing(self):
+        response = self.client.post(f'/api/classclassrooms/{self.classroom.id}/assignments/', {
+            'title': 'Essay', 'description': 'Write', 'classroom_id': self.classroom.id,
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(GradingJob.objects.exists())
+
+
+class StubCourseFeed(BaseHTTPRequestHandler):
+    """The faculty course API: serves ``courses`` with an ETag, answers 304
+    to a matching If-None-Match and fails the first ``failures`` requests."""
+    courses = []
+    failures = 0
+    requests = []
+
+    def do_GET(self):
+        type(self).requests.append(dict(self.headers))
+        if type(self).failures:
+            type(self).failures -= 1
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = json.dumps(type(self).courses).encode()
+        etag = f'"{hash(body)}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def course(offer_id, title='Algorithms'):
+    return {
+        'offer_id': offer_id, 'course_code': f'CS-{offer_id}', 'course_title': title,
+        'program_name': 'BSCS', 'shift_name': 'Morning', 'enc_offer_id': f'enc{offer_id}',
+    }
+
+
+class CourseSyncTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubCourseFeed)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_port}/api/get_faculty_courses'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        StubCourseFeed.courses = [course(i) for i in range(1, 101)]
+        StubCourseFeed.failures = 0
+        StubCourseFeed.requests = []
+
+    def test_sync_diffs_in_bulk(self):
+        FacultyCourse.objects.create(**{**course(1), 'offer_id': '1'})
+        FacultyCourse.objects.create(**{**course(2, title='Old'), 'offer_id': '2'})
+        StubCourseFeed.courses.append({'offer_id': 999})  # malformed
+        # feed state, existing courses, then insert, update and feed state (in a savepoint)
+        with self.assertNumQueries(7):
+            report = sync_courses(self.url)
+        self.assertEqual(
+            (report['created'], report['updated'], report['unchanged'], report['skipped']), (98, 1, 1, 1),
+        )
+        self.assertEqual(FacultyCourse.objects.count(), 100)
+        self.assertEqual(FacultyCourse.objects.get(offer_id='2').course_title, 'Algorithms')
+
+    def test_unchanged_feed_is_not_downloaded_again(self):
+        sync_courses(self.url)
+        with self.assertNumQueries(1):  # feed state
+            report = sync_courses(self.url)
+        self.assertTrue(report['not_modified'])
+        self.assertIn('If-None-Match', StubCourseFeed.requests[-1])
+
+        StubCourseFeed.courses[0] = course(1, title='Data Structures')
+        report = sync_courses(self.url)
+        self.assertEqual((report['created'], report['updated'], report['unchanged']), (0, 1, 99))
+
+    def test_reset_database_is_synced_again(self):
+        sync_courses(self.url)
+        FacultyCourse.objects.all().delete()
+        CourseFeedState.objects.all().delete()  # flushed along with the courses
+        report = sync_courses(self.url)
+        self.assertFalse(report['not_modified'])
+        self.assertNotIn('If-None-Match', StubCourseFeed.requests[-1])
+        self.assertEqual(FacultyCourse.objects.count(), 100)
+
+    def test_retries_and_command(self):
+        StubCourseFeed.failures = 2
+        call_command('fetch_courses', url=self.url, stdout=io.StringIO())
+        self.assertEqual(len(StubCourseFeed.requests), 3)
+        self.assertEqual(FacultyCourse.objects.count(), 100)
+        with mock.patch('main.management.commands.fetch_courses.sync_courses', side_effect=OSError("disk full")):
+            with self.assertRaisesMessage(CommandError, "disk full"):
+                call_command('fetch_courses', url=self.url)
+
+    def test_stream_parser_handles_split_chunks(self):
+        body = json.dumps([course(1), 12, 'x', [1, 2]]).encode()
+        chunks = [body[i:i + 3] for i in range(0, len(body), 3)]
+        self.assertEqual(list(iter_json_array(chunks)), [course(1), 12, 'x', [1, 2]])
+        with self.assertRaises(ValueError):
+            list(iter_json_array([body[:-1]]))
+        with self.assertRaises(ValueError):
+            list(iter_json_array([b'{"courses": []}']))
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings_override = override_settings(METRICS_DIR=self.directory, METRICS_TOKEN='s3cret')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def scrape(self, **headers):
+        return self.client.get('/api/metrics', **headers)
+
+    def test_scrape_requires_the_token(self):
+        self.assertEqual(self.scrape().status_code, 403)
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+        response = self.scrape(HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('encoder_batches_total', response.content.decode())
+        self.assertIn('text_cache_hits_total', response.content.decode())
+
+    def test_worker_snapshots_are_added_to_the_scrape(self):
+        local = metrics.snapshot()['counters']['text_cache_hits_total']
+        worker = {
+            'summaries': [['grading_stage_seconds', [['stage', 'worker_only']], 2, 0.5]],
+            'counters': {'text_cache_hits_total': 5},
+        }
+        (self.directory / 'grade_worker-1.json').write_text(json.dumps(worker))
+        stale = self.directory / 'grade_worker-2.json'
+        stale.write_text(json.dumps(worker))
+        os.utime(stale, (0, 0))
+
+        body = self.scrape(HTTP_AUTHORIZATION='Bearer s3cret').content.decode()
+        self.assertIn('grading_stage_seconds_count{stage="worker_only"} 2\n', body)
+        self.assertIn('grading_stage_seconds_sum{stage="worker_only"} 0.500000\n', body)
+        self.assertIn(f'text_cache_hits_total {local + 5}\n', body)
+
+    def test_publish_writes_this_process_snapshot(self):
+        metrics.publish('grade_worker-test')
+        published = metrics.published_snapshots()
+        self.assertEqual(len(published), 1)
+        self.assertEqual(set(published[0]['counters']), set(metrics.snapshot()['counters']))
+        self.assertEqual(list(self.directory.iterdir()), [self.directory / 'grade_worker-test.json'])
+
+
+class GradeWorkerTests(TransactionTestCase):
+    # The worker threads use their own connections and must see committed rows
+
+    def test_once_drains_the_queue_and_exits(self):
+        teacher = User.objects.create(username='teacher', email='teacher@example.com')
+        classroom = ClassRoom.objects.create(name='Biology', code='BIO1', created_by=teacher)
+        assignment = Assignment.objects.create(classroom=classroom, title='Essay', description='Write')
+        for i in range(3):
+            student = User.objects.create(username=f's{i}', email=f's{i}@example.com')
+            enqueue_grading(Submission.objects.create(assignment=assignment, student=student, submitted_file='a.txt'))
+
+        out = io.StringIO()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with (
+            override_settings(METRICS_DIR=directory.name),
+            mock.patch('main.grading_queue.grade_submission', return_value=(5, 'ok')),
+        ):
+            call_command('grade_worker', once=True, threads=2, stdout=out)
+        self.assertEqual(set(GradingJob.objects.values_list('state', flat=True)), {GradingJob.DONE})
+        self.assertIn("3 grading jobs processed", out.getvalue())
+        self.assertTrue((Path(directory.name) / f'grade_worker-{os.getpid()}.json').exists())
+
+
+class CompareBackendsTests(TestCase):
+    def test_each_backend_is_measured_in_its_own_process(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        Path(directory.name, 'submissions').mkdir()
+        Path(directory.name, 'submissions/0.txt').write_text(OTHER_ESSAY)
+        teacher = User.objects.create(username='teacher', email='teacher@example.com')
+        classroom = ClassRoom.objects.create(name='Biology', code='BIO1', created_by=teacher)
+        assignment = Assignment.objects.create(
+            classroom=classroom, title='Essay', description='Write', reference_text=ESSAY,
+        )
+        Submission.objects.create(assignment=assignment, student=teacher, submitted_file='submissions/0.txt')
+
+        out = io.StringIO()
+        with override_settings(MEDIA_ROOT=directory.name), mock.patch('main.management.commands.compare_backends.load_model') as load_model:
+            call_command('compare_backends', assignment=[assignment.id], backend=['torch'], json=True, stdout=out)
+        load_model.assert_not_called()  # the models are only loaded by the child processes
+
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['documents'], 1)
+        [row] = report['results']
+        self.assertEqual((row['backend'], row['marks_mae_vs_fp32']), ('torch', 0))
+        self.assertGreater(row['rss_mb'], 0)
+
+
+class RegradeTests(TransactionTestCase):
+    # regrade closes every connection before forking its extraction pool
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media = Path(directory.name) / 'media'
+        settings_override = override_settings(
+            MEDIA_ROOT=str(self.media),
+            SIMILARITY_INDEX_DIR=Path(directory.name) / 'index',
+            REGRADE_CHECKPOINT_DIR=Path(directory.name) / 'checkpoints',
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        patcher = mock.patch('main.similarity_index._index', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_regrade_updates_jobs_and_the_similarity_index(self):
+        teacher = User.objects.create(username='teacher', email='teacher@example.com')
+        classroom = ClassRoom.objects.create(name='Biology', code='BIO1', created_by=teacher)
+        assignment = Assignment.objects.create(classroom=classroom, title='Essay', description='Write')
+        submissions = []
+        for n, text in enumerate([ESSAY, OTHER_ESSAY]):
+            path = self.media / f'submissions/{n}.txt'
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(text)
+            student = User.objects.create(username=f's{n}', email=f's{n}@example.com', name=f'Student {n}')
+            submissions.append(Submission.objects.create(
+                assignment=assignment, student=student, submitted_file=f'submissions/{n}.txt',
+            ))
+        enqueue_grading(submissions[0])
+        GradingJob.objects.filter(submission=submissions[0]).update(state=GradingJob.FAILED, last_error='boom')
+
+        vectors = [np.array([1, 0, 0, 0], dtype=np.float32), np.array([0, 1, 0, 0], dtype=np.float32)]
+        with (
+            mock.patch('main.management.commands.regrade.get_model'),
+            mock.patch('main.management.commands.regrade.embed_documents_locally', return_value=vectors),
+            mock.patch('main.management.commands.regrade.get_reference_embedding', return_value=vectors[0]),
+        ):
+            call_command('regrade', assignment=assignment.id, processes=1, stdout=io.StringIO())
+
+        job = GradingJob.objects.get(submission=submissions[0])
+        self.assertEqual((job.state, job.last_error), (GradingJob.DONE, ''))
+        self.assertTrue(all(s.marks is not None for s in Submission.objects.all()))
+        index = SimilarityIndex(settings.SIMILARITY_INDEX_DIR)
+        self.assertEqual(index.search(vectors[1], k=1), [(submissions[1].id, 1.0)])
+
+
+class ConcurrentWriteTests(TransactionTestCase):
+    """Many threads saving submissions at once (as grade_worker --threads
+    and upload requests do) must queue on the database, not fail."""
+    THREADS = 16
+    WRITES = 10
+
+    def test_concurrent_submission_writes(self):
+        teacher = User.objects.create(username='teacher', email='teacher@example.com')
+        classroom = ClassRoom.objects.create(name='Biology', code='BIO1', created_by=teacher)
+        assignment = Assignment.objects.create(classroom=classroom, title='Essay', description='Write')
+        ids = []
+        for i in range(self.THREADS):
+            student = User.objects.create(username=f's{i}', email=f's{i}@example.com')
+            ids.append(Submission.objects.create(assignment=assignment, student=student, submitted_file='a.txt').id)
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                self.assertEqual(cursor.fetchone()[0], 'wal')
+
+        errors = []
+        start = threading.Barrier(self.THREADS)
+
+        def write(submission_id):
+            try:
+                start.wait()
+                for n in range(self.WRITES):
+                    submission = Submission.objects.get(id=submission_id)
+                    submission.marks = n
+                    submission.feedback = f"write {n}"
+                    submission.save(update_fields=['marks', 'feedback'])
+                    GradingJob.objects.update_or_create(submission=submission, defaults={'state': GradingJob.DONE})
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=write, args=(i,)) for i in ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(
+            sorted(Submission.objects.values_list('marks', flat=True)), [float(self.WRITES - 1)] * self.THREADS,
+        )
@@ -0,0 +1,100 @@
+import threading
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import ExtractedText
+
+
+# Extracted text keyed by file content hash and extractor version, stored
+# compressed in ExtractedText. The table is kept under TEXT_CACHE_MAX_BYTES by
+# evicting the least recently used rows. last_used_at is only rewritten when
+# it is older than TEXT_CACHE_TOUCH_SECONDS so hits stay read-only. The
+# table size is summed once and then tracked per process; the exact sum is
+# redone when the tracked total passes the cap or every
+# TEXT_CACHE_EVICT_CHECK_PUTS stores (to see other processes' rows).
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+_tracked = {'total': None, 'puts': 0}
+
+
+def _count(name, n=1):
+    with _stats_lock:
+        _stats[name] += n
+
+
+def stats():
+    with _stats_lock:
+        result = dict(_stats)
+    lookups = result['hits'] + result['misses']
+    result['hit_ratio'] = result['hits'] / lookups if lookups else 0.0
+    return result
+
+
+def get(content_hash, version):
+    row = ExtractedText.objects.filter(content_hash=content_hash, extractor_version=version).only(
+        'id', 'data', 'truncated', 'last_used_at',
+    ).first()
+    if row is None:
+        _count('misses')
+        return None
+    _count('hits')
+    now = timezone.now()
+    if now - row.last_used_at > timedelta(seconds=settings.TEXT_CACHE_TOUCH_SECONDS):
+        ExtractedText.objects.filter(id=row.id).update(last_used_at=now)
+    return zlib.decompress(bytes(row.data)).decode('utf-8'), row.truncated
+
+
+def put(content_hash, version, text, truncated=''):
+    data = zlib.compress(text.encode('utf-8'), 6)
+    try:
+        # Savepoint: a duplicate must not break the caller's transaction
+        with transaction.atomic():
+            ExtractedText.objects.create(
+                content_hash=content_hash, extractor_version=version, data=data, size=len(data),
+                truncated=truncated,
+            )
+    except IntegrityError:
+        return  # another worker stored it first
+    _count('stores')
+    with _stats_lock:
+        _tracked['puts'] += 1
+        if _tracked['total'] is not None:
+            _tracked['total'] += len(data)
+        due = (
+            _tracked['total'] is None
+            or _tracked['total'] > settings.TEXT_CACHE_MAX_BYTES
+            or _tracked['puts'] >= settings.TEXT_CACHE_EVICT_CHECK_PUTS
+        )
+    if due:
+        evict()
+
+
+def evict(max_bytes=None):
+    """Delete least recently used rows until the cache fits ``max_bytes``."""
+    max_bytes = settings.TEXT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    total = ExtractedText.objects.aggregate(total=Sum('size'))['total'] or 0
+    if total <= max_bytes:
+        _set_tracked(total)
+        return 0
+    doomed = []
+    for row_id, size in ExtractedText.objects.order_by('last_used_at').values_list('id', 'size').iterator():
+        if total <= max_bytes:
+            break
+        doomed.append(row_id)
+        total -= size
+    ExtractedText.objects.filter(id__in=doomed).delete()
+    _count('evictions', len(doomed))
+    _set_tracked(total)
+    return len(doomed)
+
+
+def _set_tracked(total):
+    with _stats_lock:
+        _tracked['total'] = total
+        _tracked['puts'] = 0
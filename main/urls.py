@@ -1,6 +1,7 @@
 # classroom/urls.py
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from .metrics import metrics_view
 from .views import ClassRoomViewSet, AssignmentViewSet, SubmissionViewSet,Update
 
 router = DefaultRouter()
@@ -11,4 +12,5 @@ router.register(r'11update', Update,basename=('update'))
 
 urlpatterns = [
     path('class', include(router.urls)),
+    path('metrics', metrics_view),
 ]
\ No newline at end of file
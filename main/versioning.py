@@ -0,0 +1,64 @@
+import hashlib
+
+from django.db.models import F, Q
+from django.utils.cache import get_conditional_response
+
+from .models import ContentVersion
+
+
+# Change counters for the endpoints the app polls. A classroom's counter moves
+# when the classroom, its roster, its assignments or a member's profile
+# change; an assignment's when the assignment or any of its submissions
+# (marks, feedback, grading state) change. Signals bump them on model writes;
+# code writing with queryset.update()/bulk_update() calls bump() itself.
+# Counters live in their own table so a model saved from a stale instance can
+# never move one backwards.
+
+CLASSROOM = 'classroom'
+ASSIGNMENT = 'assignment'
+
+
+def bump(scope, ids):
+    ids = {i for i in ids if i is not None}
+    if not ids:
+        return
+    ContentVersion.objects.bulk_create(
+        [ContentVersion(scope=scope, object_id=i) for i in ids], ignore_conflicts=True,
+    )
+    ContentVersion.objects.filter(scope=scope, object_id__in=ids).update(version=F('version') + 1)
+
+
+def versions(*keys):
+    """Versions of the ``(scope, id)`` keys in one query, in order; keys that
+    were never bumped are 0."""
+    if not keys:
+        return ()
+    match = Q()
+    for scope in {scope for scope, _ in keys}:
+        match |= Q(scope=scope, object_id__in=[i for s, i in keys if s == scope])
+    found = {
+        (scope, object_id): version
+        for scope, object_id, version in ContentVersion.objects.filter(match).values_list('scope', 'object_id', 'version')
+    }
+    return tuple(found.get(key, 0) for key in keys)
+
+
+def make_etag(request, *parts):
+    """ETag for what ``request.user`` sees at this URL given ``parts``."""
+    key = repr((request.user.id, request.get_full_path()) + parts)
+    return '"%s"' % hashlib.sha1(key.encode()).hexdigest()[:32]
+
+
+def not_modified(request, etag):
+    """A 304 response when the client already holds ``etag``, else None."""
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response['ETag'] = etag
+    return response
+
+
+def tag(response, etag):
+    response['ETag'] = etag
+    # Cache, but revalidate on every poll
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -1,90 +1,62 @@
 from rest_framework import viewsets, permissions
-from .models import ClassRoom, Assignment, Submission
-from .serizalizer import ClassRoomSerializer, AssignmentSerializer, SubmissionSerializer
+from rest_framework.exceptions import PermissionDenied
+from django.contrib.auth import get_user_model
+from .models import ClassRoom, Assignment, Submission, generate_join_code
+from django.db.models import Count
+from .serizalizer import (
+    ClassRoomSerializer, ClassRoomSummarySerializer, AssignmentSerializer, SubmissionSerializer, UserSerializer,
+)
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import status
-import os
-import fitz
-import docx
-from sentence_transformers import SentenceTransformer, util
-import chardet
-from django.conf import settings
-
-
-model = SentenceTransformer('D:\\Project\\stsb-roberta-large1')
-
-def extract_text(file_path):
-    try:
-        if file_path.endswith(".pdf"):
-            doc = fitz.open(file_path)
-            return "\n".join(page.get_text("text") for page in doc)
-        elif file_path.endswith(".docx"):
-            doc = docx.Document(file_path)
-            return "\n".join(para.text for para in doc.paragraphs)
-        elif file_path.endswith(".txt"):
-            with open(file_path, "rb") as f:
-                raw_data = f.read()
-                encoding = chardet.detect(raw_data)['encoding'] or 'utf-8'
-                return raw_data.decode(encoding, errors='ignore')
-        else:
-            return ""
-    except Exception as e:
-        print(f"Error extracting text from {file_path}: {e}")
-        return ""
-
-def evaluate_submission(student_text, correct_embedding, min_words, required_keywords, max_marks):
-    try:
-        word_count = len(student_text.split())
-        if word_count < min_words:
-            return 0, f"0% semantically similar (Too short: {word_count} words < {min_words})"
-
-        
-        student_embedding = model.encode(student_text, convert_to_tensor=True)
-        similarity = util.cos_sim(correct_embedding, student_embedding).item()
+from .grading import get_submission_embedding
+from .grading_queue import enqueue_grading, enqueue_reference
+from .pagination import AssignmentPagination, ClassRoomPagination, StudentPagination, SubmissionPagination
+from .similarity_index import get_similarity_index
+from . import enrollment, versioning
+from .permissions import (
+    STUDENT, TEACHER, ClassroomPermission, assignment_classroom_id, classroom_roles, role_in,
+)
 
-    
-        kw_score = sum(kw.lower() in student_text.lower() for kw in required_keywords) / len(required_keywords)
+User = get_user_model()
 
-        
-        marks = round((similarity * 0.9 + kw_score * 0.1) * max_marks, 2)
-        if similarity < 0.30:
-            # Reduce marks more aggressively, e.g., scale down to make marks "more low"
-            marks = marks * 0.4  # Scale down by 70% when similarity > 30%
-
-        marks = round(marks, 2)
-        # Generate similarity text
-        sim_text = f"{round(similarity * 100, 2)}% semantically similar"
-        if similarity > 0.80:
-            sim_text += " ⚠️ Possible copy"
-        if word_count < min_words:
-            sim_text += " (Too short)"
-
-        return marks, sim_text
-    except Exception as e:
-        print(f"Error evaluating submission: {e}")
-        return 0, f"Error: {e}"
-    
-    
-
-def check_plagiarism(student_embeddings, submission_id_to_student):
-    plagiarism_results = []
-    student_files = list(student_embeddings.keys())
-    for i, file1 in enumerate(student_files):
-        for file2 in student_files[i + 1:]:
-            sim = util.cos_sim(student_embeddings[file1], student_embeddings[file2]).item()
-            if sim > 0.80:
-                student1_name = submission_id_to_student.get(file1, "Unknown")
-                student2_name = submission_id_to_student.get(file2, "Unknown")
-                plagiarism_results.append((student1_name, student2_name, round(sim * 100, 2)))
-    return plagiarism_results
 
 class ClassRoomViewSet(viewsets.ModelViewSet):
-    queryset = ClassRoom.objects.all()
+    # Teacher and students are serialized for every classroom; fetch them in bulk
+    queryset = ClassRoom.objects.select_related('created_by').prefetch_related('students')
     serializer_class = ClassRoomSerializer
-    permission_classes = [permissions.IsAuthenticated]
+    permission_classes = [permissions.IsAuthenticated, ClassroomPermission]
+    pagination_class = ClassRoomPagination
+
+    def compact(self):
+        # ?compact=1 on list/my-classes: student_count instead of the full roster
+        return self.action in ('list', 'my_classes') and self.request.query_params.get('compact') in ('1', 'true')
+
+    def get_queryset(self):
+        if self.compact():
+            queryset = ClassRoom.objects.select_related('created_by').annotate(student_count=Count('students'))
+        else:
+            queryset = super().get_queryset()
+        # Only classrooms the user teaches or joined
+        return queryset.filter(id__in=list(classroom_roles(self.request)))
+
+    def classroom_role(self, request, pk):
+        """``(role, None)`` for the user in classroom ``pk``, or ``(None,
+        response)`` with a 404/403 when it does not exist or they are not in it."""
+        classroom_id = int(pk) if str(pk).isdigit() else None
+        role = role_in(request, classroom_id)
+        if role is not None:
+            return role, None
+        if classroom_id is None or not ClassRoom.objects.filter(id=classroom_id).exists():
+            return None, Response({"error": "Classroom not found."}, status=status.HTTP_404_NOT_FOUND)
+        return None, Response({"error": "You are not part of this classroom."}, status=status.HTTP_403_FORBIDDEN)
+
+    def get_serializer_class(self):
+        return ClassRoomSummarySerializer if self.compact() else ClassRoomSerializer
+
     def perform_create(self, serializer):
-        serializer.save(created_by=self.request.user)
+        code = serializer.validated_data.get('code') or generate_join_code()
+        serializer.save(created_by=self.request.user, code=code)
     @action(detail=False, methods=['post'], url_path='join')
     def join_classroom(self, request):
         code = request.data.get('code')
@@ -101,48 +73,122 @@ class ClassRoomViewSet(viewsets.ModelViewSet):
         return Response({'message': f'Joined classroom "{classroom.name}" successfully.'})
     @action(detail=False, methods=['get'], url_path='my-classes')
     def my_classes(self, request):
-        user = request.user
-        created_classes = ClassRoom.objects.filter(created_by=user)
-        joined_classes = ClassRoom.objects.filter(students=user).exclude(created_by=user)
+        # The ETag covers which classrooms the user sees and their versions
+        class_ids = sorted(classroom_roles(request))
+        keys = [(versioning.CLASSROOM, i) for i in class_ids]
+        etag = versioning.make_etag(request, class_ids, versioning.versions(*keys))
+        cached = versioning.not_modified(request, etag)
+        if cached is not None:
+            return cached
+
+        roles = classroom_roles(request)
+        created_classes = self.get_queryset().filter(id__in=[cid for cid, role in roles.items() if role == TEACHER])
+        joined_classes = self.get_queryset().filter(id__in=[cid for cid, role in roles.items() if role == STUDENT])
 
         created_serializer = self.get_serializer(created_classes, many=True)
         joined_serializer = self.get_serializer(joined_classes, many=True)
 
-        return Response({
+        return versioning.tag(Response({
             'created_classes': created_serializer.data,
             'joined_classes': joined_serializer.data
-        })
+        }), etag)
     @action(detail=True, methods=['get', 'post'], url_path='assignments')
     def assignments(self, request, pk=None):
-        try:
-            classroom = ClassRoom.objects.get(id=pk)
-        except ClassRoom.DoesNotExist:
-            return Response({"error": "Classroom not found."}, status=status.HTTP_404_NOT_FOUND)
+        role, error = self.classroom_role(request, pk)
+        if error is not None:
+            return error
+        classroom_id = int(pk)
 
         # Only teacher (creator) or students who joined can get assignments
         if request.method == "GET":
-            user = request.user
-            if user != classroom.created_by and not classroom.students.filter(id=user.id).exists():
-                return Response({"error": "You are not part of this classroom."}, status=status.HTTP_403_FORBIDDEN)
-            assignments = Assignment.objects.filter(classroom=classroom)
+            etag = versioning.make_etag(request, versioning.versions((versioning.CLASSROOM, classroom_id)))
+            cached = versioning.not_modified(request, etag)
+            if cached is not None:
+                return cached
+            # The cached reference text/embedding can be large and is not serialized
+            assignments = (
+                Assignment.objects.filter(classroom_id=classroom_id)
+                .select_related('classroom').defer('reference_text', 'reference_embedding')
+            )
+            paginator = AssignmentPagination()
+            page = paginator.paginate_queryset(assignments, request, view=self)
+            if page is not None:
+                return versioning.tag(paginator.get_paginated_response(AssignmentSerializer(page, many=True).data), etag)
             serializer = AssignmentSerializer(assignments, many=True)
-            return Response({"assignments": serializer.data})
+            return versioning.tag(Response({"assignments": serializer.data}), etag)
 
         # Only teacher can create assignments for this classroom
         if request.method == "POST":
-            if request.user != classroom.created_by:
+            if role != TEACHER:
                 return Response({"error": "Only teacher can add assignments."}, status=status.HTTP_403_FORBIDDEN)
             serializer = AssignmentSerializer(data=request.data)
             if serializer.is_valid():
-                serializer.save(classroom=classroom)
+                assignment = serializer.save(classroom=ClassRoom.objects.get(id=classroom_id))
+                enqueue_reference(assignment)
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             else:
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=True, methods=['get'], url_path='students')
+    def students(self, request, pk=None):
+        _, error = self.classroom_role(request, pk)
+        if error is not None:
+            return error
+
+        paginator = StudentPagination()
+        page = paginator.paginate_queryset(User.objects.filter(joined_classes__id=pk), request, view=self)
+        serializer = UserSerializer(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['post'], url_path='enroll')
+    def enroll(self, request, pk=None):
+        # Bulk enrollment: a CSV upload ("file"), CSV text ("roster") or a
+        # list of roll numbers/emails ("students")
+        role, error = self.classroom_role(request, pk)
+        if error is not None:
+            return error
+        if role != TEACHER:
+            return Response({"error": "Only teacher can enroll students."}, status=status.HTTP_403_FORBIDDEN)
+
+        if 'file' in request.FILES:
+            try:
+                roster = enrollment.parse_roster(request.FILES['file'].read().decode('utf-8'))
+            except UnicodeDecodeError:
+                return Response({"error": "Roster file must be UTF-8 CSV."}, status=status.HTTP_400_BAD_REQUEST)
+        elif isinstance(request.data.get('students'), list):
+            roster = [(n, str(s).strip()) for n, s in enumerate(request.data['students'], start=1) if str(s).strip()]
+        elif request.data.get('roster'):
+            roster = enrollment.parse_roster(str(request.data['roster']))
+        else:
+            return Response({"error": "Send a roster CSV file, roster text or a students list."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(enrollment.enroll(ClassRoom.objects.get(id=pk), roster))
+
 class AssignmentViewSet(viewsets.ModelViewSet):
-    queryset = Assignment.objects.all()
+    queryset = Assignment.objects.select_related('classroom')
     serializer_class = AssignmentSerializer
-    permission_classes = [permissions.IsAuthenticated]
+    permission_classes = [permissions.IsAuthenticated, ClassroomPermission]
+    pagination_class = AssignmentPagination
+
+    def get_queryset(self):
+        return super().get_queryset().filter(classroom_id__in=list(classroom_roles(self.request)))
+
+    def check_teacher(self, serializer):
+        classroom = serializer.validated_data.get('classroom')
+        if classroom is not None and role_in(self.request, classroom.id) != TEACHER:
+            raise PermissionDenied("Only teacher can add assignments.")
+
+    def perform_create(self, serializer):
+        self.check_teacher(serializer)
+        # The reference answer is encoded by `manage.py grade_worker`
+        assignment = serializer.save()
+        enqueue_reference(assignment)
+
+    def perform_update(self, serializer):
+        self.check_teacher(serializer)
+        assignment = serializer.save()
+        if not assignment.reference_embedding:  # new teacher file
+            enqueue_reference(assignment)
 
     """ def perform_create(self, serializer):
         classroom_id = self.request.data.get('classroom')
@@ -173,114 +219,132 @@ class SubmissionViewSet(viewsets.ModelViewSet):
     queryset = Submission.objects.all()
     serializer_class = SubmissionSerializer
     permission_classes = [permissions.IsAuthenticated]
-    
-    def perform_create(self, serializer):
-        # Automatically set the student to the authenticated user
-        submission = serializer.save(student=self.request.user)
-        
-        try:
-            # Fetch the assignment
-            assignment = submission.assignment
-            print(assignment)
-            max_marks = assignment.max_marks 
-            min_words = assignment.min_words 
-            required_keywords = assignment.required_keywords or ["AI", "making decisions", "recognizing patterns"]
-
-            # Get the teacher's assignment file path
-            correct_file_path = os.path.join(settings.MEDIA_ROOT, assignment.file.name)
-            if not os.path.exists(correct_file_path):
-                print(f"Error: Teacher file {correct_file_path} not found")
-                return
-
-            # Extract text and compute embedding for the teacher's file
-            correct_text = extract_text(correct_file_path)
-            if not correct_text:
-                print(f"Error: Could not extract text from teacher file {correct_file_path}")
-                return
-            correct_embedding = model.encode(correct_text, convert_to_tensor=True)
-
-            # Get the student's submitted file path
-            if not submission.submitted_file:
-                print(f"Warning: No file for submission {submission.id}")
-                return
-            student_file_path = os.path.join(settings.MEDIA_ROOT, submission.submitted_file.name)
-            if not os.path.exists(student_file_path):
-                print(f"Warning: Submission file {student_file_path} not found")
-                return
-
-            # Extract text from student's submission
-            student_text = extract_text(student_file_path)
-            if not student_text:
-                print(f"Warning: Could not extract text from {student_file_path}")
-                return
-
-            # Evaluate the submission
-            marks, feedback = evaluate_submission(student_text, correct_embedding, min_words, required_keywords, max_marks)
-
-            # Check for plagiarism with other submissions for this assignment
-            student_embeddings = {submission.id: model.encode(student_text, convert_to_tensor=True)}
-            submission_id_to_student = {submission.id: submission.student.name}
-            other_submissions = Submission.objects.filter(assignment=assignment).exclude(id=submission.id)
-            for other in other_submissions:
-                if other.submitted_file:
-                    other_file_path = os.path.join(settings.MEDIA_ROOT, other.submitted_file.name)
-                    if os.path.exists(other_file_path):
-                        other_text = extract_text(other_file_path)
-                        if other_text:
-                            student_embeddings[other.id] = model.encode(other_text, convert_to_tensor=True)
-                            submission_id_to_student[other.id] = other.student.name
-
-            plagiarism_results = check_plagiarism(student_embeddings, submission_id_to_student)
-            if plagiarism_results:
-                print("\n🔍 Plagiarism Check Between Students (Similarity > 80%):\n" + "-" * 50)
-                plagiarism_feedback = []
-                for student1, student2, sim in plagiarism_results:
-                    print(f"{student1} <-> {student2}: {sim}% similar")
-                    if submission.student.name in (student1, student2):
-                        other_student = student2 if student1 == submission.student.name else student1
-                        plagiarism_feedback.append(f"{other_student} same {sim}%")
-                if plagiarism_feedback:
-                    feedback += " | Plagiarism: " + ", ".join(plagiarism_feedback)
-
-            # Update the submission with marks and feedback
-            submission.marks = marks
-            submission.feedback = feedback
-            submission.save()
-            print(f"Updated submission {submission.id} - Marks: {marks}, Feedback: {feedback}")
+    pagination_class = SubmissionPagination
 
-        except Assignment.DoesNotExist:
-            print(f"Error: Assignment with ID {submission.assignment_id} not found")
-        except Exception as e:
-            print(f"Error processing submission {submission.id}: {e}")
+    def perform_create(self, serializer):
+        # Automatically set the student to the authenticated user. Grading,
+        # including the copy check, is queued and picked up by
+        # `manage.py grade_worker`.
+        if role_in(self.request, serializer.validated_data['assignment'].classroom_id) is None:
+            raise PermissionDenied("You are not part of this classroom.")
+        submission = serializer.save(student=self.request.user, marks=None)
+        enqueue_grading(submission)
+
+    def list(self, request, *args, **kwargs):
+        # Polled by the app: answer 304 while neither the assignment's
+        # submissions nor the classroom membership changed
+        assignment_id = request.query_params.get('assignment_id')
+        classroom_id = None
+        if assignment_id and assignment_id.isdigit():
+            classroom_id = assignment_classroom_id(request, int(assignment_id))
+        if classroom_id is None:
+            return super().list(request, *args, **kwargs)
+        etag = versioning.make_etag(request, versioning.versions(
+            (versioning.ASSIGNMENT, int(assignment_id)), (versioning.CLASSROOM, classroom_id),
+        ))
+        cached = versioning.not_modified(request, etag)
+        if cached is not None:
+            return cached
+        return versioning.tag(super().list(request, *args, **kwargs), etag)
 
     def get_queryset(self):
         assignment_id = self.request.query_params.get('assignment_id')
         if not assignment_id:
             return Submission.objects.none()  # Return empty if no assignment_id
 
-        try:
-            assignment = Assignment.objects.get(id=assignment_id)
-            classroom = assignment.classroom
-            user = self.request.user
-
-            # Teachers (creators) see all submissions for the assignment
-            if user == classroom.created_by:
-                return Submission.objects.filter(assignment_id=assignment_id)
-            # Students see only their own submissions
-            elif classroom.students.filter(id=user.id).exists():
-                return Submission.objects.filter(assignment_id=assignment_id, student=user)
-            else:
-                return Submission.objects.none()  # Not part of classroom
-        except Assignment.DoesNotExist:
+        classroom_id = assignment_classroom_id(self.request, int(assignment_id)) if assignment_id.isdigit() else None
+        if classroom_id is None:
             print(f"Error: Assignment with ID {assignment_id} not found")
             return Submission.objects.none()
 
+        role = role_in(self.request, classroom_id)
+        # Everything the serializer touches per row, in the same query
+        submissions = (
+            Submission.objects.select_related('student', 'assignment__classroom', 'grading_job')
+            .defer('assignment__reference_text', 'assignment__reference_embedding')
+        )
+
+        # Teachers (creators) see all submissions for the assignment
+        if role == TEACHER:
+            return submissions.filter(assignment_id=assignment_id)
+        # Students see only their own submissions
+        elif role == STUDENT:
+            return submissions.filter(assignment_id=assignment_id, student=self.request.user)
+        else:
+            return Submission.objects.none()  # Not part of classroom
+
+    @action(detail=True, methods=['get'], url_path='grading-status')
+    def grading_status(self, request, pk=None):
+        try:
+            submission = Submission.objects.select_related('assignment', 'grading_job').get(id=pk)
+        except (ValueError, Submission.DoesNotExist):
+            return Response({"error": "Submission not found."}, status=status.HTTP_404_NOT_FOUND)
+        if request.user.id != submission.student_id and role_in(request, submission.assignment.classroom_id) != TEACHER:
+            return Response({"error": "You cannot view this submission."}, status=status.HTTP_403_FORBIDDEN)
+
+        job = getattr(submission, 'grading_job', None)
+        return Response({
+            "submission_id": submission.id,
+            "state": job.state if job else None,
+            "attempts": job.attempts if job else 0,
+            "next_attempt_at": job.run_after if job and job.state == job.PENDING else None,
+            "error": job.last_error if job else "",
+            "marks": submission.marks,
+            "feedback": submission.feedback,
+        })
+
+    @action(detail=True, methods=['get'], url_path='similar')
+    def similar_submissions(self, request, pk=None):
+        # Most similar earlier submissions across assignments, sections or the whole course
+        try:
+            submission = Submission.objects.select_related('assignment__classroom').get(id=pk)
+        except (ValueError, Submission.DoesNotExist):
+            return Response({"error": "Submission not found."}, status=status.HTTP_404_NOT_FOUND)
+        classroom = submission.assignment.classroom
+        if role_in(request, classroom.id) != TEACHER:
+            return Response({"error": "Only the teacher can search similar submissions."}, status=status.HTTP_403_FORBIDDEN)
+
+        scope = request.query_params.get('scope', 'course' if classroom.course_id else 'classroom')
+        scopes = {
+            'assignment': {'assignment_id': submission.assignment_id},
+            'classroom': {'classroom_id': classroom.id},
+            'course': {'course_id': classroom.course_id} if classroom.course_id else None,
+            'all': {},
+        }
+        if scopes.get(scope) is None:
+            return Response({"error": f"Invalid scope '{scope}'."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            k = min(max(int(request.query_params.get('k', 5)), 1), 50)
+        except ValueError:
+            return Response({"error": "k must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        vector = get_submission_embedding(submission)
+        if vector is None:
+            return Response({"error": "Submission has no extractable text."}, status=status.HTTP_400_BAD_REQUEST)
+        # Whatever the scope, only the requester's own classrooms are searched
+        taught = [cid for cid, role in classroom_roles(request).items() if role == TEACHER]
+        matches = get_similarity_index().search(
+            vector, k=k, before_id=submission.id, classroom_ids=taught, **scopes[scope],
+        )
+
+        others = Submission.objects.select_related('student', 'assignment__classroom').in_bulk([sid for sid, _ in matches])
+        results = [
+            {
+                "submission_id": sid,
+                "student": others[sid].student.name,
+                "assignment": str(others[sid].assignment),
+                "similarity": round(sim * 100, 2),
+            }
+            for sid, sim in matches if sid in others
+        ]
+        return Response({"scope": scope, "results": results})
+
     @action(detail=True, methods=['patch'], url_path='grade')
     def grade_submission(self, request, pk=None):
         try:
             submission = self.get_object()
             assignment = submission.assignment
-            if request.user != assignment.classroom.created_by:
+            if role_in(request, assignment.classroom_id) != TEACHER:
                 return Response({"error": "Only the teacher can grade submissions."}, status=status.HTTP_403_FORBIDDEN)
             
             marks = request.data.get('marks')
@@ -307,7 +371,7 @@ class Update(viewsets.ModelViewSet):
         try:
             submission = self.get_object()
             assignment = submission.assignment
-            if request.user != assignment.classroom.created_by:
+            if role_in(request, assignment.classroom_id) != TEACHER:
                 return Response({"error": "Only the teacher can update submissions."}, status=status.HTTP_403_FORBIDDEN)
 
             # Update fields from request data
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.functions import Lower
 import secrets
 
 class CustomUser(AbstractUser):
@@ -14,6 +15,12 @@ class CustomUser(AbstractUser):
     is_teacher = models.BooleanField(default=False,null=True,blank=True)  # True if the user is a teacher, False if a student
     #otp_created_at = models.DateTimeField(auto_now=True)  # Track when OTP was generated
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Roster imports match emails case-insensitively (main/enrollment.py)
+            models.Index(Lower('email'), name='user_email_lower'),
+        ]
+
     def __str__(self):
         return f"{self.username} ({self.email})"
 